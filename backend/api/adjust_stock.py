@@ -0,0 +1,26 @@
+import argparse
+
+from sqlmodel import Session
+
+import cruds.inventory as inventory_crud
+from dependencies import engine, redis_client
+
+
+if __name__ == '__main__':
+    # Run to restock a product, or to change whether it is stock-limited. Writing `product.stock`
+    # directly is not seen by the counts in Redis, which are authoritative.
+    parser = argparse.ArgumentParser(description='Change the stock of a product.')
+    parser.add_argument('product_id', help='The ID of the product.')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--add', type=int, help='Units to add to the stock (negative to remove).')
+    group.add_argument('--limit', type=int, help='Initial stock of a product that is not stock-limited yet.')
+    group.add_argument('--unlimited', action='store_true', help='Stop limiting the product by stock.')
+    args = parser.parse_args()
+    with Session(engine) as session:
+        if args.add is not None:
+            print(inventory_crud.adjust_stock(
+                session=session, redis_client=redis_client, product_id=args.product_id, units=args.add))
+        else:
+            inventory_crud.set_stock_limit(
+                session=session, redis_client=redis_client, product_id=args.product_id,
+                stock=None if args.unlimited else args.limit)
@@ -0,0 +1,136 @@
+"""
+Compare sync endpoints (run in the threadpool) with async endpoints under concurrent load.
+
+Both variants serve `GET /products/{product_id}` through the real product cruds against the same
+SQLite file. Each request first runs `SELECT sleep_ms(...)`, a SQL function that sleeps inside the
+database driver, to emulate the latency of a query against Cloud SQL. Sync endpoints are limited
+by the 40 worker threads of the AnyIO threadpool, while async endpoints only wait on the event loop.
+
+Usage
+-----
+    cd backend/api
+    python benchmarks/bench_async_sessions.py --query-ms 100 --requests 400
+"""
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Annotated
+
+app_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(app_dir))
+
+import httpx
+from fastapi import Depends, FastAPI
+from rich.console import Console
+from rich.table import Table
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import cruds.product as product_crud
+from models.table_models import Product
+
+
+CONCURRENCY_LEVELS: list[int] = [10, 40, 100, 200]
+
+
+def sleep_ms(ms: float) -> int:
+    time.sleep(ms / 1000)
+    return 0
+
+
+def register_sleep(engine) -> None:
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record) -> None:
+        dbapi_connection.create_function('sleep_ms', 1, sleep_ms)
+
+
+def build_apps(db_path: Path, query_ms: float) -> tuple[FastAPI, FastAPI]:
+    url: str = f'sqlite:///{db_path}'
+    engine = create_engine(url, connect_args={'check_same_thread': False})
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Product(
+            id='prod0', name='prod0', description='desc0', price=100, author='author0', image_url='http://localhost/0'))
+        session.commit()
+    register_sleep(engine)
+    async_engine = create_async_engine(url.replace('sqlite://', 'sqlite+aiosqlite://'), poolclass=NullPool)
+    register_sleep(async_engine.sync_engine)
+
+    def get_session():
+        with Session(engine) as session:
+            yield session
+
+    async def get_async_session():
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            yield session
+
+    sync_app = FastAPI()
+    async_app = FastAPI()
+
+    @sync_app.get('/products/{product_id}')
+    def read_product(session: Annotated[Session, Depends(get_session)], product_id: str) -> dict:
+        session.exec(text('SELECT sleep_ms(:ms)').bindparams(ms=query_ms))
+        return product_crud.read_product(session=session, product_id=product_id).dict()
+
+    @async_app.get('/products/{product_id}')
+    async def read_product_async(session: Annotated[AsyncSession, Depends(get_async_session)], product_id: str) -> dict:
+        await session.exec(text('SELECT sleep_ms(:ms)').bindparams(ms=query_ms))
+        product = await product_crud.read_product_async(session=session, product_id=product_id)
+        return product.dict()
+
+    return sync_app, async_app
+
+
+async def measure(app: FastAPI, num_requests: int, concurrency: int) -> tuple[float, float]:
+    """Return the throughput in requests per second and the p95 latency in milliseconds."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+
+    async with httpx.AsyncClient(app=app, base_url='http://bench') as client:
+        async def one_request() -> None:
+            async with semaphore:
+                start = time.perf_counter()
+                resp = await client.get('/products/prod0')
+                latencies.append(time.perf_counter() - start)
+                resp.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one_request() for _ in range(num_requests)))
+        elapsed: float = time.perf_counter() - start
+
+    latencies.sort()
+    return num_requests / elapsed, latencies[int(len(latencies) * 0.95) - 1] * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--query-ms', type=float, default=100, help='Simulated latency of the database query.')
+    parser.add_argument('--requests', type=int, default=400, help='Requests sent per measurement.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sync_app, async_app = build_apps(db_path=Path(tmp_dir) / 'bench.db', query_ms=args.query_ms)
+
+        table = Table(title=f'GET /products/{{id}} (simulated query {args.query_ms} ms)')
+        for column in ['concurrency', 'sync req/s', 'async req/s', 'sync p95 ms', 'async p95 ms']:
+            table.add_column(column, justify='right')
+
+        for concurrency in CONCURRENCY_LEVELS:
+            sync_rps, sync_p95 = asyncio.run(measure(sync_app, args.requests, concurrency))
+            async_rps, async_p95 = asyncio.run(measure(async_app, args.requests, concurrency))
+            table.add_row(
+                str(concurrency),
+                f'{sync_rps:.0f}', f'{async_rps:.0f}',
+                f'{sync_p95:.1f}', f'{async_p95:.1f}')
+
+    Console().print(table)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Compare the previous multi-command cart update with the single-round-trip Lua script.
+
+The previous `add_to_cart` sent `HINCRBY`, an optional `HDEL` and `EXPIRE` as separate commands;
+the current one runs `ADD_TO_CART_SCRIPT` with `EVALSHA`. Both are measured sequentially (latency
+per operation) and from concurrent asyncio tasks (throughput), against a real Redis server.
+Every fourth operation is a decrement that removes the product, so the `HDEL` path is exercised.
+
+Usage
+-----
+    cd backend/api
+    python benchmarks/bench_cart_mutations.py --host localhost --port 6379 --db 15 --ops 5000
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+
+app_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(app_dir))
+
+import redis
+import redis.asyncio
+from rich.console import Console
+from rich.table import Table
+
+import cruds.cart as cart_crud
+from models.reqres_models import OrderItemCreate
+
+
+CONCURRENCY: int = 50
+
+
+def legacy_add_to_cart(redis_client: redis.Redis, user_id: str, order_item: OrderItemCreate) -> None:
+    cart_key: str = f'cart:{user_id}'
+    new_quantity: int = redis_client.hincrby(cart_key, order_item.product_id, order_item.quantity)
+    if new_quantity <= 0:
+        redis_client.hdel(cart_key, order_item.product_id)
+    redis_client.expire(cart_key, cart_crud.CART_EXPIRE_SECONDS)
+
+
+async def legacy_add_to_cart_async(
+        redis_client: redis.asyncio.Redis,
+        user_id: str,
+        order_item: OrderItemCreate,
+    ) -> None:
+    cart_key: str = f'cart:{user_id}'
+    new_quantity: int = await redis_client.hincrby(cart_key, order_item.product_id, order_item.quantity)
+    if new_quantity <= 0:
+        await redis_client.hdel(cart_key, order_item.product_id)
+    await redis_client.expire(cart_key, cart_crud.CART_EXPIRE_SECONDS)
+
+
+def order_item_for(i: int) -> OrderItemCreate:
+    product_id: str = f'prod{i % 20}'
+    return OrderItemCreate(product_id=product_id, quantity=-100 if i % 4 == 3 else 1)
+
+
+def measure_sequential(redis_client: redis.Redis, add: Callable, ops: int) -> tuple[float, float, float]:
+    """Return the ops/sec and the p50 and p99 latency in milliseconds."""
+    latencies: list[float] = []
+    for i in range(ops):
+        start = time.perf_counter()
+        add(redis_client, f'bench{i % 100}', order_item_for(i))
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return (
+        ops / sum(latencies),
+        statistics.median(latencies) * 1000,
+        latencies[int(len(latencies) * 0.99) - 1] * 1000)
+
+
+async def measure_concurrent(
+        redis_client: redis.asyncio.Redis,
+        add: Callable[..., Awaitable],
+        ops: int,
+    ) -> float:
+    """Return the ops/sec reached by `CONCURRENCY` tasks sharing one client."""
+    async def worker(offset: int) -> None:
+        for i in range(offset, ops, CONCURRENCY):
+            await add(redis_client, f'bench{i % 100}', order_item_for(i))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(offset) for offset in range(CONCURRENCY)))
+    return ops / (time.perf_counter() - start)
+
+
+async def run_concurrent(args: argparse.Namespace) -> tuple[float, float]:
+    redis_client = redis.asyncio.Redis(
+        host=args.host, port=args.port, db=args.db, max_connections=CONCURRENCY)
+    try:
+        legacy: float = await measure_concurrent(redis_client, legacy_add_to_cart_async, args.ops)
+        script: float = await measure_concurrent(
+            redis_client, lambda r, u, o: cart_crud.add_to_cart_async(redis_client=r, user_id=u, order_item=o),
+            args.ops)
+    finally:
+        await redis_client.close(close_connection_pool=True)
+    return legacy, script
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--db', type=int, default=15, help='Database flushed before and after the run.')
+    parser.add_argument('--ops', type=int, default=5000, help='Cart updates per measurement.')
+    args = parser.parse_args()
+
+    redis_client = redis.Redis(host=args.host, port=args.port, db=args.db)
+    redis_client.flushdb()
+    legacy = measure_sequential(redis_client, legacy_add_to_cart, args.ops)
+    script = measure_sequential(
+        redis_client, lambda r, u, o: cart_crud.add_to_cart(redis_client=r, user_id=u, order_item=o), args.ops)
+    legacy_concurrent, script_concurrent = asyncio.run(run_concurrent(args))
+    redis_client.flushdb()
+
+    table = Table(title=f'add_to_cart ({args.ops} operations)')
+    for column in ['variant', 'sequential ops/s', 'p50 ms', 'p99 ms', f'{CONCURRENCY} tasks ops/s']:
+        table.add_column(column, justify='right')
+    table.add_row(
+        'HINCRBY + HDEL + EXPIRE',
+        f'{legacy[0]:.0f}', f'{legacy[1]:.3f}', f'{legacy[2]:.3f}', f'{legacy_concurrent:.0f}')
+    table.add_row(
+        'Lua script (EVALSHA)',
+        f'{script[0]:.0f}', f'{script[1]:.3f}', f'{script[2]:.3f}', f'{script_concurrent:.0f}')
+    Console().print(table)
+
+
+if __name__ == '__main__':
+    main()
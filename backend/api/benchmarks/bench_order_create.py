@@ -0,0 +1,114 @@
+"""
+Compare the per-item order creation path with the single-transaction bulk path.
+
+Round trips are counted with SQLAlchemy engine events (one per executed statement plus one
+per commit). A fixed delay can be added to each round trip to emulate the network latency
+between Cloud Run and Cloud SQL.
+
+Usage
+-----
+    cd backend/api
+    python benchmarks/bench_order_create.py --rtt-ms 1.0 --repeat 20
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+app_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(app_dir))
+
+from rich.console import Console
+from rich.table import Table
+from sqlalchemy import event
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.pool import StaticPool
+
+import cruds.order as order_crud
+from models.reqres_models import OrderItemCreate
+from models.table_models import Product, User
+
+
+ORDER_SIZES: list[int] = [1, 5, 10, 30, 100]
+
+
+class RoundTripCounter:
+    """Count statements and commits sent to the database, optionally sleeping for each one."""
+
+    def __init__(self, rtt_ms: float):
+        self.rtt_sec = rtt_ms / 1000
+        self.count = 0
+
+    def __call__(self, *args) -> None:
+        self.count += 1
+        if self.rtt_sec:
+            time.sleep(self.rtt_sec)
+
+
+def build_engine(num_products: int, counter: RoundTripCounter):
+    engine = create_engine(
+        url='sqlite://',
+        connect_args={'check_same_thread': False},
+        poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(User(id='bench_user', email='bench@example.com'))
+        for i in range(num_products):
+            session.add(Product(
+                id=f'prod{i}', name=f'prod{i}', description=f'desc{i}',
+                price=100 * i, author=f'author{i}', image_url=f'http://localhost/{i}'))
+        session.commit()
+    event.listen(engine, 'before_cursor_execute', counter)
+    event.listen(engine, 'commit', counter)
+    return engine
+
+
+def legacy_create(session: Session, user_id: str, order_items: list[OrderItemCreate]) -> None:
+    order = order_crud.create_order(session=session, user_id=user_id)
+    for order_item in order_items:
+        order_crud.create_order_item(session=session, order_id=order.id, order_item=order_item)
+
+
+def bulk_create(session: Session, user_id: str, order_items: list[OrderItemCreate]) -> None:
+    order_crud.create_order_with_items(session=session, user_id=user_id, order_items=order_items)
+
+
+def measure(engine, counter: RoundTripCounter, create, order_size: int, repeat: int) -> tuple[float, float]:
+    order_items = [OrderItemCreate(product_id=f'prod{i}', quantity=1) for i in range(order_size)]
+    counter.count = 0
+    elapsed: float = 0.0
+    for _ in range(repeat):
+        with Session(engine) as session:
+            start = time.perf_counter()
+            create(session, 'bench_user', order_items)
+            elapsed += time.perf_counter() - start
+    return counter.count / repeat, elapsed / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rtt-ms', type=float, default=0.5, help='Simulated latency per round trip.')
+    parser.add_argument('--repeat', type=int, default=10, help='Orders created per measurement.')
+    args = parser.parse_args()
+
+    counter = RoundTripCounter(rtt_ms=args.rtt_ms)
+    engine = build_engine(num_products=max(ORDER_SIZES), counter=counter)
+
+    table = Table(title=f'Order creation (simulated RTT {args.rtt_ms} ms)')
+    for column in ['items', 'legacy round trips', 'bulk round trips', 'legacy ms', 'bulk ms', 'speedup']:
+        table.add_column(column, justify='right')
+
+    for order_size in ORDER_SIZES:
+        legacy_trips, legacy_ms = measure(engine, counter, legacy_create, order_size, args.repeat)
+        bulk_trips, bulk_ms = measure(engine, counter, bulk_create, order_size, args.repeat)
+        table.add_row(
+            str(order_size),
+            f'{legacy_trips:.0f}', f'{bulk_trips:.0f}',
+            f'{legacy_ms:.2f}', f'{bulk_ms:.2f}',
+            f'{legacy_ms / bulk_ms:.1f}x')
+
+    Console().print(table)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Compare filtering a large order history by date in Python with the ULID range scan of `read_user_order_page`.
+
+A user with `--orders` orders spread over `--days` days (and other users around them) is written
+to a temporary SQLite database, or to the database given by `--url`. The orders of one week are
+then fetched by loading the whole history with `read_user_orders` and filtering it on the dates
+parsed from the ULIDs, and by `read_user_order_page` with the week as `start`/`end`. The cost of
+deriving the purchase dates of the whole history is also compared between `ulid.parse` and
+`ulid_time.ulid_to_datetime`.
+
+Usage
+-----
+    cd backend/api
+    python benchmarks/bench_order_date_range.py --orders 50000 --days 730
+"""
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+app_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(app_dir))
+
+import ulid
+from rich.console import Console
+from rich.table import Table
+from sqlmodel import Session, SQLModel, create_engine, insert, select
+
+import cruds.order as order_crud
+from models.table_models import Order, OrderItem, Product, User
+from ulid_time import ulid_to_datetime
+
+
+USER_ID: str = 'bench_user'
+NUM_PRODUCTS: int = 100
+
+
+def populate(
+        engine,
+        num_orders: int,
+        num_other_users: int,
+        start: datetime,
+        days: int,
+        batch_size: int = 10_000,
+    ) -> None:
+    SQLModel.metadata.create_all(engine)
+    rng = random.Random(0)
+    user_ids: list[str] = [USER_ID] + [f'other_user{i}' for i in range(num_other_users)]
+    with Session(engine) as session:
+        session.execute(insert(User).values([
+            {'id': user_id, 'email': f'{user_id}@example.com'} for user_id in user_ids]))
+        session.execute(insert(Product).values([
+            {
+                'id': f'prod{i}', 'name': f'product {i}', 'description': f'description {i}', 'price': float(i),
+                'author': f'author {i}', 'image_url': f'https://example.com/{i}.png',
+            }
+            for i in range(NUM_PRODUCTS)]))
+        # As many orders for the other users as for the benchmarked one, so that the index has to skip them.
+        owners: list[str] = [USER_ID] * num_orders + [
+            rng.choice(user_ids[1:]) for _ in range(num_orders if num_other_users else 0)]
+        for batch_start in range(0, len(owners), batch_size):
+            orders: list[dict] = []
+            items: list[dict] = []
+            for owner in owners[batch_start:batch_start + batch_size]:
+                placed_at: datetime = start + timedelta(seconds=rng.uniform(0, days * 86400))
+                order_id: str = str(ulid.from_timestamp(placed_at))
+                orders.append({'id': order_id, 'user_id': owner})
+                items.append({
+                    'id': str(ulid.new()), 'order_id': order_id,
+                    'product_id': f'prod{rng.randrange(NUM_PRODUCTS)}', 'quantity': rng.randint(1, 3)})
+            session.execute(insert(Order).values(orders))
+            session.execute(insert(OrderItem).values(items))
+        session.commit()
+
+
+def time_ms(fn, repeat: int) -> tuple[float, object]:
+    samples: list[float] = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=50_000, help='Orders of the benchmarked user.')
+    parser.add_argument('--other-users', type=int, default=100, help='Users sharing as many orders between them.')
+    parser.add_argument('--days', type=int, default=730, help='Days the orders are spread over.')
+    parser.add_argument('--repeat', type=int, default=5, help='Measurements per case (median is reported).')
+    parser.add_argument('--url', type=str, default=None, help='Database URL of an already populated database.')
+    args = parser.parse_args()
+
+    history_start: datetime = datetime(2023, 1, 1)
+    if args.url is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        engine = create_engine(f'sqlite:///{tmp_dir.name}/orders.db')
+        populate(engine, args.orders, args.other_users, history_start, args.days)
+    else:
+        engine = create_engine(args.url)
+
+    week_start: datetime = history_start + timedelta(days=args.days // 2)
+    week_end: datetime = week_start + timedelta(days=7)
+
+    def filter_in_python() -> list[Order]:
+        with Session(engine) as session:
+            user: User = order_crud.read_user_orders(session=session, user_id=USER_ID)
+            return [
+                order for order in user.orders
+                if week_start <= datetime.fromtimestamp(int(ulid.parse(order.id).timestamp()) / 1000.0) < week_end]
+
+    def range_scan() -> list[Order]:
+        with Session(engine) as session:
+            orders, _ = order_crud.read_user_order_page(
+                session=session, user_id=USER_ID, limit=args.orders, start=week_start, end=week_end)
+            return orders
+
+    table = Table(title=f'Orders of one week ({args.orders:,} orders over {args.days} days, median ms)')
+    for column in ['mode', 'orders', 'ms']:
+        table.add_column(column, justify='right')
+    python_ms, python_orders = time_ms(filter_in_python, args.repeat)
+    scan_ms, scan_orders = time_ms(range_scan, args.repeat)
+    if sorted(order.id for order in python_orders) != sorted(order.id for order in scan_orders):
+        Console().print('[red]The two modes returned different orders[/red]')
+        sys.exit(1)
+    table.add_row('load all, filter in Python', f'{len(python_orders):,}', f'{python_ms:.3f}')
+    table.add_row('ULID range scan', f'{len(scan_orders):,}', f'{scan_ms:.3f}')
+    Console().print(table)
+
+    with Session(engine) as session:
+        order_ids: list[str] = session.exec(select(Order.id).where(Order.user_id == USER_ID)).all()
+    table = Table(title=f'Purchase dates of {len(order_ids):,} orders (median ms)')
+    for column in ['conversion', 'ms']:
+        table.add_column(column, justify='right')
+    parse_ms, _ = time_ms(
+        lambda: [datetime.fromtimestamp(int(ulid.parse(order_id).timestamp()) / 1000.0) for order_id in order_ids],
+        args.repeat)
+    decode_ms, _ = time_ms(lambda: [ulid_to_datetime(order_id) for order_id in order_ids], args.repeat)
+    table.add_row('ulid.parse', f'{parse_ms:.3f}')
+    table.add_row('ulid_time.ulid_to_datetime', f'{decode_ms:.3f}')
+    Console().print(table)
+
+
+if __name__ == '__main__':
+    main()
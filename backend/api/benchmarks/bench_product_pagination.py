@@ -0,0 +1,108 @@
+"""
+Compare offset paging (`read_products`) with keyset paging (`read_product_page`) on a large catalog.
+
+A synthetic catalog is written to a temporary SQLite database (or to the database given by
+`--url`), then the first and a deep page are fetched repeatedly in both modes.
+
+Usage
+-----
+    cd backend/api
+    python benchmarks/bench_product_pagination.py --products 200000 --page 10000
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+app_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(app_dir))
+
+from rich.console import Console
+from rich.table import Table
+from sqlmodel import Session, SQLModel, create_engine, insert, select
+
+import cruds.product as product_crud
+from caching.crud_cache import crud_cache
+from models.table_models import Product
+
+
+def product_id(i: int) -> str:
+    return f'prod{i:09d}'
+
+
+def populate(engine, num_products: int, batch_size: int = 10_000) -> None:
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        for start in range(0, num_products, batch_size):
+            rows = [
+                {
+                    'id': product_id(i), 'name': f'product {i}', 'description': f'description {i}',
+                    'price': float(i % 10_000), 'author': f'author {i % 1_000}',
+                    'image_url': f'https://example.com/{i}.png',
+                }
+                for i in range(start, min(start + batch_size, num_products))]
+            session.execute(insert(Product).values(rows))
+        session.commit()
+
+
+def time_ms(fn, repeat: int) -> float:
+    samples: list[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=200_000, help='Size of the synthetic catalog.')
+    parser.add_argument('--page', type=int, default=10_000, help='Deep page to compare with page 1.')
+    parser.add_argument('--limit', type=int, default=20, help='Products per page.')
+    parser.add_argument('--repeat', type=int, default=20, help='Measurements per case (median is reported).')
+    parser.add_argument('--url', type=str, default=None, help='Database URL of an already populated catalog.')
+    args = parser.parse_args()
+    # Measure the queries, not the cache in front of `read_products`.
+    crud_cache.enabled = False
+
+    if args.page * args.limit > args.products:
+        parser.error('--page * --limit must not exceed --products')
+
+    if args.url is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        engine = create_engine(f'sqlite:///{tmp_dir.name}/catalog.db')
+        populate(engine, args.products)
+    else:
+        engine = create_engine(args.url)
+
+    deep_skip: int = (args.page - 1) * args.limit
+    with Session(engine) as session:
+        # The keyset cursor of a page is the last ID of the page before it.
+        deep_cursor: str = session.exec(
+            select(Product.id).order_by(Product.id).offset(deep_skip - 1).limit(1)).one()
+
+        table = Table(title=f'Product paging ({args.products:,} products, {args.limit} per page, median ms)')
+        for column in ['mode', 'page 1', f'page {args.page:,}', 'ratio']:
+            table.add_column(column, justify='right')
+
+        cases = {
+            'offset': (
+                lambda: product_crud.read_products(session=session, skip=0, limit=args.limit),
+                lambda: product_crud.read_products(session=session, skip=deep_skip, limit=args.limit)),
+            'cursor': (
+                lambda: product_crud.read_product_page(session=session, cursor=None, limit=args.limit),
+                lambda: product_crud.read_product_page(session=session, cursor=deep_cursor, limit=args.limit)),
+        }
+        for mode, (first_page, deep_page) in cases.items():
+            first_ms: float = time_ms(first_page, args.repeat)
+            deep_ms: float = time_ms(deep_page, args.repeat)
+            session.expunge_all()
+            table.add_row(mode, f'{first_ms:.3f}', f'{deep_ms:.3f}', f'{deep_ms / first_ms:.1f}x')
+
+    Console().print(table)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Hammer one SKU with concurrent stock reservations and check that it is never oversold.
+
+A product is given `--stock` units in Redis, then `--attempts` single-unit reservations are made by
+`--concurrency` asyncio tasks (over a connection pool as large), each followed by a commit when it
+succeeds, as an order would. The run fails if more reservations succeed than there were units, or
+if the counts left in Redis do not add up. Run it against a real Redis server.
+
+Usage
+-----
+    cd backend/api
+    python benchmarks/bench_stock_reservation.py --host localhost --port 6379 --db 15 --stock 10000 --attempts 50000
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+app_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(app_dir))
+
+import redis.asyncio
+from rich.console import Console
+from rich.table import Table
+
+import cruds.inventory as inventory_crud
+from models.reqres_models import OrderItemCreate
+
+
+PRODUCT_ID: str = 'bench-sku'
+
+
+async def run(args: argparse.Namespace) -> tuple[int, int, int, float, list[float]]:
+    """Return the successful reservations, the units left and sold, the elapsed seconds and the latencies."""
+    redis_client = redis.asyncio.Redis(host=args.host, port=args.port, db=args.db, max_connections=args.concurrency)
+    order_items = [OrderItemCreate(product_id=PRODUCT_ID, quantity=1)]
+    latencies: list[float] = []
+    successes: int = 0
+
+    async def worker(offset: int) -> None:
+        nonlocal successes
+        for i in range(offset, args.attempts, args.concurrency):
+            reservation_id: str = f'bench:{i}'
+            start = time.perf_counter()
+            out_of_stock: list[str] = await inventory_crud.reserve_stock_async(
+                redis_client=redis_client, reservation_id=reservation_id, order_items=order_items, ttl=60)
+            latencies.append(time.perf_counter() - start)
+            if not out_of_stock:
+                successes += 1
+                await inventory_crud.commit_reservation_async(
+                    redis_client=redis_client, reservation_id=reservation_id, order_items=order_items)
+
+    try:
+        await redis_client.flushdb()
+        # Load the scripts up front, so that no timed call pays for a NOSCRIPT round trip.
+        for script in [inventory_crud.RESERVE_STOCK_SCRIPT, inventory_crud.COMMIT_RESERVATION_SCRIPT]:
+            await redis_client.script_load(script.source)
+        await redis_client.hset(f'stock:{PRODUCT_ID}', 'available', args.stock)
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(offset) for offset in range(args.concurrency)))
+        elapsed: float = time.perf_counter() - start
+        available, sold = await redis_client.hmget(f'stock:{PRODUCT_ID}', ['available', 'sold'])
+        await redis_client.flushdb()
+    finally:
+        await redis_client.close(close_connection_pool=True)
+    return successes, int(available), int(sold or 0), elapsed, latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--db', type=int, default=15, help='Database flushed before and after the run.')
+    parser.add_argument('--stock', type=int, default=10_000, help='Units of the SKU.')
+    parser.add_argument('--attempts', type=int, default=50_000, help='Reservations attempted (more than the stock).')
+    parser.add_argument('--concurrency', type=int, default=200, help='Concurrent tasks and Redis connections.')
+    args = parser.parse_args()
+
+    successes, available, sold, elapsed, latencies = asyncio.run(run(args))
+    latencies.sort()
+
+    table = Table(title=f'Stock reservations on one SKU ({args.attempts:,} attempts, {args.concurrency} tasks)')
+    for column in ['stock', 'reserved', 'left', 'sold', 'reservations/s', 'p50 ms', 'p99 ms']:
+        table.add_column(column, justify='right')
+    table.add_row(
+        f'{args.stock:,}', f'{successes:,}', f'{available:,}', f'{sold:,}', f'{args.attempts / elapsed:,.0f}',
+        f'{statistics.median(latencies) * 1000:.3f}', f'{latencies[int(len(latencies) * 0.99) - 1] * 1000:.3f}')
+    Console().print(table)
+
+    expected: int = min(args.stock, args.attempts)
+    if successes != expected or sold != successes or available != args.stock - sold:
+        Console().print(f'[red]Inconsistent stock: expected {expected} reservations[/red]')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
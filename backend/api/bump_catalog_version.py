@@ -0,0 +1,10 @@
+import cruds.catalog as catalog_crud
+from caching.crud_cache import crud_cache
+from dependencies import redis_client
+
+
+if __name__ == '__main__':
+    # Run after writing products outside the API (e.g. a bulk import), so that catalog ETags change
+    # and no instance keeps serving cached products.
+    print(catalog_crud.bump_catalog_version(redis_client))
+    crud_cache.invalidate_tags(['catalog', 'product-count'])
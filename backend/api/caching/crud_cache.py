@@ -0,0 +1,16 @@
+import settings
+from caching.tiered import TieredCache
+from models.table_models import Product, User
+
+
+# Shared by the read functions of `cruds/`. Redis clients are attached in `dependencies` and the app lifespan.
+crud_cache = TieredCache(
+    maxsize=settings.CRUD_CACHE_MAXSIZE,
+    ttl=settings.CRUD_CACHE_TTL,
+    enabled=settings.CRUD_CACHE_ENABLED,
+    lock_timeout=settings.CRUD_CACHE_LOCK_TIMEOUT,
+    early_refresh_beta=settings.CRUD_CACHE_EARLY_REFRESH_BETA)
+crud_cache.invalidate_on_commit(Product, lambda product: [f'product:{product.id}', 'catalog'])
+# The product count only changes when products are added or deleted, not on every product update.
+crud_cache.invalidate_on_commit(Product, lambda product: ['product-count'], changes=['new', 'deleted'])
+crud_cache.invalidate_on_commit(User, lambda user: [f'user:{user.id}'])
@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any
+
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Bounded, thread-safe least-recently-used cache whose entries can expire.
+
+    Every entry may carry an absolute expiry time (seconds since the epoch, as returned by
+    `clock`). Expired entries are treated as misses and dropped when they are looked up;
+    when the cache is full the least recently used entry is evicted. With `max_bytes`, values
+    must support `len` (e.g. `bytes`) and the cache is also full when their total length exceeds it.
+
+    Parameters
+    ----------
+    maxsize : int
+        The maximum number of entries.
+    ttl : float | None, optional
+        The default lifetime of an entry in seconds. Default is None (entries do not expire
+        unless `set` is given an expiry).
+    clock : Callable[[], float], optional
+        Returns the current time in seconds. Default is `time.time`.
+    max_bytes : int | None, optional
+        The maximum total length of the values. Default is None (no limit).
+    """
+    def __init__(
+            self,
+            maxsize: int,
+            ttl: float | None = None,
+            clock: Callable[[], float] = time.time,
+            max_bytes: int | None = None,
+        ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.max_bytes = max_bytes
+        self.nbytes: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self._data: OrderedDict[Hashable, tuple[Any, float | None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def keys(self) -> list[Hashable]:
+        """Return the keys currently stored, least recently used first (expired entries included)."""
+        with self._lock:
+            return list(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the live value stored under `key` and mark it as recently used, or `default`."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at is None or expires_at > self.clock():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, expires_at: float | None = None) -> None:
+        """Store `value` under `key` until `expires_at` (or for `ttl` seconds if not given)."""
+        if expires_at is None and self.ttl is not None:
+            expires_at = self.clock() + self.ttl
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, expires_at)
+            if self.max_bytes is not None:
+                self.nbytes += len(value)
+            while len(self._data) > self.maxsize or (self.max_bytes is not None and self.nbytes > self.max_bytes):
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def _remove(self, key: Hashable) -> None:
+        value, _ = self._data.pop(key)
+        if self.max_bytes is not None:
+            self.nbytes -= len(value)
+
+    def delete(self, key: Hashable) -> bool:
+        """Remove `key` from the cache. Return whether it was present."""
+        with self._lock:
+            if key not in self._data:
+                return False
+            self._remove(key)
+            return True
+
+    def clear(self) -> None:
+        """Remove every entry. The counters are kept."""
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def stats(self) -> dict[str, int | float]:
+        """Return the size and the hit, miss and eviction counters of the cache."""
+        lookups: int = self.hits + self.misses
+        stats: dict[str, int | float] = {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+        if self.max_bytes is not None:
+            stats |= {'bytes': self.nbytes, 'max_bytes': self.max_bytes}
+        return stats
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key into a single execution.
+
+    The first caller of `do` for a key (the leader) runs the function; callers arriving while it runs
+    wait for it and receive its result, or its exception, instead of running the function again.
+    Once the call has finished, the next `do` for the key runs the function anew: results are not
+    cached here. `do` is for threads (e.g. synchronous handlers run in the threadpool) and
+    `do_async` for coroutines. Coroutines are only coalesced with coroutines of the same event loop.
+    """
+    def __init__(self):
+        self.coalesced: int = 0
+        self._calls: dict[Hashable, _Call] = {}
+        self._futures: dict[tuple[int, Hashable], asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._calls) + len(self._futures)
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """
+        Run `func`, or wait for the call already running for `key`, and return its result.
+
+        Parameters
+        ----------
+        key : Hashable
+            Identifies identical calls.
+        func : Callable[[], Any]
+            The function to run.
+
+        Returns
+        -------
+        Any
+            The result of `func`, shared by every caller of the flight.
+        """
+        with self._lock:
+            call: _Call | None = self._calls.get(key)
+            leader: bool = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def do_async(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Asynchronous version of `do`."""
+        loop = asyncio.get_running_loop()
+        flight_key: tuple[int, Hashable] = (id(loop), key)
+        future: asyncio.Future | None = self._futures.get(flight_key)
+        while future is not None:
+            self.coalesced += 1
+            try:
+                # A follower that is cancelled must not cancel the leader's call.
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leader was cancelled (e.g. its client went away): join the next flight, or lead it.
+                future = self._futures.get(flight_key)
+        future = self._futures[flight_key] = loop.create_future()
+        try:
+            result: Any = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Retrieved here so that a flight without followers does not log "exception never retrieved".
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._futures[flight_key]
@@ -0,0 +1,659 @@
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import math
+import random
+import time
+import typing
+import uuid
+from collections import Counter
+from collections.abc import Awaitable, Callable, Iterable
+from typing import Any, NamedTuple
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import parse_raw_as
+from redis import Redis, RedisError
+from redis.asyncio import Redis as AsyncRedis
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from caching.lru import LRUCache
+from caching.single_flight import SingleFlight
+from redis_script import RedisScript
+
+
+logger = logging.getLogger('uvicorn')
+
+# KEYS[1]: tag generations, KEYS[2..]: tag sets. ARGV: the tags. Bumps the generation of every tag, deletes
+# every cache key listed in the sets, then the sets themselves.
+INVALIDATE_TAGS_SCRIPT = RedisScript("""
+for i = 2, #KEYS do
+    redis.call('HINCRBY', KEYS[1], ARGV[i - 1], 1)
+    local keys = redis.call('SMEMBERS', KEYS[i])
+    for j = 1, #keys, 500 do
+        redis.call('DEL', unpack(keys, j, math.min(j + 499, #keys)))
+    end
+    redis.call('DEL', KEYS[i])
+end
+return #KEYS - 1
+""")
+
+# KEYS[1]: tag generations, KEYS[2]: the entry, KEYS[3..]: tag sets. ARGV: the value, the TTL in seconds, then
+# each tag followed by its generation when the value was loaded. Stores the entry only if none of its tags was
+# invalidated since, so a load that raced with a write never puts its stale result back.
+STORE_ENTRY_SCRIPT = RedisScript("""
+for i = 1, #KEYS - 2 do
+    if (redis.call('HGET', KEYS[1], ARGV[1 + 2 * i]) or '0') ~= ARGV[2 + 2 * i] then
+        return 0
+    end
+end
+redis.call('SET', KEYS[2], ARGV[1], 'EX', ARGV[2])
+for i = 3, #KEYS do
+    redis.call('SADD', KEYS[i], KEYS[2])
+    -- A tag set outlives the entries it lists by one TTL at most.
+    redis.call('EXPIRE', KEYS[i], ARGV[2])
+end
+return 1
+""")
+
+# KEYS: the lock. ARGV: the token of the holder. Deletes the lock only if it is still held with the token.
+RELEASE_LOCK_SCRIPT = RedisScript("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+""")
+
+LOCK_POLL_INTERVAL: float = 0.05
+
+
+class _Entry(NamedTuple):
+    raw: str
+    # How long the value took to compute, and when it expires, in seconds.
+    delta: float
+    expires_at: float
+
+
+class TieredCache:
+    """
+    Two-tier cache for read functions: an in-process LRU (L1) in front of Redis (L2).
+
+    Functions are wrapped with `cached`, which builds the cache key and the tags of an entry from
+    the function's arguments. Results are stored as JSON and decoded back into the function's return
+    annotation (e.g. `Product | None`) with pydantic, so every caller gets its own detached object.
+    Synchronous functions use `redis_client` and coroutine functions use `async_redis_client`; a
+    tier whose client is not set, or whose Redis call fails, is skipped.
+
+    Every entry carries tags (e.g. `product:42`, `catalog`). `invalidate_tags` deletes the entries of
+    the given tags from Redis and from L1, then publishes the tags on `channel` so that the other
+    instances, listening since `start`, drop them from their own L1. Each invalidation also bumps a
+    generation per tag, in Redis and in the process. A load reads the generations of its tags before
+    querying, and its result is stored only if they are unchanged, so a value read before a write
+    is never stored after the write's invalidation.
+
+    Misses are protected against stampedes in three ways:
+
+    - Concurrent misses for the same key in this process wait for a single load (`SingleFlight`),
+      whether they come from threads or from coroutines.
+    - With `lock_timeout`, a miss in both tiers takes a short Redis lock on the key before loading.
+      The other instances then wait for the value to appear in Redis instead of loading it too,
+      and load it themselves only if it has not appeared when the lock expires.
+    - Entries remember how long they took to compute. A lookup may treat an entry as expired a
+      little before its expiry (probabilistic early expiration, "XFetch"), with a probability
+      growing as the expiry nears and with the cost of the value. One caller then refreshes it
+      while the others keep being served the current value.
+
+    Parameters
+    ----------
+    maxsize : int
+        The maximum number of L1 entries.
+    ttl : float
+        The lifetime of an entry in seconds, in both tiers.
+    prefix : str, optional
+        The prefix of the Redis keys. Default is 'cache'.
+    channel : str, optional
+        The Redis pub/sub channel of invalidation messages. Default is 'cache:invalidate'.
+    enabled : bool, optional
+        Whether results are cached at all. Default is True.
+    lock_timeout : float, optional
+        How long the Redis lock of a missing key is held at most, in seconds. Default is 0 (no lock).
+    early_refresh_beta : float, optional
+        How eagerly entries are refreshed before they expire; 0 disables early refreshes.
+        Default is 1.0.
+    """
+    def __init__(
+            self,
+            maxsize: int,
+            ttl: float,
+            prefix: str = 'cache',
+            channel: str = 'cache:invalidate',
+            enabled: bool = True,
+            lock_timeout: float = 0,
+            early_refresh_beta: float = 1.0,
+        ):
+        self.l1 = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.channel = channel
+        self.enabled = enabled
+        self.lock_timeout = lock_timeout
+        self.early_refresh_beta = early_refresh_beta
+        self.redis_client: Redis | None = None
+        self.async_redis_client: AsyncRedis | None = None
+        self.l2_hits: int = 0
+        self.l2_misses: int = 0
+        self.loads: int = 0
+        self.early_refreshes: int = 0
+        self.lock_waits: int = 0
+        self._flights = SingleFlight()
+        self._instance_id: str = uuid.uuid4().hex
+        self._tag_index: dict[str, set[str]] = {}
+        self._tag_generations: dict[str, int] = {}
+        # Tags whose invalidation in Redis was handed to a background task that has not run yet.
+        self._invalidating: Counter[str] = Counter()
+        self._invalidations: set[asyncio.Task] = set()
+        self._listener: asyncio.Task | None = None
+
+    def _key(self, key: str) -> str:
+        return f'{self.prefix}:{key}'
+
+    def _tag_key(self, tag: str) -> str:
+        return f'{self.prefix}:tag:{tag}'
+
+    def _lock_key(self, key: str) -> str:
+        return f'{self.prefix}:lock:{key}'
+
+    def _generations_key(self) -> str:
+        return f'{self.prefix}:generations'
+
+    def _is_fresh(self, entry: _Entry) -> bool:
+        if self.early_refresh_beta <= 0:
+            return True
+        # XFetch: -log(u) for u in (0, 1] is exponentially distributed with mean 1.
+        early: float = -entry.delta * self.early_refresh_beta * math.log(1.0 - random.random())
+        if time.time() + early < entry.expires_at:
+            return True
+        self.early_refreshes += 1
+        return False
+
+    def _lookup_l1(self, key: str) -> str | None:
+        entry: _Entry | None = self.l1.get(key)
+        if entry is None or not self._is_fresh(entry):
+            return None
+        return entry.raw
+
+    def _set_l1(self, key: str, entry: _Entry, tags: list[str]) -> None:
+        self.l1.set(key, entry, expires_at=entry.expires_at)
+        for tag in tags:
+            self._tag_index.setdefault(tag, set()).add(key)
+        if len(self._tag_index) > 2 * self.l1.maxsize:
+            # Drop the references to entries evicted from the LRU since the last rebuild.
+            live: set[str] = set(self.l1.keys())
+            self._tag_index = {
+                tag: keys & live for tag, keys in self._tag_index.items() if keys & live}
+
+    def _invalidate_l1(self, tags: Iterable[str]) -> None:
+        for tag in tags:
+            self._tag_generations[tag] = self._tag_generations.get(tag, 0) + 1
+            for key in self._tag_index.pop(tag, set()):
+                self.l1.delete(key)
+
+    def _is_invalidating(self, tags: list[str]) -> bool:
+        # Redis may still hold the entries of these tags from before a commit of this process.
+        return any(self._invalidating[tag] for tag in tags)
+
+    def _l1_generations(self, tags: list[str]) -> list[int]:
+        return [self._tag_generations.get(tag, 0) for tag in tags]
+
+    def _set_l1_if_current(self, key: str, entry: _Entry, tags: list[str], generations: list[int]) -> None:
+        # Skipped if a tag was invalidated in this process (or by another one, through the channel) meanwhile.
+        if self._l1_generations(tags) == generations:
+            self._set_l1(key, entry, tags)
+
+    def _get_l2(self, key: str) -> _Entry | None:
+        if self.redis_client is None:
+            return None
+        try:
+            raw: bytes | None = self.redis_client.get(self._key(key))
+        except RedisError as e:
+            logger.warning(f'Could not read {key} from the Redis cache: {e}')
+            return None
+        return self._count_l2(raw)
+
+    async def _get_l2_async(self, key: str) -> _Entry | None:
+        if self.async_redis_client is None:
+            return None
+        try:
+            raw: bytes | None = await self.async_redis_client.get(self._key(key))
+        except RedisError as e:
+            logger.warning(f'Could not read {key} from the Redis cache: {e}')
+            return None
+        return self._count_l2(raw)
+
+    def _count_l2(self, raw: bytes | None) -> _Entry | None:
+        entry: _Entry | None = self._parse(raw)
+        if entry is None:
+            self.l2_misses += 1
+        else:
+            self.l2_hits += 1
+        return entry
+
+    @staticmethod
+    def _parse(raw: bytes | None) -> _Entry | None:
+        # Stored as '<expires_at>|<delta>|<JSON>'; anything else (e.g. a value of an older release) is a miss.
+        if raw is None:
+            return None
+        try:
+            expires_at, delta, value = raw.decode('utf-8').split('|', 2)
+            return _Entry(value, float(delta), float(expires_at))
+        except ValueError:
+            return None
+
+    def _get_l2_generations(self, key: str, tags: list[str]) -> list[str] | None:
+        """Read the generations of `tags` in Redis; None if they are unknown, and the entry must not be stored."""
+        if self.redis_client is None:
+            return None
+        if not tags:
+            return []
+        try:
+            return self._parse_generations(self.redis_client.hmget(self._generations_key(), tags))
+        except RedisError as e:
+            logger.warning(f'Could not read the generations of {key} from the Redis cache: {e}')
+            return None
+
+    async def _get_l2_generations_async(self, key: str, tags: list[str]) -> list[str] | None:
+        """Asynchronous version of `_get_l2_generations`."""
+        if self.async_redis_client is None:
+            return None
+        if not tags:
+            return []
+        try:
+            return self._parse_generations(await self.async_redis_client.hmget(self._generations_key(), tags))
+        except RedisError as e:
+            logger.warning(f'Could not read the generations of {key} from the Redis cache: {e}')
+            return None
+
+    @staticmethod
+    def _parse_generations(generations: list[bytes | None]) -> list[str]:
+        return [generation.decode() if generation is not None else '0' for generation in generations]
+
+    def _set_l2(self, key: str, entry: _Entry, tags: list[str], generations: list[str] | None) -> bool:
+        """Store an entry loaded at `generations` of its tags. Return False if a tag was invalidated since."""
+        if self.redis_client is None or generations is None:
+            return True
+        try:
+            return bool(STORE_ENTRY_SCRIPT.run(
+                self.redis_client, keys=self._store_keys(key, tags), args=self._store_args(entry, tags, generations)))
+        except RedisError as e:
+            logger.warning(f'Could not write {key} to the Redis cache: {e}')
+            return True
+
+    async def _set_l2_async(self, key: str, entry: _Entry, tags: list[str], generations: list[str] | None) -> bool:
+        """Asynchronous version of `_set_l2`."""
+        if self.async_redis_client is None or generations is None:
+            return True
+        try:
+            return bool(await STORE_ENTRY_SCRIPT.run_async(
+                self.async_redis_client, keys=self._store_keys(key, tags),
+                args=self._store_args(entry, tags, generations)))
+        except RedisError as e:
+            logger.warning(f'Could not write {key} to the Redis cache: {e}')
+            return True
+
+    def _store_keys(self, key: str, tags: list[str]) -> list[str]:
+        return [self._generations_key(), self._key(key), *(self._tag_key(tag) for tag in tags)]
+
+    def _store_args(self, entry: _Entry, tags: list[str], generations: list[str]) -> list[Any]:
+        args: list[Any] = [f'{entry.expires_at:.3f}|{entry.delta:.6f}|{entry.raw}', max(int(self.ttl), 1)]
+        for tag, generation in zip(tags, generations, strict=True):
+            args += [tag, generation]
+        return args
+
+    def _acquire_lock(self, key: str) -> tuple[str | None, _Entry | None]:
+        """Take the Redis lock of `key`, or wait for its holder. Return the lock token, or the entry it stored."""
+        if self.redis_client is None or self.lock_timeout <= 0:
+            return None, None
+        token: str = uuid.uuid4().hex
+        try:
+            if self.redis_client.set(self._lock_key(key), token, nx=True, px=int(self.lock_timeout * 1000)):
+                return token, None
+            self.lock_waits += 1
+            deadline: float = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(LOCK_POLL_INTERVAL)
+                entry: _Entry | None = self._parse(self.redis_client.get(self._key(key)))
+                if entry is not None:
+                    return None, entry
+        except RedisError as e:
+            logger.warning(f'Could not lock {key} in the Redis cache: {e}')
+        return None, None
+
+    async def _acquire_lock_async(self, key: str) -> tuple[str | None, _Entry | None]:
+        """Asynchronous version of `_acquire_lock`."""
+        if self.async_redis_client is None or self.lock_timeout <= 0:
+            return None, None
+        token: str = uuid.uuid4().hex
+        try:
+            if await self.async_redis_client.set(self._lock_key(key), token, nx=True, px=int(self.lock_timeout * 1000)):
+                return token, None
+            self.lock_waits += 1
+            deadline: float = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                await asyncio.sleep(LOCK_POLL_INTERVAL)
+                entry: _Entry | None = self._parse(await self.async_redis_client.get(self._key(key)))
+                if entry is not None:
+                    return None, entry
+        except RedisError as e:
+            logger.warning(f'Could not lock {key} in the Redis cache: {e}')
+        return None, None
+
+    def _release_lock(self, key: str, token: str) -> None:
+        try:
+            RELEASE_LOCK_SCRIPT.run(self.redis_client, keys=[self._lock_key(key)], args=[token])
+        except RedisError as e:
+            logger.warning(f'Could not unlock {key} in the Redis cache: {e}')
+
+    async def _release_lock_async(self, key: str, token: str) -> None:
+        try:
+            await RELEASE_LOCK_SCRIPT.run_async(self.async_redis_client, keys=[self._lock_key(key)], args=[token])
+        except RedisError as e:
+            logger.warning(f'Could not unlock {key} in the Redis cache: {e}')
+
+    def _load(self, key: str, tags: list[str], load: Callable[[], Any], encode: Callable[[Any], str]) -> str:
+        """Return the value of `key` from Redis, or load it and store it in both tiers. Run once per flight."""
+        l1_generations: list[int] = self._l1_generations(tags)
+        entry: _Entry | None = None if self._is_invalidating(tags) else self._get_l2(key)
+        if entry is not None and self._is_fresh(entry):
+            self._set_l1_if_current(key, entry, tags, l1_generations)
+            return entry.raw
+        token: str | None = None
+        if entry is None:
+            token, entry = self._acquire_lock(key)
+            if entry is not None:
+                self._set_l1_if_current(key, entry, tags, l1_generations)
+                return entry.raw
+        try:
+            generations: list[str] | None = self._get_l2_generations(key, tags)
+            self.loads += 1
+            start: float = time.monotonic()
+            raw: str = encode(load())
+            entry = _Entry(raw, time.monotonic() - start, time.time() + self.ttl)
+            current: bool = self._set_l2(key, entry, tags, generations)
+        finally:
+            if token is not None:
+                self._release_lock(key, token)
+        if current:
+            self._set_l1_if_current(key, entry, tags, l1_generations)
+        return entry.raw
+
+    async def _load_async(
+            self,
+            key: str,
+            tags: list[str],
+            load: Callable[[], Awaitable[Any]],
+            encode: Callable[[Any], str],
+        ) -> str:
+        """Asynchronous version of `_load`."""
+        l1_generations: list[int] = self._l1_generations(tags)
+        entry: _Entry | None = None if self._is_invalidating(tags) else await self._get_l2_async(key)
+        if entry is not None and self._is_fresh(entry):
+            self._set_l1_if_current(key, entry, tags, l1_generations)
+            return entry.raw
+        token: str | None = None
+        if entry is None:
+            token, entry = await self._acquire_lock_async(key)
+            if entry is not None:
+                self._set_l1_if_current(key, entry, tags, l1_generations)
+                return entry.raw
+        try:
+            generations: list[str] | None = await self._get_l2_generations_async(key, tags)
+            self.loads += 1
+            start: float = time.monotonic()
+            raw: str = encode(await load())
+            entry = _Entry(raw, time.monotonic() - start, time.time() + self.ttl)
+            current: bool = await self._set_l2_async(key, entry, tags, generations)
+        finally:
+            if token is not None:
+                await self._release_lock_async(key, token)
+        if current:
+            self._set_l1_if_current(key, entry, tags, l1_generations)
+        return entry.raw
+
+    def cached(self, key: str, tags: Iterable[str] = ()) -> Callable:
+        """
+        Decorate a read function (sync or async) so that its results are cached in both tiers.
+
+        Parameters
+        ----------
+        key : str
+            Format string of the cache key, filled with the function's arguments by name,
+            e.g. 'product:{product_id}'. Arguments not named in it (like the session) are ignored.
+        tags : Iterable[str], optional
+            Format strings of the tags of the entry, filled like `key`. Default is no tags.
+
+        Returns
+        -------
+        Callable
+            The decorator.
+        """
+        tag_templates: list[str] = list(tags)
+
+        def decorator(func: Callable) -> Callable:
+            signature = inspect.signature(func)
+            return_type = typing.get_type_hints(func)['return']
+
+            def resolve(args: tuple, kwargs: dict) -> tuple[str, list[str]]:
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                return key.format(**bound.arguments), [tag.format(**bound.arguments) for tag in tag_templates]
+
+            def encode(value: Any) -> str:
+                return json.dumps(jsonable_encoder(value))
+
+            def decode(raw: str) -> Any:
+                return parse_raw_as(return_type, raw)
+
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs) -> Any:
+                    if not self.enabled:
+                        return await func(*args, **kwargs)
+                    cache_key, cache_tags = resolve(args, kwargs)
+                    raw: str | None = self._lookup_l1(cache_key)
+                    if raw is None:
+                        raw = await self._flights.do_async(
+                            cache_key,
+                            lambda: self._load_async(cache_key, cache_tags, lambda: func(*args, **kwargs), encode))
+                    return decode(raw)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs) -> Any:
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                cache_key, cache_tags = resolve(args, kwargs)
+                raw: str | None = self._lookup_l1(cache_key)
+                if raw is None:
+                    raw = self._flights.do(
+                        cache_key,
+                        lambda: self._load(cache_key, cache_tags, lambda: func(*args, **kwargs), encode))
+                return decode(raw)
+            return wrapper
+
+        return decorator
+
+    def invalidate_tags(self, tags: Iterable[str]) -> None:
+        """
+        Drop every entry carrying one of `tags`, in this instance, in Redis and in the other instances.
+
+        Parameters
+        ----------
+        tags : Iterable[str]
+            The tags to invalidate.
+        """
+        tags = list(dict.fromkeys(tags))
+        if not tags:
+            return
+        self._invalidate_l1(tags)
+        if self.redis_client is None:
+            return
+        try:
+            INVALIDATE_TAGS_SCRIPT.run(
+                self.redis_client, keys=[self._generations_key(), *(self._tag_key(tag) for tag in tags)], args=tags)
+            self.redis_client.publish(self.channel, self._invalidation_message(tags))
+        except RedisError as e:
+            logger.warning(f'Could not invalidate cache tags {tags}: {e}')
+
+    async def invalidate_tags_async(self, tags: Iterable[str]) -> None:
+        """Asynchronous version of `invalidate_tags`."""
+        tags = list(dict.fromkeys(tags))
+        if not tags:
+            return
+        self._invalidate_l1(tags)
+        await self._invalidate_l2_async(tags)
+
+    async def _invalidate_l2_async(self, tags: list[str]) -> None:
+        if self.async_redis_client is None:
+            return
+        try:
+            await INVALIDATE_TAGS_SCRIPT.run_async(
+                self.async_redis_client,
+                keys=[self._generations_key(), *(self._tag_key(tag) for tag in tags)], args=tags)
+            await self.async_redis_client.publish(self.channel, self._invalidation_message(tags))
+        except RedisError as e:
+            logger.warning(f'Could not invalidate cache tags {tags}: {e}')
+
+    def _invalidation_message(self, tags: list[str]) -> str:
+        return json.dumps({'origin': self._instance_id, 'tags': tags})
+
+    def _invalidate_after_commit(self, tags: Iterable[str]) -> None:
+        """
+        Invalidate tags from a commit listener without blocking the event loop.
+
+        The commits of an `AsyncSession` run their listeners on the event loop, where a call of the
+        synchronous client would block every other request. There, L1 is invalidated at once and the
+        Redis part is handed to a task using `async_redis_client`; until it has run, lookups of these
+        tags skip Redis. Elsewhere (sync sessions, in the threadpool or in scripts), `invalidate_tags`
+        is called directly.
+        """
+        try:
+            loop: asyncio.AbstractEventLoop | None = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None or self.async_redis_client is None:
+            self.invalidate_tags(tags)
+            return
+        tags = list(dict.fromkeys(tags))
+        self._invalidate_l1(tags)
+        self._invalidating.update(tags)
+
+        async def invalidate() -> None:
+            try:
+                await self._invalidate_l2_async(tags)
+            finally:
+                for tag in tags:
+                    self._invalidating[tag] -= 1
+                    if not self._invalidating[tag]:
+                        del self._invalidating[tag]
+
+        task: asyncio.Task = loop.create_task(invalidate())
+        self._invalidations.add(task)
+        task.add_done_callback(self._invalidations.discard)
+
+    def invalidate_on_commit(
+            self,
+            model: type,
+            tags: Callable[[Any], Iterable[str]],
+            changes: Iterable[str] = ('new', 'dirty', 'deleted'),
+        ) -> None:
+        """
+        Invalidate tags after every committed transaction that added, changed or deleted `model` rows.
+
+        The listeners are registered on the `Session` class, so they also cover the sessions behind
+        `AsyncSession`, whose invalidations are sent to Redis by a background task (see
+        `_invalidate_after_commit`). Writes made outside the ORM are not seen.
+
+        Parameters
+        ----------
+        model : type
+            The table model to watch.
+        tags : Callable[[Any], Iterable[str]]
+            Returns the tags to invalidate for a changed instance.
+        changes : Iterable[str], optional
+            The kinds of changes to watch among 'new', 'dirty' and 'deleted'. Default is all of them.
+        """
+        info_key: str = f'{self.prefix}:tags'
+        changes = list(changes)
+
+        @event.listens_for(Session, 'after_flush')
+        def _after_flush(session: Session, flush_context) -> None:
+            for obj in [obj for change in changes for obj in getattr(session, change)]:
+                if isinstance(obj, model):
+                    session.info.setdefault(info_key, set()).update(tags(obj))
+
+        @event.listens_for(Session, 'after_commit')
+        def _after_commit(session: Session) -> None:
+            pending: set[str] | None = session.info.pop(info_key, None)
+            if pending:
+                self._invalidate_after_commit(pending)
+
+        @event.listens_for(Session, 'after_soft_rollback')
+        def _after_rollback(session: Session, previous_transaction) -> None:
+            session.info.pop(info_key, None)
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with self.async_redis_client.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        payload: dict = json.loads(message['data'])
+                        if payload.get('origin') != self._instance_id:
+                            self._invalidate_l1(payload.get('tags', []))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # While unsubscribed, invalidations of other instances are missed: start over clean.
+                logger.warning(f'Cache invalidation listener failed, resubscribing: {e}')
+                self.clear_l1()
+                await asyncio.sleep(1)
+
+    async def start(self, async_redis_client: AsyncRedis) -> None:
+        """Use `async_redis_client` for the L2 of async functions and listen for invalidations."""
+        self.async_redis_client = async_redis_client
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        """Send the invalidations still pending, then stop listening for invalidations."""
+        if self._invalidations:
+            await asyncio.gather(*self._invalidations, return_exceptions=True)
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        self.async_redis_client = None
+
+    def clear_l1(self) -> None:
+        """Remove every L1 entry."""
+        self.l1.clear()
+        self._tag_index.clear()
+
+    def stats(self) -> dict[str, int | float | bool]:
+        """Return whether the cache is enabled, the counters of both tiers and of the stampede protections."""
+        l2_lookups: int = self.l2_hits + self.l2_misses
+        return {
+            'enabled': self.enabled,
+            **{f'l1_{name}': value for name, value in self.l1.stats().items()},
+            'l2_hits': self.l2_hits,
+            'l2_misses': self.l2_misses,
+            'l2_hit_ratio': self.l2_hits / l2_lookups if l2_lookups else 0.0,
+            'loads': self.loads,
+            'coalesced': self._flights.coalesced,
+            'early_refreshes': self.early_refreshes,
+            'lock_waits': self.lock_waits,
+        }
@@ -1,5 +1,7 @@
 from sqlmodel import select, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from models.table_models import User
+from caching.crud_cache import crud_cache
 
 def append_user(session: Session, user_id: str, email: str) -> User:
     """
@@ -25,6 +27,15 @@ def append_user(session: Session, user_id: str, email: str) -> User:
     session.refresh(db_user)
     return db_user
 
+async def append_user_async(session: AsyncSession, user_id: str, email: str) -> User:
+    """Asynchronous version of `append_user`."""
+    db_user: User = User(id=user_id, email=email)
+    session.add(db_user)
+    await session.commit()
+    await session.refresh(db_user)
+    return db_user
+
+@crud_cache.cached(key='user:{user_id}', tags=['user:{user_id}'])
 def get_user(session: Session, user_id: str) -> User | None:
     """
     Retrieve a user from the database by their unique ID.
@@ -44,6 +55,12 @@ def get_user(session: Session, user_id: str) -> User | None:
     user: User | None = session.get(User, user_id)
     return user
 
+@crud_cache.cached(key='user:{user_id}', tags=['user:{user_id}'])
+async def get_user_async(session: AsyncSession, user_id: str) -> User | None:
+    """Asynchronous version of `get_user`."""
+    user: User | None = await session.get(User, user_id)
+    return user
+
 def delete_user(session: Session, db_user: User) -> None:
     """
     Remove a user from the database.
@@ -59,6 +76,13 @@ def delete_user(session: Session, db_user: User) -> None:
     -------
     None
     """
-    session.delete(db_user)
+    # The user may come from the cache, detached from this session.
+    session.delete(session.merge(db_user))
     session.commit()
     return
+
+async def delete_user_async(session: AsyncSession, db_user: User) -> None:
+    """Asynchronous version of `delete_user`."""
+    await session.delete(await session.merge(db_user))
+    await session.commit()
+    return
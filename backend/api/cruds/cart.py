@@ -1,16 +1,65 @@
 from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
 
+import settings
 from models.reqres_models import OrderItemCreate
-
-
-def add_to_cart(redis_client: Redis, user_id: str, order_item: OrderItemCreate) -> None:
+from redis_script import RedisScript
+
+
+CART_EXPIRE_SECONDS: int = 2 * 24 * 3600
+
+# KEYS[1]: cart key, ARGV: product ID, quantity delta, maximum quantity, TTL in seconds
+ADD_TO_CART_SCRIPT = RedisScript("""
+local quantity = redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+local max_quantity = tonumber(ARGV[3])
+if quantity <= 0 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+    quantity = 0
+elseif quantity > max_quantity then
+    redis.call('HSET', KEYS[1], ARGV[1], max_quantity)
+    quantity = max_quantity
+end
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return quantity
+""")
+
+# KEYS[1]: cart key, ARGV: product ID, new quantity, maximum quantity, TTL in seconds
+SET_CART_QUANTITY_SCRIPT = RedisScript("""
+local quantity = math.min(tonumber(ARGV[2]), tonumber(ARGV[3]))
+if quantity <= 0 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+    quantity = 0
+else
+    redis.call('HSET', KEYS[1], ARGV[1], quantity)
+end
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return quantity
+""")
+
+# KEYS[1]: cart key, ARGV: product ID and quantity pairs. Removes products whose quantity drops to 0 or less.
+SUBTRACT_FROM_CART_SCRIPT = RedisScript("""
+for i = 1, #ARGV, 2 do
+    if redis.call('HINCRBY', KEYS[1], ARGV[i], -tonumber(ARGV[i + 1])) <= 0 then
+        redis.call('HDEL', KEYS[1], ARGV[i])
+    end
+end
+return redis.call('HLEN', KEYS[1])
+""")
+
+
+def add_to_cart(
+        redis_client: Redis,
+        user_id: str,
+        order_item: OrderItemCreate,
+        max_quantity: int = settings.CART_MAX_QUANTITY,
+    ) -> int:
     """
     Adds an item to the user's cart in Redis. If the item's quantity is updated to 0 or less,
     the item is removed from the cart. The cart has a set expiry time.
 
-    The function retrieves the user's cart from Redis using the user ID, then updates 
-    the cart with the new item or updates the quantity of an existing item. It also 
-    sets an expiry time for the cart to keep the Redis database uncluttered.
+    The increment, the removal of a non-positive quantity, the cap at `max_quantity` and the
+    refresh of the expiry time run in one Lua script on the Redis server, so they take a single
+    round trip and concurrent requests never see an intermediate quantity.
 
     Parameters
     ----------
@@ -22,28 +71,50 @@ def add_to_cart(redis_client: Redis, user_id: str, order_item: OrderItemCreate)
     order_item : OrderItemCreate
         An instance of OrderItemCreate that contains the product_id and quantity to be 
         added or updated in the user's cart.
+    max_quantity : int, optional
+        The largest quantity of one product a cart can hold. Default is `settings.CART_MAX_QUANTITY`.
 
     Returns
     -------
-    None
-        This function does not return a value; it updates the user's cart in Redis directly.
+    int
+        The quantity of the product in the cart after the update (0 if it was removed).
     """
     cart_key: str = f'cart:{user_id}'
-    product_id: str = order_item.product_id
-    quantity: int = order_item.quantity
-    
-    new_quantity: int = redis_client.hincrby(cart_key, product_id, quantity)
-    if new_quantity <= 0:
-        redis_client.hdel(cart_key, product_id)
-    redis_client.expire(cart_key, 2 * 24 * 3600)
-
-
-def update_cart_product(redis_client: Redis, user_id: str, order_item: OrderItemCreate) -> None:
+    new_quantity: int = ADD_TO_CART_SCRIPT.run(
+        redis_client,
+        keys=[cart_key],
+        args=[order_item.product_id, order_item.quantity, max_quantity, CART_EXPIRE_SECONDS])
+    return new_quantity
+
+
+async def add_to_cart_async(
+        redis_client: AsyncRedis,
+        user_id: str,
+        order_item: OrderItemCreate,
+        max_quantity: int = settings.CART_MAX_QUANTITY,
+    ) -> int:
+    """Asynchronous version of `add_to_cart`."""
+    cart_key: str = f'cart:{user_id}'
+    new_quantity: int = await ADD_TO_CART_SCRIPT.run_async(
+        redis_client,
+        keys=[cart_key],
+        args=[order_item.product_id, order_item.quantity, max_quantity, CART_EXPIRE_SECONDS])
+    return new_quantity
+
+
+def update_cart_product(
+        redis_client: Redis,
+        user_id: str,
+        order_item: OrderItemCreate,
+        max_quantity: int = settings.CART_MAX_QUANTITY,
+    ) -> int:
     """
     Updates the quantity of a specific product in the user's cart in Redis. If the quantity is
     set to 0 or less, the product is removed from the cart. The function also updates the
     expiry time of the cart.
 
+    Like `add_to_cart`, the update runs atomically in one Lua script.
+
     Parameters
     ----------
     redis_client : Redis
@@ -55,13 +126,14 @@ def update_cart_product(redis_client: Redis, user_id: str, order_item: OrderItem
     order_item : OrderItemCreate
         An instance containing the product_id and the new quantity to be set. If the quantity is 
         0 or less, the product is removed from the cart.
+    max_quantity : int, optional
+        The largest quantity of one product a cart can hold; larger quantities are capped.
+        Default is `settings.CART_MAX_QUANTITY`.
 
     Returns
     -------
-    None
-        The function doesn't return a value; it directly modifies the user's cart in Redis. The 
-        cart is updated with the new quantity of the specified product, or the product is removed 
-        if the quantity is 0 or less. The expiry time of the cart is also updated.
+    int
+        The quantity of the product in the cart after the update (0 if it was removed).
 
     Examples
     --------
@@ -69,14 +141,26 @@ def update_cart_product(redis_client: Redis, user_id: str, order_item: OrderItem
     # This will set the quantity of 'product123' in the cart of 'user123' to 2 in Redis, and update the cart's expiry time.
     """
     cart_key: str = f'cart:{user_id}'
-    product_id: str = order_item.product_id
-    quantity: int = order_item.quantity
-
-    if quantity <= 0:
-        redis_client.hdel(cart_key, product_id)
-    else:
-        redis_client.hset(cart_key, product_id, quantity)
-    redis_client.expire(cart_key, 2 * 24 * 3600)
+    new_quantity: int = SET_CART_QUANTITY_SCRIPT.run(
+        redis_client,
+        keys=[cart_key],
+        args=[order_item.product_id, order_item.quantity, max_quantity, CART_EXPIRE_SECONDS])
+    return new_quantity
+
+
+async def update_cart_product_async(
+        redis_client: AsyncRedis,
+        user_id: str,
+        order_item: OrderItemCreate,
+        max_quantity: int = settings.CART_MAX_QUANTITY,
+    ) -> int:
+    """Asynchronous version of `update_cart_product`."""
+    cart_key: str = f'cart:{user_id}'
+    new_quantity: int = await SET_CART_QUANTITY_SCRIPT.run_async(
+        redis_client,
+        keys=[cart_key],
+        args=[order_item.product_id, order_item.quantity, max_quantity, CART_EXPIRE_SECONDS])
+    return new_quantity
 
 
 def remove_from_cart(redis_client: Redis, user_id: str) -> None:
@@ -98,6 +182,47 @@ def remove_from_cart(redis_client: Redis, user_id: str) -> None:
     redis_client.delete(cart_key)
 
 
+async def remove_from_cart_async(redis_client: AsyncRedis, user_id: str) -> None:
+    """Asynchronous version of `remove_from_cart`."""
+    cart_key: str = f'cart:{user_id}'
+    await redis_client.delete(cart_key)
+
+
+def subtract_from_cart(redis_client: Redis, user_id: str, order_items: list[OrderItemCreate]) -> int:
+    """
+    Take ordered quantities out of a user's cart, in one atomic step.
+
+    Unlike `remove_from_cart`, products added to the cart while the order was being placed
+    (e.g. from another tab) are kept.
+
+    Parameters
+    ----------
+    redis_client : Redis
+        The Redis client instance to communicate with the Redis server.
+    user_id : str
+        The unique identifier of the user.
+    order_items : list[OrderItemCreate]
+        The ordered products and quantities.
+
+    Returns
+    -------
+    int
+        The number of distinct products left in the cart.
+    """
+    cart_key: str = f'cart:{user_id}'
+    return SUBTRACT_FROM_CART_SCRIPT.run(redis_client, keys=[cart_key], args=_quantity_args(order_items))
+
+
+async def subtract_from_cart_async(redis_client: AsyncRedis, user_id: str, order_items: list[OrderItemCreate]) -> int:
+    """Asynchronous version of `subtract_from_cart`."""
+    cart_key: str = f'cart:{user_id}'
+    return await SUBTRACT_FROM_CART_SCRIPT.run_async(redis_client, keys=[cart_key], args=_quantity_args(order_items))
+
+
+def _quantity_args(order_items: list[OrderItemCreate]) -> list[str | int]:
+    return [arg for order_item in order_items for arg in (order_item.product_id, order_item.quantity)]
+
+
 def get_cart(redis_client: Redis, user_id: str) -> dict[str, int]:
     """
     Retrieve the contents of a user's cart.
@@ -117,3 +242,10 @@ def get_cart(redis_client: Redis, user_id: str) -> dict[str, int]:
     cart_key: str = f'cart:{user_id}'
     raw_cart = redis_client.hgetall(cart_key)
     return {k.decode('utf-8'): int(v) for k, v in raw_cart.items()}
+
+
+async def get_cart_async(redis_client: AsyncRedis, user_id: str) -> dict[str, int]:
+    """Asynchronous version of `get_cart`."""
+    cart_key: str = f'cart:{user_id}'
+    raw_cart = await redis_client.hgetall(cart_key)
+    return {k.decode('utf-8'): int(v) for k, v in raw_cart.items()}
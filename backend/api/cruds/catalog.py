@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import time
+from collections.abc import Callable
+
+from redis import Redis, RedisError
+from redis.asyncio import Redis as AsyncRedis
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models.table_models import Product
+
+
+logger = logging.getLogger('uvicorn')
+
+CATALOG_KEY: str = 'catalog'
+# Bumps running in the background, referenced until they finish.
+_bump_tasks: set[asyncio.Task] = set()
+
+
+def get_catalog_version(redis_client: Redis) -> tuple[int, float | None]:
+    """
+    Retrieve the version of the product catalog.
+
+    The version is a counter stored in Redis, incremented by `bump_catalog_version` whenever a
+    product is added, changed or deleted. It lets every instance tell whether catalog responses
+    it (or a CDN) has already produced are still current, without querying the database.
+
+    Parameters
+    ----------
+    redis_client : Redis
+        The Redis client instance to communicate with the Redis server.
+
+    Returns
+    -------
+    tuple[int, float | None]
+        The version (0 if the catalog was never bumped) and the time of the last change in seconds
+        since the epoch (None if unknown).
+    """
+    version, modified_at = redis_client.hmget(CATALOG_KEY, ['version', 'modified_at'])
+    return _parse_version(version, modified_at)
+
+
+async def get_catalog_version_async(redis_client: AsyncRedis) -> tuple[int, float | None]:
+    """Asynchronous version of `get_catalog_version`."""
+    version, modified_at = await redis_client.hmget(CATALOG_KEY, ['version', 'modified_at'])
+    return _parse_version(version, modified_at)
+
+
+def _parse_version(version: bytes | None, modified_at: bytes | None) -> tuple[int, float | None]:
+    return int(version or 0), float(modified_at) if modified_at is not None else None
+
+
+def bump_catalog_version(redis_client: Redis) -> int:
+    """
+    Increment the catalog version and record the time of the change.
+
+    Parameters
+    ----------
+    redis_client : Redis
+        The Redis client instance to communicate with the Redis server.
+
+    Returns
+    -------
+    int
+        The new version.
+    """
+    with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hincrby(CATALOG_KEY, 'version', 1)
+        pipe.hset(CATALOG_KEY, 'modified_at', time.time())
+        version, _ = pipe.execute()
+    return version
+
+
+async def bump_catalog_version_async(redis_client: AsyncRedis) -> int:
+    """Asynchronous version of `bump_catalog_version`."""
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hincrby(CATALOG_KEY, 'version', 1)
+        pipe.hset(CATALOG_KEY, 'modified_at', time.time())
+        version, _ = await pipe.execute()
+    return version
+
+
+async def _bump_logged_async(redis_client: AsyncRedis) -> None:
+    try:
+        await bump_catalog_version_async(redis_client)
+    except RedisError as e:
+        logger.warning(f'Could not bump the catalog version: {e}')
+
+
+def watch_product_changes(
+        get_redis_client: Callable[[], Redis],
+        get_async_redis_client: Callable[[], AsyncRedis | None],
+    ) -> None:
+    """
+    Bump the catalog version after every committed transaction that changed products through the ORM.
+
+    The listeners are registered on the `Session` class, so they also cover the sessions behind
+    `AsyncSession`. Those commits run the listener on the event loop, where the bump is handed to a
+    background task using the asynchronous client instead of blocking the loop. Products written
+    outside the ORM (e.g. bulk imports in SQL) must be followed by a manual `bump_catalog_version`
+    (see `bump_catalog_version.py`). A failed bump is logged and does not fail the request, since
+    the transaction is already committed.
+
+    Parameters
+    ----------
+    get_redis_client : Callable[[], Redis]
+        Returns the synchronous Redis client, used outside the event loop.
+    get_async_redis_client : Callable[[], AsyncRedis | None]
+        Returns the asynchronous Redis client of the app, or None before it is created.
+    """
+    @event.listens_for(Session, 'after_flush')
+    def _after_flush(session: Session, flush_context) -> None:
+        if any(isinstance(obj, Product) for obj in [*session.new, *session.dirty, *session.deleted]):
+            session.info['catalog_changed'] = True
+
+    @event.listens_for(Session, 'after_commit')
+    def _after_commit(session: Session) -> None:
+        if not session.info.pop('catalog_changed', False):
+            return
+        try:
+            loop: asyncio.AbstractEventLoop | None = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        async_redis_client: AsyncRedis | None = get_async_redis_client()
+        if loop is not None and async_redis_client is not None:
+            task: asyncio.Task = loop.create_task(_bump_logged_async(async_redis_client))
+            _bump_tasks.add(task)
+            task.add_done_callback(_bump_tasks.discard)
+            return
+        try:
+            bump_catalog_version(get_redis_client())
+        except RedisError as e:
+            logger.warning(f'Could not bump the catalog version: {e}')
+
+    @event.listens_for(Session, 'after_soft_rollback')
+    def _after_rollback(session: Session, previous_transaction) -> None:
+        session.info.pop('catalog_changed', None)
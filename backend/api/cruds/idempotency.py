@@ -0,0 +1,128 @@
+import json
+from typing import Any
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+
+
+IDEMPOTENCY_KEY_PREFIX: str = 'idempotency'
+PENDING: str = 'pending'
+COMPLETED: str = 'completed'
+
+
+def _redis_key(scope: str, key: str) -> str:
+    return f'{IDEMPOTENCY_KEY_PREFIX}:{scope}:{key}'
+
+
+def begin_idempotent_request(redis_client: Redis, scope: str, key: str, pending_ttl: int) -> dict[str, Any] | None:
+    """
+    Claim an idempotency key for a request, or return what is recorded for it.
+
+    The key is claimed with `SET NX`, so of several concurrent requests with the same key only one
+    proceeds. The claim expires after `pending_ttl` seconds, so a request that crashed before
+    completing does not block its key forever.
+
+    Parameters
+    ----------
+    redis_client : Redis
+        The Redis client instance to communicate with the Redis server.
+    scope : str
+        Namespace of the key, e.g. the operation and the user, so clients cannot collide.
+    key : str
+        The idempotency key sent by the client.
+    pending_ttl : int
+        How long the claim is held at most, in seconds.
+
+    Returns
+    -------
+    dict[str, Any] | None
+        None if the key was claimed and the request should proceed. Otherwise the record of the
+        key: `{'status': 'pending'}` while the first request is still running, or
+        `{'status': 'completed', 'status_code': ..., 'body': ...}` with its response.
+    """
+    redis_key: str = _redis_key(scope, key)
+    if redis_client.set(redis_key, json.dumps({'status': PENDING}), nx=True, ex=pending_ttl):
+        return None
+    return _parse_record(redis_client.get(redis_key))
+
+
+async def begin_idempotent_request_async(
+        redis_client: AsyncRedis,
+        scope: str,
+        key: str,
+        pending_ttl: int,
+    ) -> dict[str, Any] | None:
+    """Asynchronous version of `begin_idempotent_request`."""
+    redis_key: str = _redis_key(scope, key)
+    if await redis_client.set(redis_key, json.dumps({'status': PENDING}), nx=True, ex=pending_ttl):
+        return None
+    return _parse_record(await redis_client.get(redis_key))
+
+
+def _parse_record(raw: bytes | None) -> dict[str, Any]:
+    # The claim may have expired between SET NX and GET: report it as still pending, the client retries.
+    return json.loads(raw) if raw is not None else {'status': PENDING}
+
+
+def complete_idempotent_request(
+        redis_client: Redis,
+        scope: str,
+        key: str,
+        status_code: int,
+        body: Any,
+        ttl: int,
+    ) -> None:
+    """
+    Record the response of a claimed request, to be returned to retries with the same key.
+
+    Parameters
+    ----------
+    redis_client : Redis
+        The Redis client instance to communicate with the Redis server.
+    scope : str
+        Namespace of the key, as given to `begin_idempotent_request`.
+    key : str
+        The idempotency key sent by the client.
+    status_code : int
+        The HTTP status code of the response.
+    body : Any
+        The JSON-serializable body of the response.
+    ttl : int
+        How long the response is kept, in seconds.
+    """
+    record: str = json.dumps({'status': COMPLETED, 'status_code': status_code, 'body': body})
+    redis_client.set(_redis_key(scope, key), record, ex=ttl)
+
+
+async def complete_idempotent_request_async(
+        redis_client: AsyncRedis,
+        scope: str,
+        key: str,
+        status_code: int,
+        body: Any,
+        ttl: int,
+    ) -> None:
+    """Asynchronous version of `complete_idempotent_request`."""
+    record: str = json.dumps({'status': COMPLETED, 'status_code': status_code, 'body': body})
+    await redis_client.set(_redis_key(scope, key), record, ex=ttl)
+
+
+def abort_idempotent_request(redis_client: Redis, scope: str, key: str) -> None:
+    """
+    Release a claimed key after the request failed without side effects, so that it can be retried.
+
+    Parameters
+    ----------
+    redis_client : Redis
+        The Redis client instance to communicate with the Redis server.
+    scope : str
+        Namespace of the key, as given to `begin_idempotent_request`.
+    key : str
+        The idempotency key sent by the client.
+    """
+    redis_client.delete(_redis_key(scope, key))
+
+
+async def abort_idempotent_request_async(redis_client: AsyncRedis, scope: str, key: str) -> None:
+    """Asynchronous version of `abort_idempotent_request`."""
+    await redis_client.delete(_redis_key(scope, key))
@@ -0,0 +1,616 @@
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import ulid
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from sqlalchemy import delete, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql import Executable, Select, Update
+from sqlmodel import select, update, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from models.reqres_models import OrderItemCreate
+from models.table_models import Product, StockReconciliation
+from redis_script import RedisScript
+from ulid_time import ulid_lower_bound
+
+
+# Stock of a product: hash of `available` (units that can still be reserved) and `sold` (units sold
+# since the last reconciliation with `product.stock`). Products without this hash are not stock-limited.
+STOCK_KEY_PREFIX: str = 'stock'
+# Product IDs whose `sold` count has not been reconciled yet.
+STOCK_DIRTY_KEY: str = 'stock:dirty'
+# Product IDs whose stock hash was loaded, so that it can be deleted once they are no longer stock-limited.
+STOCK_PRODUCTS_KEY: str = 'stock:products'
+# Units sold being written to the database: hash of product ID -> units, taken from the `sold` counts
+# by one reconciliation round, whose ID is recorded in the same transaction as the `UPDATE`s.
+STOCK_RECONCILING_KEY: str = 'stock:reconciling'
+STOCK_RECONCILING_ROUND_KEY: str = 'stock:reconciling:round'
+# How long the IDs of the applied rounds are kept in the database. Only the round in Redis is ever
+# looked up, and it is never older than the next round, so this only has to outlast clock skew.
+RECONCILED_ROUND_RETENTION: timedelta = timedelta(days=1)
+# Reservation: hash of product ID -> reserved units. Its deadline is its score in the sorted set.
+RESERVATION_KEY_PREFIX: str = 'reservation'
+RESERVATION_DEADLINES_KEY: str = 'reservation:deadlines'
+
+# KEYS: reservation, deadlines. ARGV: reservation ID, deadline, then product ID and quantity pairs.
+# Reserves every quantity or none. Returns the IDs of the products lacking stock (empty on success).
+RESERVE_STOCK_SCRIPT = RedisScript("""
+local short = {}
+for i = 3, #ARGV, 2 do
+    local available = redis.call('HGET', 'stock:' .. ARGV[i], 'available')
+    if available and tonumber(available) < tonumber(ARGV[i + 1]) then
+        table.insert(short, ARGV[i])
+    end
+end
+if #short > 0 then
+    return short
+end
+for i = 3, #ARGV, 2 do
+    local stock_key = 'stock:' .. ARGV[i]
+    if redis.call('HEXISTS', stock_key, 'available') == 1 then
+        redis.call('HINCRBY', stock_key, 'available', -tonumber(ARGV[i + 1]))
+        redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+end
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+return short
+""")
+
+# KEYS: reservation, deadlines, dirty set. ARGV: reservation ID, then product ID and quantity pairs.
+# Returns what the reservation still held to the stock, then takes the ordered quantities as sold.
+# Returns 1 if the reservation was still live, 0 if it had already expired (the units are taken anyway).
+COMMIT_RESERVATION_SCRIPT = RedisScript("""
+local live = redis.call('ZREM', KEYS[2], ARGV[1]) == 1
+if live then
+    local held = redis.call('HGETALL', KEYS[1])
+    for i = 1, #held, 2 do
+        local stock_key = 'stock:' .. held[i]
+        if redis.call('HEXISTS', stock_key, 'available') == 1 then
+            redis.call('HINCRBY', stock_key, 'available', held[i + 1])
+        end
+    end
+end
+for i = 2, #ARGV, 2 do
+    local stock_key = 'stock:' .. ARGV[i]
+    if redis.call('HEXISTS', stock_key, 'available') == 1 then
+        redis.call('HINCRBY', stock_key, 'available', -tonumber(ARGV[i + 1]))
+        redis.call('HINCRBY', stock_key, 'sold', ARGV[i + 1])
+        redis.call('SADD', KEYS[3], ARGV[i])
+    end
+end
+redis.call('DEL', KEYS[1])
+return live and 1 or 0
+""")
+
+# KEYS: deadlines. ARGV: reservation IDs. Returns the units held by the reservations to the stock
+# (unless the product is no longer stock-limited).
+RELEASE_RESERVATIONS_SCRIPT = RedisScript("""
+local released = 0
+for _, reservation_id in ipairs(ARGV) do
+    if redis.call('ZREM', KEYS[1], reservation_id) == 1 then
+        local reservation_key = 'reservation:' .. reservation_id
+        local held = redis.call('HGETALL', reservation_key)
+        for i = 1, #held, 2 do
+            local stock_key = 'stock:' .. held[i]
+            if redis.call('HEXISTS', stock_key, 'available') == 1 then
+                redis.call('HINCRBY', stock_key, 'available', held[i + 1])
+            end
+        end
+        redis.call('DEL', reservation_key)
+        released = released + 1
+    end
+end
+return released
+""")
+
+# KEYS: stock, dirty set. ARGV: product ID, units to add (negative to remove).
+# Changes the available units, and records the change as negative sales for `reconcile_stock` to
+# write to the database. Returns the new available units, or nil if the product is not loaded.
+ADJUST_STOCK_SCRIPT = RedisScript("""
+if redis.call('HEXISTS', KEYS[1], 'available') == 0 then
+    return false
+end
+redis.call('HINCRBY', KEYS[1], 'sold', -tonumber(ARGV[2]))
+redis.call('SADD', KEYS[2], ARGV[1])
+return redis.call('HINCRBY', KEYS[1], 'available', ARGV[2])
+""")
+
+# KEYS: reconciling hash, its round ID, dirty set. ARGV: ID for a new round.
+# Moves the sold counts of the dirty products into the reconciling hash under a new round, unless a
+# previous round is still there. Returns the round ID and its product ID and units pairs (empty if none).
+TAKE_SOLD_SCRIPT = RedisScript("""
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    for _, product_id in ipairs(redis.call('SMEMBERS', KEYS[3])) do
+        local stock_key = 'stock:' .. product_id
+        local sold = tonumber(redis.call('HGET', stock_key, 'sold') or '0')
+        if sold ~= 0 then
+            redis.call('HINCRBY', KEYS[1], product_id, sold)
+            redis.call('HSET', stock_key, 'sold', 0)
+        end
+    end
+    redis.call('DEL', KEYS[3])
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return {false, {}}
+    end
+    redis.call('SET', KEYS[2], ARGV[1])
+end
+return {redis.call('GET', KEYS[2]), redis.call('HGETALL', KEYS[1])}
+""")
+
+# KEYS: reconciling hash, its round ID. ARGV: round ID. Deletes the round once it is in the database,
+# unless another instance already did (and started the next one).
+FINISH_ROUND_SCRIPT = RedisScript("""
+if redis.call('GET', KEYS[2]) == ARGV[1] then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return 1
+end
+return 0
+""")
+
+
+def _stock_key(product_id: str) -> str:
+    return f'{STOCK_KEY_PREFIX}:{product_id}'
+
+
+def _reservation_key(reservation_id: str) -> str:
+    return f'{RESERVATION_KEY_PREFIX}:{reservation_id}'
+
+
+def _quantity_args(order_items: list[OrderItemCreate]) -> list[str | int]:
+    # A product listed twice must be checked against its total quantity.
+    quantities: Counter[str] = Counter()
+    for order_item in order_items:
+        if order_item.quantity <= 0:
+            raise ValueError('Quantities must be positive')
+        quantities[order_item.product_id] += order_item.quantity
+    return [arg for product_id, quantity in quantities.items() for arg in (product_id, quantity)]
+
+
+def reserve_stock(
+        redis_client: Redis,
+        reservation_id: str,
+        order_items: list[OrderItemCreate],
+        ttl: float,
+    ) -> list[str]:
+    """
+    Reserve the stock of the ordered products, all or nothing, until the reservation is committed,
+    released or expires.
+
+    The check and the decrement of every product run in one Lua script, so concurrent reservations
+    of the same product are serialized by Redis and can never take more units than available,
+    without any row lock in the database. Products without stock in Redis are not limited.
+    Reserving again under the same ID adds to the reservation and moves its deadline.
+
+    Parameters
+    ----------
+    redis_client : Redis
+        The Redis client instance to communicate with the Redis server.
+    reservation_id : str
+        Identifies the reservation, e.g. a checkout or a cart.
+    order_items : list[OrderItemCreate]
+        The products and quantities to reserve.
+    ttl : float
+        Seconds after which the reservation is released by `release_expired_reservations`.
+
+    Returns
+    -------
+    list[str]
+        The IDs of the products lacking stock. Nothing is reserved unless it is empty.
+
+    Raises
+    ------
+    ValueError
+        If a quantity is not positive.
+    """
+    short: list[bytes] = RESERVE_STOCK_SCRIPT.run(
+        redis_client,
+        keys=[_reservation_key(reservation_id), RESERVATION_DEADLINES_KEY],
+        args=[reservation_id, time.time() + ttl, *_quantity_args(order_items)])
+    return [product_id.decode('utf-8') for product_id in short]
+
+
+async def reserve_stock_async(
+        redis_client: AsyncRedis,
+        reservation_id: str,
+        order_items: list[OrderItemCreate],
+        ttl: float,
+    ) -> list[str]:
+    """Asynchronous version of `reserve_stock`."""
+    short: list[bytes] = await RESERVE_STOCK_SCRIPT.run_async(
+        redis_client,
+        keys=[_reservation_key(reservation_id), RESERVATION_DEADLINES_KEY],
+        args=[reservation_id, time.time() + ttl, *_quantity_args(order_items)])
+    return [product_id.decode('utf-8') for product_id in short]
+
+
+def commit_reservation(redis_client: Redis, reservation_id: str, order_items: list[OrderItemCreate]) -> bool:
+    """
+    Turn a reservation into sold units once the order is stored.
+
+    The units sold are recorded for `reconcile_stock`. If the reservation expired in the meantime,
+    the units are taken from the stock anyway (which may then go below zero), so that the counts
+    always match the orders.
+
+    Parameters
+    ----------
+    redis_client : Redis
+        The Redis client instance to communicate with the Redis server.
+    reservation_id : str
+        The ID given to `reserve_stock`.
+    order_items : list[OrderItemCreate]
+        The products and quantities actually ordered.
+
+    Returns
+    -------
+    bool
+        Whether the reservation was still live.
+    """
+    live: int = COMMIT_RESERVATION_SCRIPT.run(
+        redis_client,
+        keys=[_reservation_key(reservation_id), RESERVATION_DEADLINES_KEY, STOCK_DIRTY_KEY],
+        args=[reservation_id, *_quantity_args(order_items)])
+    return bool(live)
+
+
+async def commit_reservation_async(
+        redis_client: AsyncRedis,
+        reservation_id: str,
+        order_items: list[OrderItemCreate],
+    ) -> bool:
+    """Asynchronous version of `commit_reservation`."""
+    live: int = await COMMIT_RESERVATION_SCRIPT.run_async(
+        redis_client,
+        keys=[_reservation_key(reservation_id), RESERVATION_DEADLINES_KEY, STOCK_DIRTY_KEY],
+        args=[reservation_id, *_quantity_args(order_items)])
+    return bool(live)
+
+
+def release_reservation(redis_client: Redis, reservation_id: str) -> bool:
+    """
+    Give the units of a reservation back to the stock, e.g. when the order could not be stored.
+
+    Parameters
+    ----------
+    redis_client : Redis
+        The Redis client instance to communicate with the Redis server.
+    reservation_id : str
+        The ID given to `reserve_stock`.
+
+    Returns
+    -------
+    bool
+        Whether the reservation was still live.
+    """
+    return bool(RELEASE_RESERVATIONS_SCRIPT.run(redis_client, keys=[RESERVATION_DEADLINES_KEY], args=[reservation_id]))
+
+
+async def release_reservation_async(redis_client: AsyncRedis, reservation_id: str) -> bool:
+    """Asynchronous version of `release_reservation`."""
+    released: int = await RELEASE_RESERVATIONS_SCRIPT.run_async(
+        redis_client, keys=[RESERVATION_DEADLINES_KEY], args=[reservation_id])
+    return bool(released)
+
+
+def release_expired_reservations(redis_client: Redis, now: float, batch_size: int = 500) -> int:
+    """
+    Release the reservations whose deadline has passed.
+
+    Parameters
+    ----------
+    redis_client : Redis
+        The Redis client instance to communicate with the Redis server.
+    now : float
+        The current time in seconds since the epoch.
+    batch_size : int, optional
+        The maximum number of reservations released. Default is 500.
+
+    Returns
+    -------
+    int
+        The number of reservations released.
+    """
+    expired: list[bytes] = redis_client.zrangebyscore(RESERVATION_DEADLINES_KEY, '-inf', now, start=0, num=batch_size)
+    if not expired:
+        return 0
+    return RELEASE_RESERVATIONS_SCRIPT.run(redis_client, keys=[RESERVATION_DEADLINES_KEY], args=expired)
+
+
+async def release_expired_reservations_async(redis_client: AsyncRedis, now: float, batch_size: int = 500) -> int:
+    """Asynchronous version of `release_expired_reservations`."""
+    expired: list[bytes] = await redis_client.zrangebyscore(
+        RESERVATION_DEADLINES_KEY, '-inf', now, start=0, num=batch_size)
+    if not expired:
+        return 0
+    return await RELEASE_RESERVATIONS_SCRIPT.run_async(redis_client, keys=[RESERVATION_DEADLINES_KEY], args=expired)
+
+
+def get_available_stock(redis_client: Redis, product_id: str) -> int | None:
+    """
+    Retrieve the number of units of a product that can still be reserved.
+
+    Parameters
+    ----------
+    redis_client : Redis
+        The Redis client instance to communicate with the Redis server.
+    product_id : str
+        The ID of the product.
+
+    Returns
+    -------
+    int | None
+        The available units, or None if the product is not stock-limited (or not loaded yet).
+    """
+    available: bytes | None = redis_client.hget(_stock_key(product_id), 'available')
+    return int(available) if available is not None else None
+
+
+async def get_available_stock_async(redis_client: AsyncRedis, product_id: str) -> int | None:
+    """Asynchronous version of `get_available_stock`."""
+    available: bytes | None = await redis_client.hget(_stock_key(product_id), 'available')
+    return int(available) if available is not None else None
+
+
+def load_stock(session: Session, redis_client: Redis) -> int:
+    """
+    Copy the stock of the products that have one from the database to Redis, unless already there,
+    and delete the stock of the products that are no longer stock-limited.
+
+    Counts already in Redis are never overwritten, since they include reservations and sales the
+    database does not know about yet. Use `adjust_stock` to restock a product.
+
+    Parameters
+    ----------
+    session : Session
+        The database session instance.
+    redis_client : Redis
+        The Redis client instance to communicate with the Redis server.
+
+    Returns
+    -------
+    int
+        The number of products newly loaded.
+    """
+    # Read before the query: a product loaded afterwards is stock-limited and must not be taken as stale.
+    loaded: set[bytes] = redis_client.smembers(STOCK_PRODUCTS_KEY)
+    stocks: list[tuple[str, int]] = session.exec(_stocked_products_query()).all()
+    with redis_client.pipeline(transaction=False) as pipe:
+        return _newly_loaded(_load_pipeline(pipe, loaded, stocks).execute(), len(stocks))
+
+
+async def load_stock_async(session: AsyncSession, redis_client: AsyncRedis) -> int:
+    """Asynchronous version of `load_stock`."""
+    loaded: set[bytes] = await redis_client.smembers(STOCK_PRODUCTS_KEY)
+    stocks: list[tuple[str, int]] = (await session.exec(_stocked_products_query())).all()
+    async with redis_client.pipeline(transaction=False) as pipe:
+        return _newly_loaded(await _load_pipeline(pipe, loaded, stocks).execute(), len(stocks))
+
+
+def _load_pipeline(pipe, loaded: set[bytes], stocks: list[tuple[str, int]]):
+    for product_id, stock in stocks:
+        pipe.hsetnx(_stock_key(product_id), 'available', stock)
+        pipe.sadd(STOCK_PRODUCTS_KEY, product_id)
+    stale: set[str] = {product_id.decode('utf-8') for product_id in loaded} - {product_id for product_id, _ in stocks}
+    for product_id in stale:
+        _unload_pipeline(pipe, product_id)
+    return pipe
+
+
+def _unload_pipeline(pipe, product_id: str):
+    pipe.delete(_stock_key(product_id))
+    pipe.srem(STOCK_PRODUCTS_KEY, product_id)
+    pipe.srem(STOCK_DIRTY_KEY, product_id)
+    return pipe
+
+
+def _newly_loaded(results: list, count: int) -> int:
+    # The `HSETNX` replies come first, every other one.
+    return sum(results[0:2 * count:2])
+
+
+def adjust_stock(session: Session, redis_client: Redis, product_id: str, units: int) -> int:
+    """
+    Add units to the stock of a product, e.g. when it is restocked, or remove some.
+
+    The units are added in Redis at once, where they can be reserved right away, and written to
+    `product.stock` by the next `reconcile_stock` as negative sales, so a restock racing with orders
+    or with a reconciliation is neither lost nor applied twice. A product not loaded into Redis yet
+    is loaded first.
+
+    Parameters
+    ----------
+    session : Session
+        The database session instance.
+    redis_client : Redis
+        The Redis client instance to communicate with the Redis server.
+    product_id : str
+        The ID of the product.
+    units : int
+        The units to add, negative to remove.
+
+    Returns
+    -------
+    int
+        The units now available.
+
+    Raises
+    ------
+    ValueError
+        If the product does not exist or is not stock-limited (see `set_stock_limit`).
+    """
+    available: int | None = ADJUST_STOCK_SCRIPT.run(
+        redis_client, keys=[_stock_key(product_id), STOCK_DIRTY_KEY], args=[product_id, units])
+    if available is None:
+        stock: int | None = session.exec(select(Product.stock).where(Product.id == product_id)).first()
+        if stock is None:
+            raise ValueError(f'Product {product_id} is not stock-limited')
+        with redis_client.pipeline(transaction=True) as pipe:
+            pipe.hsetnx(_stock_key(product_id), 'available', stock)
+            pipe.sadd(STOCK_PRODUCTS_KEY, product_id)
+            pipe.execute()
+        available = ADJUST_STOCK_SCRIPT.run(
+            redis_client, keys=[_stock_key(product_id), STOCK_DIRTY_KEY], args=[product_id, units])
+    return available
+
+
+async def adjust_stock_async(session: AsyncSession, redis_client: AsyncRedis, product_id: str, units: int) -> int:
+    """Asynchronous version of `adjust_stock`."""
+    available: int | None = await ADJUST_STOCK_SCRIPT.run_async(
+        redis_client, keys=[_stock_key(product_id), STOCK_DIRTY_KEY], args=[product_id, units])
+    if available is None:
+        stock: int | None = (await session.exec(select(Product.stock).where(Product.id == product_id))).first()
+        if stock is None:
+            raise ValueError(f'Product {product_id} is not stock-limited')
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.hsetnx(_stock_key(product_id), 'available', stock)
+            pipe.sadd(STOCK_PRODUCTS_KEY, product_id)
+            await pipe.execute()
+        available = await ADJUST_STOCK_SCRIPT.run_async(
+            redis_client, keys=[_stock_key(product_id), STOCK_DIRTY_KEY], args=[product_id, units])
+    return available
+
+
+def set_stock_limit(session: Session, redis_client: Redis, product_id: str, stock: int | None) -> None:
+    """
+    Make a product stock-limited with an initial stock, or no longer stock-limited.
+
+    Only the transition is handled here: the stock of a product that is already limited can only
+    be changed with `adjust_stock`, since `product.stock` lags behind the counts in Redis. The counts
+    in Redis are replaced after the commit; if that fails, `load_stock` loads or deletes them on
+    its next round.
+
+    Parameters
+    ----------
+    session : Session
+        The database session instance.
+    redis_client : Redis
+        The Redis client instance to communicate with the Redis server.
+    product_id : str
+        The ID of the product.
+    stock : int | None
+        The initial stock, or None to stop limiting the product.
+
+    Raises
+    ------
+    ValueError
+        If the product does not exist, or already has a stock and `stock` is not None.
+    """
+    product: Product | None = session.get(Product, product_id)
+    if product is None:
+        raise ValueError(f'Product {product_id} does not exist')
+    if stock is not None and product.stock is not None:
+        raise ValueError(f'Product {product_id} is already stock-limited, use adjust_stock')
+    product.stock = stock
+    session.add(product)
+    session.commit()
+    with redis_client.pipeline(transaction=True) as pipe:
+        # Counts left over from an earlier limit are stale.
+        _unload_pipeline(pipe, product_id)
+        if stock is not None:
+            pipe.hset(_stock_key(product_id), 'available', stock)
+            pipe.sadd(STOCK_PRODUCTS_KEY, product_id)
+        pipe.execute()
+
+
+def _stocked_products_query() -> Select:
+    return select(Product.id, Product.stock).where(Product.stock.is_not(None))
+
+
+def reconcile_stock(session: Session, redis_client: Redis) -> int:
+    """
+    Subtract the units sold since the last reconciliation from `product.stock`.
+
+    The sold counts are moved atomically from the stock hashes to a reconciliation round in Redis,
+    and written with one relative `UPDATE` per product, so the database only sees one small write
+    per product and round instead of one per order. The round ID is inserted in the same transaction,
+    and the round is deleted from Redis only after the commit. A round left over by a failed write or
+    by a crash is therefore finished by the next call (on any instance) before new sales are taken,
+    and is applied exactly once: it is skipped if its ID is already in the database.
+
+    Parameters
+    ----------
+    session : Session
+        The database session instance.
+    redis_client : Redis
+        The Redis client instance to communicate with the Redis server.
+
+    Returns
+    -------
+    int
+        The number of units written to the database.
+    """
+    round_id, sold = _parse_round(TAKE_SOLD_SCRIPT.run(
+        redis_client, keys=[STOCK_RECONCILING_KEY, STOCK_RECONCILING_ROUND_KEY, STOCK_DIRTY_KEY],
+        args=[str(ulid.new())]))
+    if round_id is None:
+        return 0
+    if session.exec(_round_query(round_id)).first() is None:
+        try:
+            for statement in _reconcile_statements(round_id, sold):
+                session.execute(statement)
+            session.commit()
+        except IntegrityError:
+            # Another instance applied the same round first.
+            session.rollback()
+            sold = {}
+        except Exception:
+            session.rollback()
+            raise
+    else:
+        sold = {}
+    FINISH_ROUND_SCRIPT.run(redis_client, keys=[STOCK_RECONCILING_KEY, STOCK_RECONCILING_ROUND_KEY], args=[round_id])
+    return sum(sold.values())
+
+
+async def reconcile_stock_async(session: AsyncSession, redis_client: AsyncRedis) -> int:
+    """Asynchronous version of `reconcile_stock`."""
+    round_id, sold = _parse_round(await TAKE_SOLD_SCRIPT.run_async(
+        redis_client, keys=[STOCK_RECONCILING_KEY, STOCK_RECONCILING_ROUND_KEY, STOCK_DIRTY_KEY],
+        args=[str(ulid.new())]))
+    if round_id is None:
+        return 0
+    if (await session.exec(_round_query(round_id))).first() is None:
+        try:
+            for statement in _reconcile_statements(round_id, sold):
+                await session.execute(statement)
+            await session.commit()
+        except IntegrityError:
+            # Another instance applied the same round first.
+            await session.rollback()
+            sold = {}
+        except Exception:
+            await session.rollback()
+            raise
+    else:
+        sold = {}
+    await FINISH_ROUND_SCRIPT.run_async(
+        redis_client, keys=[STOCK_RECONCILING_KEY, STOCK_RECONCILING_ROUND_KEY], args=[round_id])
+    return sum(sold.values())
+
+
+def _parse_round(result: list) -> tuple[str | None, dict[str, int]]:
+    raw_round_id, pairs = result
+    if raw_round_id is None:
+        return None, {}
+    sold: dict[str, int] = {
+        pairs[i].decode('utf-8'): int(pairs[i + 1]) for i in range(0, len(pairs), 2)}
+    return raw_round_id.decode('utf-8'), sold
+
+
+def _round_query(round_id: str) -> Select:
+    return select(StockReconciliation.id).where(StockReconciliation.id == round_id)
+
+
+def _reconcile_statements(round_id: str, sold: dict[str, int]) -> list[Executable]:
+    expired_before: str = ulid_lower_bound(datetime.now() - RECONCILED_ROUND_RETENTION)
+    return [
+        *(_decrement_stock_statement(product_id, units) for product_id, units in sold.items()),
+        insert(StockReconciliation).values(id=round_id),
+        delete(StockReconciliation).where(StockReconciliation.id < expired_before),
+    ]
+
+
+def _decrement_stock_statement(product_id: str, units: int) -> Update:
+    return update(Product).where(Product.id == product_id).values(stock=Product.stock - units)
@@ -1,8 +1,14 @@
-from sqlmodel import select, Session
-from sqlalchemy.orm import joinedload
+from datetime import datetime
 
-from models.table_models import Order, OrderItem, User
-from models.reqres_models import OrderItemCreate
+import ulid
+from sqlmodel import func, select, Session, insert
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy.sql import Insert, Select
+
+from models.table_models import Order, OrderItem, Product, User
+from models.reqres_models import OrderItemCreate, ProductRead
+from ulid_time import ulid_lower_bound
 
 def create_order(session: Session, user_id: str) -> Order:
     """
@@ -53,10 +59,250 @@ def create_order_item(session: Session, order_id: str, order_item: OrderItemCrea
     session.refresh(db_order_item)
     return db_order_item
 
-def read_user_orders(session: Session, user_id: str):
+def create_order_with_items(session: Session, user_id: str, order_items: list[OrderItemCreate]) -> Order:
+    """
+    Create an order and all of its order items in a single transaction.
+
+    Every referenced product is checked with one `IN` query, then the order row and all
+    order item rows are written with multi-row inserts and committed once. Either the whole
+    order is stored or nothing is.
+
+    Parameters
+    ----------
+    session : Session
+        The database session instance.
+    user_id : str
+        The ID of the user for whom the order is to be created.
+    order_items : list[OrderItemCreate]
+        The items to be added to the order.
+
+    Returns
+    -------
+    Order
+        The created order instance, with its `order_items` populated.
+
+    Raises
+    ------
+    ValueError
+        If `order_items` is empty, has a non-positive quantity or references products that do not exist.
+    """
+    db_order: Order = prepare_order(session=session, user_id=user_id, order_items=order_items)
+
+    try:
+        for statement in _order_inserts([db_order]):
+            session.execute(statement)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return db_order
+
+async def create_order_with_items_async(
+        session: AsyncSession,
+        user_id: str,
+        order_items: list[OrderItemCreate],
+    ) -> Order:
+    """Asynchronous version of `create_order_with_items`."""
+    db_order: Order = await prepare_order_async(session=session, user_id=user_id, order_items=order_items)
+
+    try:
+        for statement in _order_inserts([db_order]):
+            await session.execute(statement)
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    return db_order
+
+def prepare_order(session: Session, user_id: str, order_items: list[OrderItemCreate]) -> Order:
+    """
+    Check the items of an order and build it, with its ULIDs, without writing it.
+
+    Every referenced product is checked, and its current price read, with one `IN` query. The
+    prices are recorded on the order items, and the item count and total on the order.
+
+    Parameters
+    ----------
+    session : Session
+        The database session instance.
+    user_id : str
+        The ID of the user for whom the order is to be created.
+    order_items : list[OrderItemCreate]
+        The items to be added to the order.
+
+    Returns
+    -------
+    Order
+        The order instance, not added to the session, with its `order_items`, `item_count` and `total` populated.
+
+    Raises
+    ------
+    ValueError
+        If `order_items` is empty, has a non-positive quantity or references products that do not exist.
+    """
+    if not order_items:
+        raise ValueError('Order must contain at least one item')
+
+    product_ids: set[str] = {order_item.product_id for order_item in order_items}
+    prices: dict[str, float] = dict(session.exec(_product_prices_query(product_ids)).all())
+    return _build_order(user_id, order_items, product_ids, prices)
+
+async def prepare_order_async(session: AsyncSession, user_id: str, order_items: list[OrderItemCreate]) -> Order:
+    """Asynchronous version of `prepare_order`."""
+    if not order_items:
+        raise ValueError('Order must contain at least one item')
+
+    product_ids: set[str] = {order_item.product_id for order_item in order_items}
+    prices: dict[str, float] = dict((await session.exec(_product_prices_query(product_ids))).all())
+    return _build_order(user_id, order_items, product_ids, prices)
+
+def _product_prices_query(product_ids: set[str]) -> Select:
+    return select(Product.id, Product.price).where(Product.id.in_(product_ids))
+
+def _build_order(
+        user_id: str,
+        order_items: list[OrderItemCreate],
+        product_ids: set[str],
+        prices: dict[str, float],
+    ) -> Order:
+    """Check that every product exists and build the order at the current prices."""
+    if any(order_item.quantity <= 0 for order_item in order_items):
+        raise ValueError('Quantities must be positive')
+    missing_ids: list[str] = sorted(product_ids - prices.keys())
+    if missing_ids:
+        raise ValueError(f'Products not found: {", ".join(missing_ids)}')
+
+    db_order: Order = Order(
+        id=str(ulid.new()),
+        user_id=user_id,
+        item_count=sum(order_item.quantity for order_item in order_items),
+        total=sum(order_item.quantity * prices[order_item.product_id] for order_item in order_items))
+    # The rows are written with Core inserts, so these instances are never added to a session.
+    db_order.order_items = [
+        OrderItem(
+            id=str(ulid.new()),
+            order_id=db_order.id,
+            product_id=order_item.product_id,
+            quantity=order_item.quantity,
+            unit_price=prices[order_item.product_id])
+        for order_item in order_items]
+    return db_order
+
+def _order_inserts(orders: list[Order]) -> list[Insert]:
+    """Build the multi-row inserts writing the orders and all of their order items."""
+    return [
+        insert(Order).values([
+            {'id': order.id, 'user_id': order.user_id, 'item_count': order.item_count, 'total': order.total}
+            for order in orders]),
+        insert(OrderItem).values([
+            {
+                'id': order_item.id,
+                'order_id': order_item.order_id,
+                'product_id': order_item.product_id,
+                'quantity': order_item.quantity,
+                'unit_price': order_item.unit_price,
+            }
+            for order in orders
+            for order_item in order.order_items]),
+    ]
+
+def save_orders(session: Session, orders: list[Order]) -> int:
+    """
+    Write prepared orders and their order items in one transaction, skipping those already stored.
+
+    Orders are identified by their ULID, so writing the same order again is a no-op: a batch
+    delivered twice by the write-behind stream stores every order once.
+
+    Parameters
+    ----------
+    session : Session
+        The database session instance.
+    orders : list[Order]
+        Orders built by `prepare_order`, with their `order_items` populated.
+
+    Returns
+    -------
+    int
+        The number of orders written.
+    """
+    if not orders:
+        return 0
+    stored_ids: set[str] = set(session.exec(_stored_orders_query({order.id for order in orders})).all())
+    new_orders: list[Order] = _unique_new_orders(orders, stored_ids)
+    if not new_orders:
+        return 0
+
+    try:
+        for statement in _order_inserts(new_orders):
+            session.execute(statement)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return len(new_orders)
+
+async def save_orders_async(session: AsyncSession, orders: list[Order]) -> int:
+    """Asynchronous version of `save_orders`."""
+    if not orders:
+        return 0
+    stored_ids: set[str] = set((await session.exec(_stored_orders_query({order.id for order in orders}))).all())
+    new_orders: list[Order] = _unique_new_orders(orders, stored_ids)
+    if not new_orders:
+        return 0
+
+    try:
+        for statement in _order_inserts(new_orders):
+            await session.execute(statement)
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    return len(new_orders)
+
+def read_stored_order_ids(session: Session, order_ids: set[str]) -> set[str]:
+    """
+    Tell which orders are written to the database, e.g. among the queued write-behind orders.
+
+    Parameters
+    ----------
+    session : Session
+        The database session instance.
+    order_ids : set[str]
+        The IDs of the orders to look up.
+
+    Returns
+    -------
+    set[str]
+        The IDs of the orders that are stored.
+    """
+    if not order_ids:
+        return set()
+    return set(session.exec(_stored_orders_query(order_ids)).all())
+
+async def read_stored_order_ids_async(session: AsyncSession, order_ids: set[str]) -> set[str]:
+    """Asynchronous version of `read_stored_order_ids`."""
+    if not order_ids:
+        return set()
+    return set((await session.exec(_stored_orders_query(order_ids))).all())
+
+def _stored_orders_query(order_ids: set[str]) -> Select:
+    return select(Order.id).where(Order.id.in_(order_ids))
+
+def _unique_new_orders(orders: list[Order], stored_ids: set[str]) -> list[Order]:
+    # A batch may hold the same order twice when a redelivery overtakes the original.
+    new_orders: dict[str, Order] = {}
+    for order in orders:
+        if order.id not in stored_ids:
+            new_orders.setdefault(order.id, order)
+    return list(new_orders.values())
+
+def read_user_orders(session: Session, user_id: str) -> User | None:
     """
     Retrieve the orders associated with a specific user.
 
+    Orders, their order items and the ordered products are loaded eagerly with `selectinload`,
+    so the whole history is fetched in four statements however many orders the user has.
+
     Parameters
     ----------
     session : Session
@@ -66,19 +312,175 @@ def read_user_orders(session: Session, user_id: str):
 
     Returns
     -------
-    User
-        The user instance with associated orders. (Note: In the provided code, orders and related 
-        data are not eagerly loaded. You may need to uncomment the "joinedload" lines for complete data).
+    User | None
+        The user instance with associated orders, or None if the user does not exist.
     """
-    query = (
+    user = session.exec(_user_orders_query(user_id)).first()
+    return user
+
+async def read_user_orders_async(session: AsyncSession, user_id: str) -> User | None:
+    """Asynchronous version of `read_user_orders`."""
+    user = (await session.exec(_user_orders_query(user_id))).first()
+    return user
+
+def _user_orders_query(user_id: str) -> Select:
+    return (
         select(User)
         .where(User.id == user_id)
-        # .options(
-        #     joinedload(User.orders)
-        #     .joinedload(Order.order_items)
-        #     .joinedload(OrderItem.product)
-        # )
+        .options(
+            selectinload(User.orders)
+            .selectinload(Order.order_items)
+            .selectinload(OrderItem.product)
+        )
     )
-    
-    user = session.exec(query).first()
-    return user
+
+def read_user_order_page(
+        session: Session,
+        user_id: str,
+        cursor: str | None = None,
+        limit: int = 20,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> tuple[list[Order], str | None]:
+    """
+    Retrieve one page of a user's orders, newest first, using the order ULID as a cursor.
+
+    ULIDs sort by creation time, so seeking with `Order.id < cursor` walks the history
+    backwards through the `(user_id, id)` index without counting or skipping rows. A date range
+    is turned into ULID bounds the same way, so it narrows that index scan instead of filtering
+    loaded orders. Order items and their products are loaded with `selectinload`, so a page
+    always costs three statements.
+
+    Parameters
+    ----------
+    session : Session
+        The database session instance.
+    user_id : str
+        The ID of the user whose orders are to be retrieved.
+    cursor : str | None, optional
+        The ID of the last order of the previous page. Default is None (the newest orders).
+    limit : int, optional
+        The maximum number of orders to retrieve. Default is 20.
+    start : datetime | None, optional
+        Only orders placed at or after this time. Default is None (no lower bound).
+    end : datetime | None, optional
+        Only orders placed before this time. Default is None (no upper bound).
+
+    Returns
+    -------
+    tuple[list[Order], str | None]
+        The orders of the page and the cursor of the next page, or None if this is the last page.
+
+    Raises
+    ------
+    ValueError
+        If `start` or `end` is out of the range of ULID timestamps.
+    """
+    orders: list[Order] = session.exec(_user_order_page_query(user_id, cursor, limit, start, end)).all()
+    return _split_order_page(orders, limit)
+
+async def read_user_order_page_async(
+        session: AsyncSession,
+        user_id: str,
+        cursor: str | None = None,
+        limit: int = 20,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> tuple[list[Order], str | None]:
+    """Asynchronous version of `read_user_order_page`."""
+    orders: list[Order] = (await session.exec(_user_order_page_query(user_id, cursor, limit, start, end))).all()
+    return _split_order_page(orders, limit)
+
+def _user_order_page_query(
+        user_id: str,
+        cursor: str | None,
+        limit: int,
+        start: datetime | None,
+        end: datetime | None,
+    ) -> Select:
+    # One extra row tells whether there is a next page. Of the products, only the columns of
+    # `ProductRead` are loaded, as that is all the order history returns.
+    query = (
+        select(Order)
+        .where(Order.user_id == user_id)
+        .order_by(Order.id.desc())
+        .limit(limit + 1)
+        .options(
+            selectinload(Order.order_items)
+            .selectinload(OrderItem.product)
+            .load_only(*(getattr(Product, field) for field in ProductRead.__fields__))
+        )
+    )
+    if cursor is not None:
+        query = query.where(Order.id < cursor)
+    return _in_date_range(query, start, end)
+
+def _in_date_range(query: Select, start: datetime | None, end: datetime | None) -> Select:
+    # ULIDs sort by creation time, so a date range is a range of order IDs.
+    if start is not None:
+        query = query.where(Order.id >= ulid_lower_bound(start))
+    if end is not None:
+        query = query.where(Order.id < ulid_lower_bound(end))
+    return query
+
+def _split_order_page(orders: list[Order], limit: int) -> tuple[list[Order], str | None]:
+    if len(orders) > limit:
+        orders = orders[:limit]
+        return orders, orders[-1].id
+    return orders, None
+
+def read_user_spend(
+        session: Session,
+        user_id: str,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> tuple[int, int, float]:
+    """
+    Sum up a user's orders from their precomputed item counts and totals.
+
+    Only the `order` table is read, through the `(user_id, id)` index, so no order item or
+    product is loaded however long the history is.
+
+    Parameters
+    ----------
+    session : Session
+        The database session instance.
+    user_id : str
+        The ID of the user whose orders are to be summed up.
+    start : datetime | None, optional
+        Only orders placed at or after this time. Default is None (no lower bound).
+    end : datetime | None, optional
+        Only orders placed before this time. Default is None (no upper bound).
+
+    Returns
+    -------
+    tuple[int, int, float]
+        The number of orders, the number of items ordered and the amount spent.
+
+    Raises
+    ------
+    ValueError
+        If `start` or `end` is out of the range of ULID timestamps.
+    """
+    order_count, item_count, total = session.exec(_user_spend_query(user_id, start, end)).one()
+    return order_count, item_count, total
+
+async def read_user_spend_async(
+        session: AsyncSession,
+        user_id: str,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> tuple[int, int, float]:
+    """Asynchronous version of `read_user_spend`."""
+    order_count, item_count, total = (await session.exec(_user_spend_query(user_id, start, end))).one()
+    return order_count, item_count, total
+
+def _user_spend_query(user_id: str, start: datetime | None, end: datetime | None) -> Select:
+    query = (
+        select(
+            func.count(Order.id),
+            func.coalesce(func.sum(Order.item_count), 0),
+            func.coalesce(func.sum(Order.total), 0.0))
+        .where(Order.user_id == user_id)
+    )
+    return _in_date_range(query, start, end)
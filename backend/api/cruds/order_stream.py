@@ -0,0 +1,282 @@
+import json
+
+from redis import ResponseError
+from redis.asyncio import Redis as AsyncRedis
+
+from models.table_models import Order, OrderItem
+
+
+# Stream of accepted orders waiting to be written to the database. Entries are deleted once written,
+# so its length is the number of orders not yet persisted.
+ORDER_STREAM_KEY: str = 'orders:stream'
+ORDER_GROUP: str = 'order-persister'
+# Orders that could not be written (e.g. a product was deleted meanwhile), kept for inspection.
+ORDER_DEAD_LETTER_KEY: str = 'orders:dead-letter'
+# Pending orders of a user: hash of order ID -> order, so that reads see orders not yet persisted.
+PENDING_ORDERS_KEY_PREFIX: str = 'orders:pending'
+# Orders of a user that were accepted but could not be written: hash of order ID -> order and reason.
+REJECTED_ORDERS_KEY_PREFIX: str = 'orders:rejected'
+# Reason shown to the user; the database error is kept in the dead-letter stream for support.
+REJECTED_ORDER_REASON: str = 'A product of the order is no longer available'
+
+
+def _pending_orders_key(user_id: str) -> str:
+    return f'{PENDING_ORDERS_KEY_PREFIX}:{user_id}'
+
+
+def _rejected_orders_key(user_id: str) -> str:
+    return f'{REJECTED_ORDERS_KEY_PREFIX}:{user_id}'
+
+
+def _dump_order(order: Order) -> str:
+    return json.dumps({
+        'id': order.id,
+        'user_id': order.user_id,
+        'item_count': order.item_count,
+        'total': order.total,
+        'order_items': [
+            {
+                'id': order_item.id,
+                'product_id': order_item.product_id,
+                'quantity': order_item.quantity,
+                'unit_price': order_item.unit_price,
+            }
+            for order_item in order.order_items],
+    })
+
+
+def load_order(raw: bytes | str) -> Order:
+    """
+    Deserialize an order taken by `read_order_batch_async`.
+
+    Parameters
+    ----------
+    raw : bytes | str
+        The serialized order.
+
+    Returns
+    -------
+    Order
+        The order, not added to any session, with its `order_items` populated.
+    """
+    data: dict = json.loads(raw)
+    order: Order = Order(
+        id=data['id'], user_id=data['user_id'], item_count=data.get('item_count'), total=data.get('total'))
+    order.order_items = [OrderItem(order_id=order.id, **order_item) for order_item in data['order_items']]
+    return order
+
+
+async def enqueue_order_async(redis_client: AsyncRedis, order: Order) -> str:
+    """
+    Append an order to the write-behind stream, and record it as pending for its user.
+
+    Both writes are made in one `MULTI` transaction, so an order is either queued and visible or
+    neither. The order is written to the database later by `ordering.persister.OrderPersister`.
+
+    Parameters
+    ----------
+    redis_client : AsyncRedis
+        The Redis client instance to communicate with the Redis server.
+    order : Order
+        An order built by `cruds.order.prepare_order_async`, with its `order_items` populated.
+
+    Returns
+    -------
+    str
+        The ID of the stream entry.
+    """
+    raw: str = _dump_order(order)
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.xadd(ORDER_STREAM_KEY, {'order': raw})
+    pipe.hset(_pending_orders_key(order.user_id), order.id, raw)
+    entry_id, _ = await pipe.execute()
+    return entry_id.decode()
+
+
+async def read_pending_orders_async(redis_client: AsyncRedis, user_id: str) -> list[Order]:
+    """
+    Retrieve the orders of a user that were accepted but are not written to the database yet.
+
+    An order may be returned here and by the database for a short while after it is written,
+    so callers must drop duplicates by ID.
+
+    Parameters
+    ----------
+    redis_client : AsyncRedis
+        The Redis client instance to communicate with the Redis server.
+    user_id : str
+        The ID of the user whose pending orders are to be retrieved.
+
+    Returns
+    -------
+    list[Order]
+        The pending orders, newest first, with their `order_items` populated (without products).
+    """
+    raw_orders: list[bytes] = await redis_client.hvals(_pending_orders_key(user_id))
+    return _newest_first(raw_orders)
+
+
+def _newest_first(raw_orders: list[bytes]) -> list[Order]:
+    return sorted((load_order(raw) for raw in raw_orders), key=lambda order: order.id, reverse=True)
+
+
+async def create_order_group_async(redis_client: AsyncRedis) -> None:
+    """
+    Create the consumer group of the order persisters, and the stream, if they do not exist yet.
+
+    Parameters
+    ----------
+    redis_client : AsyncRedis
+        The Redis client instance to communicate with the Redis server.
+    """
+    try:
+        await redis_client.xgroup_create(ORDER_STREAM_KEY, ORDER_GROUP, id='0', mkstream=True)
+    except ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+async def read_order_batch_async(
+        redis_client: AsyncRedis,
+        consumer: str,
+        count: int,
+        block_ms: int,
+        claim_idle_ms: int,
+    ) -> list[tuple[str, bytes]]:
+    """
+    Take a batch of queued orders for one consumer of the persister group.
+
+    Orders delivered to a consumer but not acknowledged for `claim_idle_ms` (its write failed or
+    its process died) are claimed first, so every order is eventually written: delivery is at least
+    once. Otherwise new orders are read, waiting up to `block_ms` for some to arrive.
+
+    Parameters
+    ----------
+    redis_client : AsyncRedis
+        The Redis client instance to communicate with the Redis server.
+    consumer : str
+        The name of the consumer, unique per process.
+    count : int
+        The maximum number of orders to take.
+    block_ms : int
+        How long to wait for new orders, in milliseconds.
+    claim_idle_ms : int
+        How long an order stays with a consumer before another one may claim it, in milliseconds.
+
+    Returns
+    -------
+    list[tuple[str, bytes]]
+        The stream entry IDs with the serialized orders; empty if none arrived in time.
+    """
+    _, claimed, *_ = await redis_client.xautoclaim(
+        ORDER_STREAM_KEY, ORDER_GROUP, consumer, min_idle_time=claim_idle_ms, start_id='0-0', count=count)
+    if claimed:
+        return _batch_entries(claimed)
+    streams = await redis_client.xreadgroup(ORDER_GROUP, consumer, {ORDER_STREAM_KEY: '>'}, count=count, block=block_ms)
+    return _batch_entries(streams[0][1]) if streams else []
+
+
+def _batch_entries(entries: list[tuple[bytes, dict[bytes, bytes] | None]]) -> list[tuple[str, bytes]]:
+    # XAUTOCLAIM of Redis 6.2 returns deleted entries with no fields: they are already written.
+    return [(entry_id.decode(), fields[b'order']) for entry_id, fields in entries if fields]
+
+
+async def acknowledge_orders_async(redis_client: AsyncRedis, entries: list[tuple[str, Order]]) -> None:
+    """
+    Remove written orders from the stream and from the pending orders of their users.
+
+    Parameters
+    ----------
+    redis_client : AsyncRedis
+        The Redis client instance to communicate with the Redis server.
+    entries : list[tuple[str, Order]]
+        The stream entry IDs with the orders, as written to the database.
+    """
+    if entries:
+        await _acknowledge_pipeline(redis_client.pipeline(transaction=True), entries).execute()
+
+
+def _acknowledge_pipeline(pipe, entries: list[tuple[str, Order]]):
+    entry_ids: list[str] = [entry_id for entry_id, _ in entries]
+    pipe.xack(ORDER_STREAM_KEY, ORDER_GROUP, *entry_ids)
+    pipe.xdel(ORDER_STREAM_KEY, *entry_ids)
+    for _, order in entries:
+        pipe.hdel(_pending_orders_key(order.user_id), order.id)
+    return pipe
+
+
+async def dead_letter_order_async(redis_client: AsyncRedis, entry_id: str, order: Order, error: str) -> None:
+    """
+    Move an order that cannot be written to the dead-letter stream, and acknowledge it.
+
+    The order is also recorded as rejected for its user (see `read_rejected_orders_async`), in the
+    same `MULTI` transaction, so it never disappears from their history without a trace.
+
+    Parameters
+    ----------
+    redis_client : AsyncRedis
+        The Redis client instance to communicate with the Redis server.
+    entry_id : str
+        The ID of the stream entry of the order.
+    order : Order
+        The order.
+    error : str
+        Why the order could not be written.
+    """
+    pipe = redis_client.pipeline(transaction=True)
+    raw: str = _dump_order(order)
+    pipe.xadd(ORDER_DEAD_LETTER_KEY, {'order': raw, 'error': error})
+    pipe.hset(
+        _rejected_orders_key(order.user_id), order.id, json.dumps({'order': raw, 'reason': REJECTED_ORDER_REASON}))
+    await _acknowledge_pipeline(pipe, [(entry_id, order)]).execute()
+
+
+async def read_rejected_orders_async(redis_client: AsyncRedis, user_id: str) -> list[tuple[Order, str]]:
+    """
+    Retrieve the orders of a user that were accepted in write-behind mode but could not be written.
+
+    Parameters
+    ----------
+    redis_client : AsyncRedis
+        The Redis client instance to communicate with the Redis server.
+    user_id : str
+        The ID of the user.
+
+    Returns
+    -------
+    list[tuple[Order, str]]
+        The rejected orders, newest first, with the reason shown to the user.
+    """
+    records: list[dict] = [json.loads(raw) for raw in await redis_client.hvals(_rejected_orders_key(user_id))]
+    rejected: list[tuple[Order, str]] = [(load_order(record['order']), record['reason']) for record in records]
+    return sorted(rejected, key=lambda entry: entry[0].id, reverse=True)
+
+
+async def get_order_stream_lag_async(redis_client: AsyncRedis, now: float) -> tuple[int, float]:
+    """
+    Measure how far the persisters are behind the accepted orders.
+
+    Parameters
+    ----------
+    redis_client : AsyncRedis
+        The Redis client instance to communicate with the Redis server.
+    now : float
+        The current UNIX time, in seconds.
+
+    Returns
+    -------
+    tuple[int, float]
+        The number of orders not written yet, and the age of the oldest one in seconds (0 if none).
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.xlen(ORDER_STREAM_KEY)
+    pipe.xrange(ORDER_STREAM_KEY, count=1)
+    return _lag(*(await pipe.execute()), now=now)
+
+
+def _lag(length: int, oldest: list[tuple[bytes, dict]], now: float) -> tuple[int, float]:
+    if not oldest:
+        return length, 0.0
+    # Stream entry IDs start with the UNIX time of the XADD in milliseconds.
+    added_at: float = int(oldest[0][0].split(b'-')[0]) / 1000
+    return length, max(now - added_at, 0.0)
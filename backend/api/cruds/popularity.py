@@ -0,0 +1,228 @@
+from collections import Counter
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from sqlmodel import select, Session
+
+from models.reqres_models import OrderItemCreate
+from models.table_models import OrderItem
+from ulid_time import ulid_timestamp_ms
+
+
+# Units sold per product since the beginning.
+POPULAR_ALL_KEY: str = 'popular:all'
+# Units sold per product in one hour (UNIX time // 3600). Rolling windows are unions of these buckets,
+# which expire once they are older than the longest window.
+POPULAR_HOUR_KEY_PREFIX: str = 'popular:hour'
+# Cached union of the buckets of a window.
+POPULAR_WINDOW_KEY_PREFIX: str = 'popular:window'
+# Keys written by `rebuild_popularity` before they replace the live ones.
+POPULAR_REBUILD_KEY_PREFIX: str = 'popular:rebuild'
+# Rolling windows, in hours.
+WINDOW_HOURS: dict[str, int] = {'day': 24, 'week': 7 * 24}
+WINDOWS: tuple[str, ...] = ('all', *WINDOW_HOURS)
+HOUR_BUCKET_TTL: int = (max(WINDOW_HOURS.values()) + 1) * 3600
+
+
+def _hour(timestamp: float) -> int:
+    return int(timestamp // 3600)
+
+
+def _hour_key(hour: int) -> str:
+    return f'{POPULAR_HOUR_KEY_PREFIX}:{hour}'
+
+
+def _staging_hour_key(hour: int) -> str:
+    return f'{POPULAR_REBUILD_KEY_PREFIX}:hour:{hour}'
+
+
+def _window_key(window: str) -> str:
+    return f'{POPULAR_WINDOW_KEY_PREFIX}:{window}'
+
+
+def _record_pipeline(pipe, order_items: list[OrderItemCreate], now: float, sign: int = 1):
+    quantities: Counter[str] = Counter()
+    for order_item in order_items:
+        quantities[order_item.product_id] += order_item.quantity
+    hour_key: str = _hour_key(_hour(now))
+    for product_id, quantity in quantities.items():
+        pipe.zincrby(POPULAR_ALL_KEY, sign * quantity, product_id)
+        pipe.zincrby(hour_key, sign * quantity, product_id)
+    pipe.expire(hour_key, HOUR_BUCKET_TTL)
+    return pipe
+
+
+def record_sales(redis_client: Redis, order_items: list[OrderItemCreate], now: float) -> None:
+    """
+    Add the units of an order to the all-time ranking and to the bucket of the current hour.
+
+    All increments are sent in one `MULTI` transaction, so a ranking never reflects part of an order.
+    The rolling windows pick the new units up when their cached union expires.
+
+    Parameters
+    ----------
+    redis_client : Redis
+        The Redis client instance to communicate with the Redis server.
+    order_items : list[OrderItemCreate]
+        The items of the order.
+    now : float
+        The UNIX time of the order, in seconds.
+    """
+    _record_pipeline(redis_client.pipeline(transaction=True), order_items, now).execute()
+
+
+async def record_sales_async(redis_client: AsyncRedis, order_items: list[OrderItemCreate], now: float) -> None:
+    """Asynchronous version of `record_sales`."""
+    await _record_pipeline(redis_client.pipeline(transaction=True), order_items, now).execute()
+
+
+async def retract_sales_async(redis_client: AsyncRedis, order_items: list[OrderItemCreate], now: float) -> None:
+    """
+    Take back the units recorded by `record_sales_async` for an order that was finally not stored.
+
+    Parameters
+    ----------
+    redis_client : AsyncRedis
+        The Redis client instance to communicate with the Redis server.
+    order_items : list[OrderItemCreate]
+        The items of the order.
+    now : float
+        The UNIX time the order was recorded at, in seconds, which selects its hourly bucket.
+    """
+    await _record_pipeline(redis_client.pipeline(transaction=True), order_items, now, sign=-1).execute()
+
+
+def get_popular_products(
+        redis_client: Redis,
+        window: str,
+        limit: int,
+        now: float,
+        window_ttl: int,
+    ) -> list[tuple[str, int]]:
+    """
+    Retrieve the best-selling products of a window with `ZREVRANGE`.
+
+    A rolling window is the union of its hourly buckets. The union is stored with `ZUNIONSTORE`
+    and served for `window_ttl` seconds, so it is computed at most once per period by all the
+    instances together.
+
+    Parameters
+    ----------
+    redis_client : Redis
+        The Redis client instance to communicate with the Redis server.
+    window : str
+        'all', 'day' (the last 24 hours) or 'week' (the last 7 days).
+    limit : int
+        The maximum number of products to return.
+    now : float
+        The current UNIX time, in seconds.
+    window_ttl : int
+        How long the union of a rolling window is reused, in seconds.
+
+    Returns
+    -------
+    list[tuple[str, int]]
+        The product IDs with their units sold, best-selling first.
+
+    Raises
+    ------
+    ValueError
+        If `window` is unknown.
+    """
+    key: str = _ranking_key(window)
+    if window != 'all' and not redis_client.exists(key):
+        _union_pipeline(redis_client.pipeline(transaction=True), window, now, window_ttl).execute()
+    return _ranking(redis_client.zrevrange(key, 0, limit - 1, withscores=True))
+
+
+async def get_popular_products_async(
+        redis_client: AsyncRedis,
+        window: str,
+        limit: int,
+        now: float,
+        window_ttl: int,
+    ) -> list[tuple[str, int]]:
+    """Asynchronous version of `get_popular_products`."""
+    key: str = _ranking_key(window)
+    if window != 'all' and not await redis_client.exists(key):
+        await _union_pipeline(redis_client.pipeline(transaction=True), window, now, window_ttl).execute()
+    return _ranking(await redis_client.zrevrange(key, 0, limit - 1, withscores=True))
+
+
+def _ranking_key(window: str) -> str:
+    if window not in WINDOWS:
+        raise ValueError(f'Unknown window: {window}')
+    return POPULAR_ALL_KEY if window == 'all' else _window_key(window)
+
+
+def _union_pipeline(pipe, window: str, now: float, window_ttl: int):
+    current_hour: int = _hour(now)
+    hour_keys: list[str] = [_hour_key(current_hour - i) for i in range(WINDOW_HOURS[window])]
+    key: str = _window_key(window)
+    pipe.zunionstore(key, hour_keys)
+    pipe.expire(key, window_ttl)
+    return pipe
+
+
+def _ranking(entries: list[tuple[bytes, float]]) -> list[tuple[str, int]]:
+    return [(product_id.decode(), int(units)) for product_id, units in entries]
+
+
+def rebuild_popularity(session: Session, redis_client: Redis, now: float, batch_size: int = 10000) -> int:
+    """
+    Recompute the rankings from the order items in the database.
+
+    The order items are streamed in batches of `batch_size` rows (a server-side cursor on
+    PostgreSQL), and each batch is added to staging keys with one pipeline, so memory stays
+    bounded however many orders there are. The hour of an order is read from its ULID. The staging
+    keys then replace the live ones in one transaction. Units recorded while the rebuild runs, and
+    orders still queued in write-behind mode, are not counted until they are recorded again.
+
+    Parameters
+    ----------
+    session : Session
+        The database session instance.
+    redis_client : Redis
+        The Redis client instance to communicate with the Redis server.
+    now : float
+        The current UNIX time, in seconds.
+    batch_size : int, optional
+        The number of order items read and written per batch. Default is 10000.
+
+    Returns
+    -------
+    int
+        The number of order items counted.
+    """
+    current_hour: int = _hour(now)
+    first_hour: int = current_hour - max(WINDOW_HOURS.values()) + 1
+    staging_all_key: str = f'{POPULAR_REBUILD_KEY_PREFIX}:all'
+    staged_hours: set[int] = set()
+    # Left over by an interrupted rebuild.
+    redis_client.delete(
+        staging_all_key, *(_staging_hour_key(hour) for hour in range(first_hour, current_hour + 1)))
+
+    counted: int = 0
+    query = select(OrderItem.order_id, OrderItem.product_id, OrderItem.quantity).execution_options(
+        stream_results=True, yield_per=batch_size)
+    for rows in session.execute(query).partitions(batch_size):
+        pipe = redis_client.pipeline(transaction=False)
+        for order_id, product_id, quantity in rows:
+            pipe.zincrby(staging_all_key, quantity, product_id)
+            hour: int = ulid_timestamp_ms(order_id) // 3_600_000
+            if first_hour <= hour <= current_hour:
+                pipe.zincrby(_staging_hour_key(hour), quantity, product_id)
+                staged_hours.add(hour)
+        pipe.execute()
+        counted += len(rows)
+
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.delete(POPULAR_ALL_KEY, *(_window_key(window) for window in WINDOW_HOURS))
+    pipe.delete(*(_hour_key(hour) for hour in range(first_hour, current_hour + 1)))
+    if counted:
+        pipe.rename(staging_all_key, POPULAR_ALL_KEY)
+    for hour in staged_hours:
+        pipe.rename(_staging_hour_key(hour), _hour_key(hour))
+        pipe.expire(_hour_key(hour), HOUR_BUCKET_TTL)
+    pipe.execute()
+    return counted
@@ -1,6 +1,19 @@
+from collections.abc import Iterator
+
+from sqlalchemy import and_, case, literal_column, or_, text
+from sqlalchemy.engine import Row
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.elements import TextClause
 from sqlmodel import select, Session, func
+from sqlmodel.ext.asyncio.session import AsyncSession
 from models.table_models import Product
+from caching.crud_cache import crud_cache
+
+
+# Text search configuration of the `product.search_vector` column (see migrations/versions/0001).
+TS_CONFIG = 'simple'
 
+@crud_cache.cached(key='product:{product_id}', tags=['product:{product_id}', 'catalog'])
 def read_product(session: Session, product_id: str) -> Product | None:
     """
     Retrieve a single product by its ID from the database.
@@ -20,6 +33,48 @@ def read_product(session: Session, product_id: str) -> Product | None:
     product: Product | None = session.get(Product, product_id)
     return product
 
+@crud_cache.cached(key='product:{product_id}', tags=['product:{product_id}', 'catalog'])
+async def read_product_async(session: AsyncSession, product_id: str) -> Product | None:
+    """Asynchronous version of `read_product`."""
+    product: Product | None = await session.get(Product, product_id)
+    return product
+
+def read_products_by_ids(session: Session, product_ids: list[str]) -> list[Product]:
+    """
+    Retrieve several products by their IDs with a single `IN` query.
+
+    Parameters
+    ----------
+    session : Session
+        The database session instance.
+    product_ids : list[str]
+        The IDs of the products to retrieve.
+
+    Returns
+    -------
+    list[Product]
+        The products that exist, in the order of `product_ids`. Unknown IDs are left out.
+    """
+    if not product_ids:
+        return []
+    products: list[Product] = session.exec(_products_by_ids_query(product_ids)).all()
+    return _in_request_order(product_ids, products)
+
+async def read_products_by_ids_async(session: AsyncSession, product_ids: list[str]) -> list[Product]:
+    """Asynchronous version of `read_products_by_ids`."""
+    if not product_ids:
+        return []
+    products: list[Product] = (await session.exec(_products_by_ids_query(product_ids))).all()
+    return _in_request_order(product_ids, products)
+
+def _products_by_ids_query(product_ids: list[str]) -> Select:
+    return select(Product).where(Product.id.in_(set(product_ids)))
+
+def _in_request_order(product_ids: list[str], products: list[Product]) -> list[Product]:
+    products_by_id: dict[str, Product] = {product.id: product for product in products}
+    return [products_by_id[product_id] for product_id in dict.fromkeys(product_ids) if product_id in products_by_id]
+
+@crud_cache.cached(key='products:{skip}:{limit}', tags=['catalog'])
 def read_products(session: Session, skip: int = 0, limit: int | None = 20) -> list[Product]:
     """
     Retrieve a list of products from the database with pagination.
@@ -42,10 +97,258 @@ def read_products(session: Session, skip: int = 0, limit: int | None = 20) -> li
     products: list[Product] = session.exec(query).all()
     return products
 
+@crud_cache.cached(key='products:{skip}:{limit}', tags=['catalog'])
+async def read_products_async(session: AsyncSession, skip: int = 0, limit: int | None = 20) -> list[Product]:
+    """Asynchronous version of `read_products`."""
+    query = select(Product).offset(skip).limit(limit)
+    products: list[Product] = (await session.exec(query)).all()
+    return products
+
+def read_product_page(session: Session, cursor: str | None = None, limit: int = 20) -> tuple[list[Product], str | None]:
+    """
+    Retrieve one page of products ordered by ID, seeking past the last ID of the previous page.
+
+    Unlike `read_products`, the database does not scan and discard the rows before the page,
+    so a deep page costs the same as the first one (an index range scan on the primary key).
+
+    Parameters
+    ----------
+    session : Session
+        The database session instance.
+    cursor : str | None, optional
+        The ID of the last product of the previous page. Default is None (the first page).
+    limit : int, optional
+        The maximum number of products to retrieve. Default is 20.
+
+    Returns
+    -------
+    tuple[list[Product], str | None]
+        The products of the page and the ID to continue from, or None if this is the last page.
+    """
+    products: list[Product] = session.exec(_product_page_query(cursor, limit)).all()
+    return _split_page(products, limit)
+
+async def read_product_page_async(
+        session: AsyncSession,
+        cursor: str | None = None,
+        limit: int = 20,
+    ) -> tuple[list[Product], str | None]:
+    """Asynchronous version of `read_product_page`."""
+    products: list[Product] = (await session.exec(_product_page_query(cursor, limit))).all()
+    return _split_page(products, limit)
+
+def _product_page_query(cursor: str | None, limit: int) -> Select:
+    # One extra row tells whether there is a next page.
+    query = select(Product).order_by(Product.id).limit(limit + 1)
+    if cursor is not None:
+        query = query.where(Product.id > cursor)
+    return query
+
+def _split_page(products: list[Product], limit: int) -> tuple[list[Product], str | None]:
+    if len(products) > limit:
+        products = products[:limit]
+        return products, products[-1].id
+    return products, None
+
+def search_products(session: Session, query: str, skip: int = 0, limit: int | None = 20) -> list[Product]:
+    """
+    Search products by name, author and description, best matches first.
+
+    On PostgreSQL the query is matched against the GIN-indexed `search_vector` column with
+    `websearch_to_tsquery` and ranked with `ts_rank`. Other backends (SQLite in the tests) fall
+    back to case-insensitive substring matching where every term must appear in one of the
+    columns, ranked with the same column weights as `ts_rank` (name 1.0, author 0.4, description 0.2).
+
+    Parameters
+    ----------
+    session : Session
+        The database session instance.
+    query : str
+        The search query entered by the user.
+    skip : int, optional
+        The number of matching products to skip before starting to fetch. Default is 0.
+    limit : int, optional
+        The maximum number of products to retrieve. Default is 20.
+
+    Returns
+    -------
+    list[Product]
+        The matching products ordered by relevance.
+    """
+    if not query.split():
+        return []
+    search_query = _search_query(session.get_bind().dialect.name, query, skip, limit)
+    products: list[Product] = session.exec(search_query).all()
+    return products
+
+async def search_products_async(
+        session: AsyncSession,
+        query: str,
+        skip: int = 0,
+        limit: int | None = 20,
+    ) -> list[Product]:
+    """Asynchronous version of `search_products`."""
+    if not query.split():
+        return []
+    search_query = _search_query(session.sync_session.get_bind().dialect.name, query, skip, limit)
+    products: list[Product] = (await session.exec(search_query)).all()
+    return products
+
+def _search_query(dialect_name: str, query: str, skip: int, limit: int | None) -> Select:
+    if dialect_name == 'postgresql':
+        ts_query = func.websearch_to_tsquery(literal_column(f"'{TS_CONFIG}'::regconfig"), query)
+        search_vector = literal_column('product.search_vector')
+        condition = search_vector.op('@@')(ts_query)
+        rank = func.ts_rank(search_vector, ts_query)
+    else:
+        weighted_columns = [(Product.name, 1.0), (Product.author, 0.4), (Product.description, 0.2)]
+        term_conditions = []
+        rank = literal_column('0.0')
+        for term in query.split():
+            matches = [
+                (func.lower(column).contains(term.lower(), autoescape=True), weight)
+                for column, weight in weighted_columns]
+            term_conditions.append(or_(*[match for match, _ in matches]))
+            for match, weight in matches:
+                rank = rank + case((match, weight), else_=0.0)
+        condition = and_(*term_conditions)
+
+    return (
+        select(Product)
+        .where(condition)
+        .order_by(rank.desc(), Product.id)
+        .offset(skip)
+        .limit(limit)
+    )
+
+def read_products_with_total(
+        session: Session,
+        skip: int = 0,
+        limit: int = 20,
+        total_mode: str = 'auto',
+    ) -> tuple[list[Product], int]:
+    """
+    Retrieve a page of products together with the total number of products.
+
+    With the 'window' mode, the total comes from the same statement as the page
+    (`count(*) OVER ()`), so both are read in one round trip and are consistent with each other.
+    With the 'counter' mode, it is the cached `count_products`. The window has to count every row
+    of the table on each call, which is cheap on SQLite but a full scan of a large table on
+    PostgreSQL, so 'auto' uses the counter on PostgreSQL and the window elsewhere.
+
+    Parameters
+    ----------
+    session : Session
+        The database session instance.
+    skip : int, optional
+        The number of products to skip before starting to fetch. Default is 0.
+    limit : int, optional
+        The maximum number of products to retrieve. Default is 20.
+    total_mode : str, optional
+        'auto', 'window' or 'counter'. Default is 'auto'.
+
+    Returns
+    -------
+    tuple[list[Product], int]
+        The products of the page and the total number of products.
+
+    Raises
+    ------
+    ValueError
+        If `total_mode` is unknown.
+    """
+    if _uses_counter(session.get_bind().dialect.name, total_mode):
+        return read_products(session=session, skip=skip, limit=limit), count_products(session=session)
+    return _fetch_with_total(session, select(Product).offset(skip).limit(limit), skip)
+
+async def read_products_with_total_async(
+        session: AsyncSession,
+        skip: int = 0,
+        limit: int = 20,
+        total_mode: str = 'auto',
+    ) -> tuple[list[Product], int]:
+    """Asynchronous version of `read_products_with_total`."""
+    if _uses_counter(session.sync_session.get_bind().dialect.name, total_mode):
+        products: list[Product] = await read_products_async(session=session, skip=skip, limit=limit)
+        return products, await count_products_async(session=session)
+    return await _fetch_with_total_async(session, select(Product).offset(skip).limit(limit), skip)
+
+def search_products_with_total(
+        session: Session,
+        query: str,
+        skip: int = 0,
+        limit: int = 20,
+    ) -> tuple[list[Product], int]:
+    """
+    Search products like `search_products`, together with the total number of matches.
+
+    The total always comes from a window count in the same statement, since matches are not counted
+    anywhere else.
+
+    Parameters
+    ----------
+    session : Session
+        The database session instance.
+    query : str
+        The search query entered by the user.
+    skip : int, optional
+        The number of matching products to skip before starting to fetch. Default is 0.
+    limit : int, optional
+        The maximum number of products to retrieve. Default is 20.
+
+    Returns
+    -------
+    tuple[list[Product], int]
+        The matching products ordered by relevance and the total number of matches.
+    """
+    if not query.split():
+        return [], 0
+    return _fetch_with_total(session, _search_query(session.get_bind().dialect.name, query, skip, limit), skip)
+
+async def search_products_with_total_async(
+        session: AsyncSession,
+        query: str,
+        skip: int = 0,
+        limit: int = 20,
+    ) -> tuple[list[Product], int]:
+    """Asynchronous version of `search_products_with_total`."""
+    if not query.split():
+        return [], 0
+    search_query = _search_query(session.sync_session.get_bind().dialect.name, query, skip, limit)
+    return await _fetch_with_total_async(session, search_query, skip)
+
+def _uses_counter(dialect_name: str, total_mode: str) -> bool:
+    if total_mode not in ('auto', 'window', 'counter'):
+        raise ValueError(f'Unknown total mode: {total_mode}')
+    return total_mode == 'counter' or (total_mode == 'auto' and dialect_name == 'postgresql')
+
+def _with_total(query: Select) -> Select:
+    return query.add_columns(func.count().over().label('total'))
+
+def _fetch_with_total(session: Session, query: Select, skip: int) -> tuple[list[Product], int]:
+    rows = session.execute(_with_total(query)).all()
+    if not rows and skip > 0:
+        # Past the last page there is no row to carry the total: count from the first row instead.
+        rows = session.execute(_with_total(query.offset(0).limit(1))).all()
+        return [], rows[0].total if rows else 0
+    return [row[0] for row in rows], rows[0].total if rows else 0
+
+async def _fetch_with_total_async(session: AsyncSession, query: Select, skip: int) -> tuple[list[Product], int]:
+    rows = (await session.execute(_with_total(query))).all()
+    if not rows and skip > 0:
+        rows = (await session.execute(_with_total(query.offset(0).limit(1)))).all()
+        return [], rows[0].total if rows else 0
+    return [row[0] for row in rows], rows[0].total if rows else 0
+
+@crud_cache.cached(key='product-count', tags=['product-count'])
 def count_products(session: Session) -> int:
     """
     Count the total number of products in the database.
 
+    The count is cached in both tiers of `crud_cache` and invalidated only when products are added
+    or deleted (see `caching/crud_cache.py`), so the table is scanned once per such change rather
+    than on every call.
+
     Parameters
     ----------
     session : Session
@@ -59,3 +362,74 @@ def count_products(session: Session) -> int:
     query = select(func.count(Product.id))
     total: int = session.exec(query).first()
     return total
+
+@crud_cache.cached(key='product-count', tags=['product-count'])
+async def count_products_async(session: AsyncSession) -> int:
+    """Asynchronous version of `count_products`."""
+    query = select(func.count(Product.id))
+    total: int = (await session.exec(query)).first()
+    return total
+
+def estimate_product_count(session: Session) -> int | None:
+    """
+    Estimate the number of products from the planner statistics, without scanning the table.
+
+    On PostgreSQL this reads `pg_class.reltuples`, which `ANALYZE` and autovacuum keep close to the
+    real count. Other backends have no such statistic.
+
+    Parameters
+    ----------
+    session : Session
+        The database session instance.
+
+    Returns
+    -------
+    int | None
+        The estimated number of products, or None if the backend is not PostgreSQL or the table
+        has never been analyzed.
+    """
+    if session.get_bind().dialect.name != 'postgresql':
+        return None
+    reltuples: float | None = session.execute(_estimate_query()).scalar()
+    return _estimate(reltuples)
+
+async def estimate_product_count_async(session: AsyncSession) -> int | None:
+    """Asynchronous version of `estimate_product_count`."""
+    if session.sync_session.get_bind().dialect.name != 'postgresql':
+        return None
+    reltuples: float | None = (await session.execute(_estimate_query())).scalar()
+    return _estimate(reltuples)
+
+def _estimate_query() -> TextClause:
+    return (
+        text('SELECT reltuples FROM pg_class WHERE oid = to_regclass(:table)')
+        .bindparams(table=Product.__tablename__))
+
+def _estimate(reltuples: float | None) -> int | None:
+    # -1 (PostgreSQL 14+) or 0 (older versions) until the table is first analyzed.
+    if reltuples is None or reltuples <= 0:
+        return None
+    return int(reltuples)
+
+def stream_product_texts(session: Session, batch_size: int = 1000) -> Iterator[Row]:
+    """
+    Stream the ID, name, author and description of every product, e.g. to index the catalog.
+
+    The rows are fetched `batch_size` at a time (a server-side cursor on PostgreSQL) and are not
+    ORM objects, so memory stays bounded and nothing goes through the CRUD cache.
+
+    Parameters
+    ----------
+    session : Session
+        The database session instance.
+    batch_size : int, optional
+        The number of rows fetched at a time. Default is 1000.
+
+    Returns
+    -------
+    Iterator[Row]
+        The rows, with the same attribute names as `Product`.
+    """
+    query = select(Product.id, Product.name, Product.author, Product.description).execution_options(
+        stream_results=True, yield_per=batch_size)
+    yield from session.exec(query)
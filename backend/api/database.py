@@ -0,0 +1,314 @@
+import asyncio
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from google.cloud.sql.connector import Connector, IPTypes
+from sqlalchemy import exc
+from sqlalchemy.dialects.postgresql.asyncpg import AsyncAdapt_asyncpg_connection
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.util import await_only
+from sqlmodel import create_engine
+
+
+class CloudSQLConnectorManager:
+    """
+    Owns the single Cloud SQL Python Connector of the process.
+
+    A `Connector` runs background threads and caches the instance certificates, so it is meant to be
+    built once and shared by every physical connection. It is created lazily on the first connection
+    and released by `close` at shutdown. The async engine connects with asyncpg through a second
+    connector bound to the event loop of the app (`connect_async`), released by `close_async`.
+
+    Parameters
+    ----------
+    instance_connection_name : str
+        The Cloud SQL instance connection name ('project:region:instance').
+    user : str
+        The database user.
+    password : str
+        The password of the database user.
+    db : str
+        The database name.
+    ip_type : IPTypes, optional
+        The IP type to connect through. Default is `IPTypes.PRIVATE`.
+    driver : str, optional
+        The DB-API driver used by the connector. Default is 'pg8000'.
+    connector_factory : Callable[..., Any] | None, optional
+        Builds the connector; called with `loop=` for the async one. Default is None (`Connector`).
+    """
+    def __init__(
+            self,
+            instance_connection_name: str,
+            user: str,
+            password: str,
+            db: str,
+            ip_type: IPTypes = IPTypes.PRIVATE,
+            driver: str = 'pg8000',
+            connector_factory: Callable[..., Any] | None = None,
+        ):
+        self.instance_connection_name = instance_connection_name
+        self.user = user
+        self.password = password
+        self.db = db
+        self.ip_type = ip_type
+        self.driver = driver
+        self.connector_factory = connector_factory if connector_factory is not None else Connector
+        self._connector: Connector | None = None
+        self._async_connector: Connector | None = None
+        self._lock = threading.Lock()
+
+    def connect(self) -> Any:
+        """Open a new DB-API connection through the shared connector. Used as the engine's `creator`."""
+        if self._connector is None:
+            with self._lock:
+                if self._connector is None:
+                    self._connector = self.connector_factory()
+        return self._connector.connect(
+            self.instance_connection_name,
+            self.driver,
+            user=self.user,
+            password=self.password,
+            db=self.db,
+            ip_type=self.ip_type,
+        )
+
+    async def connect_async(self) -> Any:
+        """Open a new asyncpg connection through the connector of the running event loop."""
+        if self._async_connector is None:
+            self._async_connector = self.connector_factory(loop=asyncio.get_running_loop())
+        return await self._async_connector.connect_async(
+            self.instance_connection_name,
+            'asyncpg',
+            user=self.user,
+            password=self.password,
+            db=self.db,
+            ip_type=self.ip_type,
+        )
+
+    def close(self) -> None:
+        """Close the connector and stop its background threads. A later `connect` builds a new one."""
+        with self._lock:
+            if self._connector is not None:
+                self._connector.close()
+                self._connector = None
+
+    async def close_async(self) -> None:
+        """Close the connector of the async engine. A later `connect_async` builds a new one."""
+        if self._async_connector is not None:
+            await self._async_connector.close_async()
+            self._async_connector = None
+
+
+class CheckoutWaitStats:
+    """Counters of the time spent waiting for a connection from a pool."""
+
+    def __init__(self):
+        self.checkouts: int = 0
+        self.timeouts: int = 0
+        self.total_wait: float = 0.0
+        self.max_wait: float = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, wait: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+
+class TimedCheckoutMixin:
+    """Pool mixin measuring how long each checkout waits for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = CheckoutWaitStats()
+
+    def _do_get(self) -> Any:
+        start: float = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.wait_stats.record_timeout()
+            raise
+        self.wait_stats.record(time.perf_counter() - start)
+        return connection
+
+
+class TimedQueuePool(TimedCheckoutMixin, QueuePool):
+    """`QueuePool` that measures how long each checkout waits for a connection."""
+
+
+class TimedAsyncAdaptedQueuePool(TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    """`AsyncAdaptedQueuePool` that measures how long each checkout waits for a connection."""
+
+
+def split_pool_size(total: int, async_share: float) -> tuple[int, int]:
+    """
+    Split a number of connections between the sync and the async engine of a process.
+
+    Parameters
+    ----------
+    total : int
+        The number of connections for both engines together.
+    async_share : float
+        The fraction of `total` given to the async engine, between 0 and 1.
+
+    Returns
+    -------
+    tuple[int, int]
+        The connections of the sync engine and of the async engine. Below 2 connections there is
+        nothing to split, and each engine gets `total`.
+    """
+    if total < 2:
+        return total, total
+    async_size: int = min(max(round(total * async_share), 1), total - 1)
+    return total - async_size, async_size
+
+
+def create_db_engine(
+        creator: Callable[[], Any],
+        url: str = 'postgresql+pg8000://',
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        pool_timeout: float = 30,
+        pool_recycle: int = 1800,
+        pool_pre_ping: bool = True,
+        echo: bool = False,
+    ) -> Engine:
+    """
+    Create an engine whose connections come from `creator`, pooled by a `TimedQueuePool`.
+
+    Parameters
+    ----------
+    creator : Callable[[], Any]
+        Opens a new DB-API connection, e.g. `CloudSQLConnectorManager.connect`.
+    url : str, optional
+        The database URL selecting the dialect. Default is 'postgresql+pg8000://'.
+    pool_size : int, optional
+        The number of connections kept open. Default is 5.
+    max_overflow : int, optional
+        The number of extra connections opened under load. Default is 10.
+    pool_timeout : float, optional
+        The seconds to wait for a free connection before failing. Default is 30.
+    pool_recycle : int, optional
+        The age in seconds after which a connection is replaced. Default is 1800.
+    pool_pre_ping : bool, optional
+        Whether to test connections on checkout. Default is True.
+    echo : bool, optional
+        Whether to log every statement. Default is False.
+
+    Returns
+    -------
+    Engine
+        The configured engine.
+    """
+    return create_engine(
+        url,
+        creator=creator,
+        poolclass=TimedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_recycle=pool_recycle,
+        pool_pre_ping=pool_pre_ping,
+        echo=echo,
+    )
+
+
+def create_async_db_engine(
+        connect: Callable[[], Awaitable[Any]],
+        url: str = 'postgresql+asyncpg://',
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        pool_timeout: float = 30,
+        pool_recycle: int = 1800,
+        pool_pre_ping: bool = True,
+        echo: bool = False,
+    ) -> AsyncEngine:
+    """
+    Create an asyncpg engine whose connections come from `connect`, pooled by a `TimedAsyncAdaptedQueuePool`.
+
+    SQLAlchemy 1.4 has no `async_creator`: the pool calls its `creator` within the greenlet of the
+    awaiting task, so the creator awaits `connect` with `await_only` and wraps the asyncpg connection
+    in the adapter the dialect would have built itself.
+
+    Parameters
+    ----------
+    connect : Callable[[], Awaitable[Any]]
+        Opens a new asyncpg connection, e.g. `CloudSQLConnectorManager.connect_async`.
+    url : str, optional
+        The database URL selecting the dialect. Default is 'postgresql+asyncpg://'.
+    pool_size : int, optional
+        The number of connections kept open. Default is 5.
+    max_overflow : int, optional
+        The number of extra connections opened under load. Default is 10.
+    pool_timeout : float, optional
+        The seconds to wait for a free connection before failing. Default is 30.
+    pool_recycle : int, optional
+        The age in seconds after which a connection is replaced. Default is 1800.
+    pool_pre_ping : bool, optional
+        Whether to test connections on checkout. Default is True.
+    echo : bool, optional
+        Whether to log every statement. Default is False.
+
+    Returns
+    -------
+    AsyncEngine
+        The configured engine.
+    """
+    def creator() -> AsyncAdapt_asyncpg_connection:
+        return AsyncAdapt_asyncpg_connection(async_engine.sync_engine.dialect.dbapi, await_only(connect()))
+
+    async_engine: AsyncEngine = create_async_engine(
+        url,
+        creator=creator,
+        poolclass=TimedAsyncAdaptedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_recycle=pool_recycle,
+        pool_pre_ping=pool_pre_ping,
+        echo=echo,
+    )
+    return async_engine
+
+
+def pool_status(engine: Engine) -> dict[str, int | float]:
+    """
+    Report the state of an engine's connection pool.
+
+    Parameters
+    ----------
+    engine : Engine
+        An engine created by `create_db_engine`, or the `sync_engine` of one created by `create_async_db_engine`.
+
+    Returns
+    -------
+    dict[str, int | float]
+        The pool size, the connections in use, idle and in overflow, and the number of checkouts
+        with their average and maximum wait for a connection in milliseconds.
+    """
+    pool = engine.pool
+    status: dict[str, int | float] = {
+        'size': pool.size(),
+        'checked_out': pool.checkedout(),
+        'checked_in': pool.checkedin(),
+        'overflow': max(pool.overflow(), 0),
+    }
+    wait_stats: CheckoutWaitStats | None = getattr(pool, 'wait_stats', None)
+    if wait_stats is not None:
+        status |= {
+            'checkouts': wait_stats.checkouts,
+            'checkout_timeouts': wait_stats.timeouts,
+            'avg_wait_ms': wait_stats.total_wait / wait_stats.checkouts * 1000 if wait_stats.checkouts else 0.0,
+            'max_wait_ms': wait_stats.max_wait * 1000,
+        }
+    return status
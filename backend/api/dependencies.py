@@ -1,15 +1,30 @@
-from collections.abc import Generator
+import os
+import socket
+from collections.abc import AsyncGenerator, Generator
 
 from fastapi import Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer
 from firebase_admin import auth
-from sqlmodel import Session, create_engine
-from google.cloud.sql.connector import Connector, IPTypes
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from google.cloud.sql.connector import IPTypes
 import redis
+import redis.asyncio
 from redis import Redis
 
 import settings
+import cruds.catalog as catalog_crud
+from database import CloudSQLConnectorManager, create_async_db_engine, create_db_engine, split_pool_size
 from models.table_models import *
+from similarity_search.encoders import Encoder, HashingEncoder, SentenceTransformerEncoder
+from similarity_search.engine import SemanticSearchEngine
+from similarity_search.indexer import SearchIndexer
+from caching.crud_cache import crud_cache
+from caching.lru import LRUCache
+from inventory.reconciler import StockReconciler
+from ordering.persister import OrderPersister
+from security.token_cache import TokenCache
+from security.token_verifier import FirebaseTokenVerifier, JWKSCache
 
 
 class OAuth2PasswordBearerWithCookie(OAuth2PasswordBearer):
@@ -62,9 +77,38 @@ class OAuth2PasswordBearerWithCookie(OAuth2PasswordBearer):
     
     
 oauth2_scheme = OAuth2PasswordBearerWithCookie(tokenUrl='api/login')
+token_cache = TokenCache(maxsize=settings.TOKEN_CACHE_MAXSIZE, enabled=settings.TOKEN_CACHE_ENABLED)
+jwks_cache = JWKSCache(url=settings.FIREBASE_JWKS_URL)
+token_verifier = FirebaseTokenVerifier(project_id=settings.FIREBASE_PROJECT_ID, key_cache=jwks_cache)
+def verify_id_token(token: str) -> dict:
+    """
+    Verify a Firebase ID token and return its claims.
+
+    With `settings.LOCAL_TOKEN_VERIFICATION` the token is checked in-process against the signing keys
+    in `jwks_cache`, which are refreshed in the background (see `main.lifespan`), so a request never
+    waits for Google's certificates. Otherwise `firebase_admin.auth.verify_id_token` is used.
+
+    Parameters
+    ----------
+    token : str
+        The ID token to verify.
+
+    Returns
+    -------
+    dict
+        The decoded claims of the token, including `uid`.
+    """
+    if settings.LOCAL_TOKEN_VERIFICATION:
+        return token_verifier.verify(token)
+    return auth.verify_id_token(token)
+
+
 def verify_token(token = Depends(oauth2_scheme)) -> dict[str, str]:
     """
-    Verify the provided OAuth2 token using Firebase's auth.verify_id_token.
+    Verify the provided OAuth2 token with `verify_id_token`.
+
+    Decoded tokens are kept in `token_cache` until they expire, so the same token is verified
+    only once however many requests it is sent with.
 
     Parameters
     ----------
@@ -82,26 +126,53 @@ def verify_token(token = Depends(oauth2_scheme)) -> dict[str, str]:
         If token verification fails with any exception.
     """
     try:
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = token_cache.verify(token, verify_id_token)
         return decoded_token
     except Exception as e:
         raise HTTPException(status_code=401, detail=f'Unauthorized: {e}')
 
 
-def getconn():
-    """Cloud SQL Python Connector creator function"""
-    connector = Connector()
-    conn = connector.connect(
-        settings.INSTANCE_CONNECTION_NAME,
-        "pg8000",
-        user=settings.DB_USER,
-        password=settings.DB_PASS,
-        db=settings.DB_NAME,
-        ip_type=IPTypes.PRIVATE,
-    )
-    return conn
-
-engine = create_engine("postgresql+pg8000://", creator=getconn, echo=True)
+def verify_admin(decoded_token: dict[str, str] = Depends(verify_token)) -> dict[str, str]:
+    """
+    Verify that the token belongs to one of the users of `settings.METRICS_ADMIN_UIDS`.
+
+    Parameters
+    ----------
+    decoded_token : dict[str, str]
+        The decoded token of the user. This is obtained using the dependency `verify_token`.
+
+    Returns
+    -------
+    dict[str, str]
+        The decoded token if the user is an administrator.
+
+    Raises
+    ------
+    HTTPException
+        If the user is not an administrator.
+    """
+    if decoded_token['uid'] not in settings.METRICS_ADMIN_UIDS:
+        raise HTTPException(status_code=403, detail='Forbidden: administrators only')
+    return decoded_token
+
+
+connector_manager = CloudSQLConnectorManager(
+    instance_connection_name=settings.INSTANCE_CONNECTION_NAME,
+    user=settings.DB_USER,
+    password=settings.DB_PASS,
+    db=settings.DB_NAME,
+    ip_type=IPTypes.PRIVATE)
+# Both engines draw on the same budget of connections.
+sync_pool_size, async_pool_size = split_pool_size(settings.DB_POOL_SIZE, settings.DB_ASYNC_POOL_SHARE)
+sync_max_overflow, async_max_overflow = split_pool_size(settings.DB_MAX_OVERFLOW, settings.DB_ASYNC_POOL_SHARE)
+engine = create_db_engine(
+    creator=connector_manager.connect,
+    pool_size=sync_pool_size,
+    max_overflow=sync_max_overflow,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    echo=settings.DB_ECHO)
 def get_session() -> Generator[Session, None, None]:
     """Returns a generator that can be used as a context manager to generate database sessions.
 
@@ -114,6 +185,28 @@ def get_session() -> Generator[Session, None, None]:
         yield session
 
 
+async_engine = create_async_db_engine(
+    connect=connector_manager.connect_async,
+    pool_size=async_pool_size,
+    max_overflow=async_max_overflow,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    echo=settings.DB_ECHO)
+async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+    """Returns an async generator that yields non-blocking database sessions for `async def` endpoints.
+
+    Objects are not expired on commit, because lazy loading is not available in async sessions.
+
+    Yields
+    ------
+    session : sqlmodel.ext.asyncio.session.AsyncSession
+        The asynchronous database session object.
+    """
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
 redis_client = redis.StrictRedis(
     host=settings.REDIS_HOST, 
     port=settings.REDIS_PORT, 
@@ -128,3 +221,136 @@ def get_redis_client() -> Redis:
         An instance of the Redis client.
     """
     return redis_client
+
+
+# The asynchronous client of the app, set in the lifespan, for work started outside requests.
+async_redis_client: redis.asyncio.Redis | None = None
+# Keep the catalog version (used for ETags) in step with product writes made through the ORM.
+catalog_crud.watch_product_changes(get_redis_client, lambda: async_redis_client)
+# Second tier of the CRUD cache for sync functions; async ones get the app's client in the lifespan.
+crud_cache.redis_client = redis_client
+
+
+def create_async_redis_client() -> redis.asyncio.Redis:
+    """
+    Create the asynchronous Redis client of the process, backed by a bounded connection pool.
+
+    The pool opens at most `settings.REDIS_MAX_CONNECTIONS` connections; when all of them are busy,
+    a command waits up to `settings.REDIS_POOL_TIMEOUT` seconds for one to be released instead of
+    opening more. Idle connections are pinged before reuse once they have been unused for
+    `settings.REDIS_HEALTH_CHECK_INTERVAL` seconds. The client is created in the app lifespan
+    and closed, together with its pool, at shutdown.
+
+    Returns
+    -------
+    redis.asyncio.Redis
+        The asynchronous Redis client.
+    """
+    pool = redis.asyncio.BlockingConnectionPool(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        timeout=settings.REDIS_POOL_TIMEOUT,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+        socket_keepalive=True)
+    return redis.asyncio.Redis(connection_pool=pool)
+
+
+async def close_async_redis_client(redis_client: redis.asyncio.Redis) -> None:
+    """Close the client and disconnect every connection of its pool."""
+    await redis_client.close(close_connection_pool=True)
+
+
+def get_async_redis_client(request: Request) -> redis.asyncio.Redis:
+    """
+    Retrieve the asynchronous Redis client created in the app lifespan.
+
+    Returns
+    -------
+    redis.asyncio.Redis
+        The asynchronous Redis client shared by all requests.
+    """
+    return request.app.state.redis_client
+
+
+# Reconciles the Redis stock counts with `product.stock`; started in the app lifespan.
+stock_reconciler = StockReconciler(
+    session_factory=lambda: AsyncSession(async_engine, expire_on_commit=False),
+    interval=settings.STOCK_RECONCILE_INTERVAL)
+# Writes the orders queued in write-behind mode to the database; started in the app lifespan.
+order_persister = OrderPersister(
+    session_factory=lambda: AsyncSession(async_engine, expire_on_commit=False),
+    consumer=f'{socket.gethostname()}-{os.getpid()}',
+    batch_size=settings.ORDER_PERSIST_BATCH_SIZE,
+    block_ms=settings.ORDER_PERSIST_BLOCK_MS,
+    claim_idle_ms=settings.ORDER_PERSIST_CLAIM_IDLE_MS)
+
+
+product_cache = LRUCache(maxsize=settings.PRODUCT_CACHE_MAXSIZE, ttl=settings.PRODUCT_CACHE_TTL)
+def get_product_cache() -> LRUCache:
+    """
+    Retrieve the in-process cache of products, keyed by product ID and catalog version.
+
+    A product write moves the catalog to a new version, so changed products are never served
+    stale; entries also expire after `settings.PRODUCT_CACHE_TTL` seconds.
+
+    Returns
+    -------
+    LRUCache
+        The process-wide product cache.
+    """
+    return product_cache
+
+
+response_cache = LRUCache(
+    maxsize=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    ttl=settings.RESPONSE_CACHE_TTL,
+    max_bytes=settings.RESPONSE_CACHE_MAX_BYTES)
+def get_response_cache() -> LRUCache:
+    """
+    Retrieve the in-process cache of encoded catalog responses.
+
+    Values are the JSON bodies as bytes, so the cache is bounded by `settings.RESPONSE_CACHE_MAX_BYTES`
+    as well as by its number of entries.
+
+    Returns
+    -------
+    LRUCache
+        The process-wide response cache.
+    """
+    return response_cache
+
+
+search_engine: SemanticSearchEngine | None = None
+def get_search_engine() -> SemanticSearchEngine:
+    """
+    Retrieve the semantic search engine, creating it on first use.
+
+    The encoder is chosen by `settings.SEMANTIC_SEARCH_ENCODER`, and the index persisted at
+    `settings.SEMANTIC_SEARCH_INDEX_PATH` is memory-mapped if it exists.
+
+    Returns
+    -------
+    SemanticSearchEngine
+        The process-wide semantic search engine.
+    """
+    global search_engine
+    if search_engine is None:
+        encoder: Encoder
+        if settings.SEMANTIC_SEARCH_ENCODER == 'sentence-transformers':
+            encoder = SentenceTransformerEncoder(model_name=settings.SEMANTIC_SEARCH_MODEL)
+        else:
+            encoder = HashingEncoder()
+        search_engine = SemanticSearchEngine(encoder=encoder, index_path=settings.SEMANTIC_SEARCH_INDEX_PATH)
+    return search_engine
+
+
+# Keeps the semantic search index in step with the catalog; started in the app lifespan.
+search_indexer = SearchIndexer(
+    session_factory=lambda: Session(engine),
+    get_search_engine=get_search_engine,
+    interval=settings.SEMANTIC_SEARCH_SYNC_INTERVAL)
+
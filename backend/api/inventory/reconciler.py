@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import time
+from collections.abc import Callable
+
+from redis.asyncio import Redis as AsyncRedis
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import cruds.inventory as inventory_crud
+
+
+logger = logging.getLogger('uvicorn')
+
+
+class StockReconciler:
+    """
+    Background task keeping the Redis stock counts and `product.stock` in step.
+
+    Every `interval` seconds it releases the expired reservations, writes the units sold since the
+    previous round to the database and loads the stock of newly stock-limited products into Redis,
+    dropping that of the products no longer limited. Several instances may run it at once: every
+    step is atomic in Redis or relative in the database, and the units sold are applied exactly
+    once. A failed round is logged and retried on the next one.
+
+    Parameters
+    ----------
+    session_factory : Callable[[], AsyncSession]
+        Returns a new database session for each round.
+    interval : float
+        Seconds between two rounds.
+    """
+    def __init__(self, session_factory: Callable[[], AsyncSession], interval: float):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.redis_client: AsyncRedis | None = None
+        self.released: int = 0
+        self.reconciled: int = 0
+        self.failures: int = 0
+        self._task: asyncio.Task | None = None
+
+    async def run_once(self) -> None:
+        """Run one round: release expired reservations, reconcile the sales, load new stock."""
+        self.released += await inventory_crud.release_expired_reservations_async(
+            redis_client=self.redis_client, now=time.time())
+        async with self.session_factory() as session:
+            self.reconciled += await inventory_crud.reconcile_stock_async(
+                session=session, redis_client=self.redis_client)
+            await inventory_crud.load_stock_async(session=session, redis_client=self.redis_client)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f'Stock reconciliation failed: {e}')
+
+    async def start(self, redis_client: AsyncRedis) -> None:
+        """Load the stock into Redis, then reconcile every `interval` seconds in the background."""
+        self.redis_client = redis_client
+        # Products must be stock-limited before the first order is taken.
+        try:
+            await self.run_once()
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f'Initial stock load failed: {e}')
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.redis_client = None
+
+    def stats(self) -> dict[str, int]:
+        """Return the numbers of reservations released, units reconciled and failed rounds."""
+        return {'released': self.released, 'reconciled': self.reconciled, 'failures': self.failures}
@@ -1,15 +1,49 @@
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware # 追加
 
-from routers import auth, product, cart, order
+from routers import auth, product, cart, order, metrics
+import dependencies
+from caching.crud_cache import crud_cache
+from dependencies import (
+    jwks_cache, stock_reconciler, order_persister, search_indexer, engine, async_engine, connector_manager,
+    create_async_redis_client, close_async_redis_client)
 import settings
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Start the background services of the API and stop them at shutdown."""
+    if settings.LOCAL_TOKEN_VERIFICATION:
+        jwks_cache.start()
+    app.state.redis_client = dependencies.async_redis_client = create_async_redis_client()
+    await crud_cache.start(app.state.redis_client)
+    await stock_reconciler.start(app.state.redis_client)
+    # Also without ORDER_WRITE_BEHIND, so that orders queued before it was turned off are written.
+    await order_persister.start(app.state.redis_client)
+    search_indexer.start()
+    yield
+    await search_indexer.stop()
+    await order_persister.stop()
+    await stock_reconciler.stop()
+    await crud_cache.stop()
+    dependencies.async_redis_client = None
+    await close_async_redis_client(app.state.redis_client)
+    jwks_cache.stop()
+    engine.dispose()
+    await async_engine.dispose()
+    await connector_manager.close_async()
+    connector_manager.close()
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(auth.router, prefix='/api')
 app.include_router(product.router, prefix='/api')
 app.include_router(cart.router, prefix='/api')
 app.include_router(order.router, prefix='/api')
+app.include_router(metrics.router, prefix='/api')
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,6 +51,7 @@ app.add_middleware(
     allow_credentials=True,   # 追記により追加
     allow_methods=["*"],      # 追記により追加
     allow_headers=["*"],       # 追記により追加
+    expose_headers=["X-Total-Count"],
 )
 
 
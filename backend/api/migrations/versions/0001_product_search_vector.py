@@ -0,0 +1,42 @@
+"""Add a full-text search vector with a GIN index to product
+
+The base tables are created by `create_tables.py`; this revision only adds what `create_all`
+cannot express. `search_vector` is a stored generated column, so Postgres keeps it up to date
+on every insert and update of `name`, `author` or `description`.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Weights follow `ts_rank` defaults: name (A) counts most, then author (B), then description (C).
+    # The text search configuration must match `cruds.product.TS_CONFIG`.
+    op.execute(
+        """
+        ALTER TABLE product ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(author, '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+        ) STORED
+        """
+    )
+    op.create_index('ix_product_search_vector', 'product', ['search_vector'], postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_product_search_vector', table_name='product')
+    op.drop_column('product', 'search_vector')
@@ -0,0 +1,31 @@
+"""Add a nullable stock column to product
+
+NULL means the product is not stock-limited, which keeps every existing product orderable.
+Reservations and sales are counted in Redis (see `cruds/inventory.py`) and written back to this
+column in the background. The column has no `CHECK (stock >= 0)`: a reservation that expires
+before its order is committed is still counted, and the reconciliation must not fail on it.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('product', sa.Column('stock', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('product', 'stock')
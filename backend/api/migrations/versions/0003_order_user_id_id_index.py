@@ -0,0 +1,31 @@
+"""Replace the user_id index of order with a (user_id, id) index
+
+Order IDs are ULIDs, which sort by creation time, so a user's orders in a date range are a range of
+(user_id, id) and are read from this index in order, whatever the size of the history. It also
+serves every lookup the single-column index did.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_order_user_id_id', 'order', ['user_id', 'id'])
+    op.drop_index('ix_order_user_id', table_name='order')
+
+
+def downgrade() -> None:
+    op.create_index('ix_order_user_id', 'order', ['user_id'])
+    op.drop_index('ix_order_user_id_id', table_name='order')
@@ -0,0 +1,54 @@
+"""Record the unit price of order items and the item count and total of orders
+
+The columns are filled when an order is written (see `cruds/order.py`). Existing rows are backfilled
+from the current product prices, which is the best value available for them; the columns stay
+nullable so that the backfill can be skipped or redone on a live database.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('orderitem', sa.Column('unit_price', sa.Float(), nullable=True))
+    op.add_column('order', sa.Column('item_count', sa.Integer(), nullable=True))
+    op.add_column('order', sa.Column('total', sa.Float(), nullable=True))
+    op.execute(
+        """
+        UPDATE orderitem
+        SET unit_price = product.price
+        FROM product
+        WHERE product.id = orderitem.product_id AND orderitem.unit_price IS NULL
+        """
+    )
+    op.execute(
+        """
+        UPDATE "order"
+        SET item_count = totals.item_count, total = totals.total
+        FROM (
+            SELECT order_id, SUM(quantity) AS item_count, SUM(quantity * unit_price) AS total
+            FROM orderitem
+            GROUP BY order_id
+        ) AS totals
+        WHERE totals.order_id = "order".id AND "order".total IS NULL
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('order', 'total')
+    op.drop_column('order', 'item_count')
+    op.drop_column('orderitem', 'unit_price')
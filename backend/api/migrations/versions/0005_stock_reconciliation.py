@@ -0,0 +1,35 @@
+"""Record the applied stock reconciliation rounds
+
+A round moves the units sold from Redis to `product.stock` (see `cruds/inventory.py`). Its ID is
+inserted in the same transaction as the stock updates, so that a round retried after a crash
+between the commit and its deletion from Redis is recognized and skipped. Rows are ULIDs and are
+pruned by the reconciliation itself once they are a day old.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'stockreconciliation',
+        sa.Column('id', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('stockreconciliation')
@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import Optional
 
 from sqlmodel import SQLModel
 
@@ -29,22 +30,93 @@ class ProductRead(ProductBase):
     id: str
 
 
+class ProductPage(SQLModel):
+    items: list[ProductRead]
+    next_cursor: Optional[str] = None
+
+
+class ProductList(SQLModel):
+    items: list[ProductRead]
+    total: int
+    skip: int
+    limit: int
+
+
+class ProductBatchQuery(SQLModel):
+    ids: list[str]
+
+
+class ProductBatchRead(SQLModel):
+    items: list[ProductRead]
+    missing: list[str]
+
+
+class PopularProductRead(SQLModel):
+    product: ProductRead
+    units_sold: int
+
+
 class ProductCount(SQLModel):
     count: int
+    approximate: bool = False
+
+
+class CartItemRead(SQLModel):
+    product: ProductRead
+    quantity: int
+    line_total: float
+
+
+class CartDetailRead(SQLModel):
+    items: list[CartItemRead]
+    total_quantity: int
+    total: float
 
 
 class OrderItemRead(SQLModel):
     quantity: int
+    unit_price: Optional[float] = None
     product: ProductRead
 
 
 class OrderRead(SQLModel):
     id: str
     order_items: list[OrderItemRead]
+    item_count: Optional[int] = None
+    total: Optional[float] = None
     purchase_date: datetime
 
 
+class OrderPlaced(SQLModel):
+    message: str
+    id: str
+
+
+class CheckoutRead(SQLModel):
+    id: str
+    order_items: list[OrderItemCreate]
+    item_count: int
+    total: float
+    purchase_date: datetime
+
+
+class OrderSpend(SQLModel):
+    order_count: int
+    item_count: int
+    total: float
+
+
 class UserOrderRead(SQLModel):
     id: str
     email: str
     orders: list[OrderRead]
+    next_cursor: Optional[str] = None
+
+
+class RejectedOrderRead(SQLModel):
+    id: str
+    order_items: list[OrderItemCreate]
+    item_count: Optional[int] = None
+    total: Optional[float] = None
+    purchase_date: datetime
+    reason: str
@@ -1,6 +1,7 @@
 from typing import Optional
 
 import ulid
+from sqlalchemy import Index
 from sqlmodel import Field, Relationship, SQLModel
 
 from models.base_models import *
@@ -14,8 +15,14 @@ class User(SQLModel, table=True):
 
 
 class Order(SQLModel, table=True):
+    # A user's orders are read as a range of their time-sorted ULIDs, which this index serves directly.
+    __table_args__ = (Index("ix_order_user_id_id", "user_id", "id"),)
+
     id: str = Field(default_factory=lambda: str(ulid.new()), primary_key=True)
-    user_id: str = Field(foreign_key="user.id", index=True)
+    user_id: str = Field(foreign_key="user.id")
+    # Precomputed from the order items when the order is written, so that totals need no join.
+    item_count: Optional[int] = Field(default=None)
+    total: Optional[float] = Field(default=None)
 
     user: Optional["User"] = Relationship(back_populates="orders")
     order_items: list["OrderItem"] = Relationship(back_populates="order")
@@ -26,6 +33,8 @@ class OrderItem(SQLModel, table=True):
     order_id: str = Field(foreign_key="order.id", index=True)
     product_id: str = Field(foreign_key="product.id", index=True)
     quantity: int
+    # Price of the product when it was ordered, unaffected by later price changes.
+    unit_price: Optional[float] = Field(default=None)
 
     order: Optional["Order"] = Relationship(back_populates="order_items")
     product: Optional["Product"] = Relationship(back_populates="order_items")
@@ -33,5 +42,15 @@ class OrderItem(SQLModel, table=True):
 
 class Product(ProductBase, table=True):
     id: str = Field(primary_key=True)
+    # Units left to sell, or None if the product is not stock-limited. Kept up to date from the
+    # Redis counts by `cruds.inventory.reconcile_stock`, which are authoritative while it lags, so it
+    # is changed with `cruds.inventory.adjust_stock` rather than written directly.
+    stock: Optional[int] = Field(default=None)
     
     order_items: list["OrderItem"] = Relationship(back_populates="product")
+
+
+class StockReconciliation(SQLModel, table=True):
+    # ID of a round of `cruds.inventory.reconcile_stock`, inserted with its stock updates so that a
+    # round retried after a crash is never applied twice.
+    id: str = Field(primary_key=True)
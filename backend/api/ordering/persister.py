@@ -0,0 +1,183 @@
+import asyncio
+import logging
+from collections.abc import Callable
+
+from redis import ResponseError
+from redis.asyncio import Redis as AsyncRedis
+from sqlalchemy.exc import IntegrityError
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import cruds.inventory as inventory_crud
+import cruds.order as order_crud
+import cruds.order_stream as order_stream_crud
+import cruds.popularity as popularity_crud
+from models.reqres_models import OrderItemCreate
+from models.table_models import Order
+from ulid_time import ulid_timestamp_ms
+
+
+logger = logging.getLogger('uvicorn')
+
+
+class OrderPersister:
+    """
+    Background task writing the orders of the write-behind stream to the database in batches.
+
+    It reads up to `batch_size` orders at a time as one consumer of the persister group, writes them
+    with `cruds.order.save_orders` in one transaction and only then acknowledges them, so an order
+    is never lost: if the write or the process fails, the orders are claimed again after
+    `claim_idle_ms` and written once, as writes are keyed on the order ULID. If a batch is rejected
+    by the database, its orders are written one by one and those still rejected are moved to the
+    dead-letter stream and recorded as rejected for their users, and their units are given back to
+    the stock and taken out of the best-seller rankings. Several instances may run it at once.
+
+    Parameters
+    ----------
+    session_factory : Callable[[], AsyncSession]
+        Returns a new database session for each batch.
+    consumer : str
+        The name of this consumer in the group, unique per process.
+    batch_size : int
+        The maximum number of orders written per transaction.
+    block_ms : int
+        How long a read waits for new orders, in milliseconds.
+    claim_idle_ms : int
+        How long an order stays unacknowledged before it is claimed again, in milliseconds.
+    retry_interval : float, optional
+        Seconds to wait after a failed batch. Default is 1.
+    """
+    def __init__(
+            self,
+            session_factory: Callable[[], AsyncSession],
+            consumer: str,
+            batch_size: int,
+            block_ms: int,
+            claim_idle_ms: int,
+            retry_interval: float = 1.0,
+        ):
+        self.session_factory = session_factory
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.retry_interval = retry_interval
+        self.redis_client: AsyncRedis | None = None
+        self.persisted: int = 0
+        self.batches: int = 0
+        self.dead_lettered: int = 0
+        self.failures: int = 0
+        self._task: asyncio.Task | None = None
+
+    async def run_once(self) -> int:
+        """
+        Write one batch of orders, waiting up to `block_ms` for some to arrive.
+
+        Returns
+        -------
+        int
+            The number of orders taken from the stream.
+        """
+        batch: list[tuple[str, bytes]] = await order_stream_crud.read_order_batch_async(
+            redis_client=self.redis_client, consumer=self.consumer, count=self.batch_size,
+            block_ms=self.block_ms, claim_idle_ms=self.claim_idle_ms)
+        if not batch:
+            return 0
+        entries: list[tuple[str, Order]] = [
+            (entry_id, order_stream_crud.load_order(raw)) for entry_id, raw in batch]
+
+        try:
+            async with self.session_factory() as session:
+                self.persisted += await order_crud.save_orders_async(
+                    session=session, orders=[order for _, order in entries])
+        except IntegrityError:
+            await self._persist_one_by_one(entries)
+        else:
+            await order_stream_crud.acknowledge_orders_async(redis_client=self.redis_client, entries=entries)
+        self.batches += 1
+        return len(entries)
+
+    async def _persist_one_by_one(self, entries: list[tuple[str, Order]]) -> None:
+        # Isolate the orders the database rejects, so that they do not hold the others back.
+        for entry_id, order in entries:
+            try:
+                async with self.session_factory() as session:
+                    self.persisted += await order_crud.save_orders_async(session=session, orders=[order])
+            except IntegrityError as e:
+                logger.error(f'Order {order.id} was rejected by the database and moved to the dead letters: {e}')
+                await order_stream_crud.dead_letter_order_async(
+                    redis_client=self.redis_client, entry_id=entry_id, order=order, error=str(e.orig))
+                self.dead_lettered += 1
+                await self._compensate(order)
+            else:
+                await order_stream_crud.acknowledge_orders_async(
+                    redis_client=self.redis_client, entries=[(entry_id, order)])
+
+    async def _compensate(self, order: Order) -> None:
+        # The order was taken as sold when it was accepted: give its units back to the stock and
+        # take them out of the best-seller rankings.
+        order_items: list[OrderItemCreate] = [
+            OrderItemCreate(product_id=order_item.product_id, quantity=order_item.quantity)
+            for order_item in order.order_items]
+        try:
+            async with self.session_factory() as session:
+                for order_item in order_items:
+                    try:
+                        await inventory_crud.adjust_stock_async(
+                            session=session, redis_client=self.redis_client,
+                            product_id=order_item.product_id, units=order_item.quantity)
+                    except ValueError:
+                        # Not stock-limited (or deleted): nothing was taken from its stock.
+                        pass
+            await popularity_crud.retract_sales_async(
+                redis_client=self.redis_client, order_items=order_items, now=ulid_timestamp_ms(order.id) / 1000)
+        except Exception as e:
+            # The order is in the dead letters, from which support can correct the counts.
+            logger.error(f'Could not give back the stock and sales of rejected order {order.id}: {e}')
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except ResponseError as e:
+                self.failures += 1
+                logger.warning(f'Writing queued orders failed: {e}')
+                # The group is lost with the data of a Redis server restarted without persistence.
+                if 'NOGROUP' in str(e):
+                    await order_stream_crud.create_order_group_async(redis_client=self.redis_client)
+                await asyncio.sleep(self.retry_interval)
+            except Exception as e:
+                # The batch stays unacknowledged and is claimed again after `claim_idle_ms`.
+                self.failures += 1
+                logger.warning(f'Writing queued orders failed: {e}')
+                await asyncio.sleep(self.retry_interval)
+
+    async def start(self, redis_client: AsyncRedis) -> None:
+        """Create the consumer group if needed, then write the queued orders in the background."""
+        self.redis_client = redis_client
+        try:
+            await order_stream_crud.create_order_group_async(redis_client=redis_client)
+        except Exception as e:
+            # Created by the background task once Redis is reachable (see the `NOGROUP` handling).
+            self.failures += 1
+            logger.warning(f'Creating the order group failed: {e}')
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task. Orders taken but not written yet are claimed again later."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.redis_client = None
+
+    def stats(self) -> dict[str, int]:
+        """Return the numbers of orders written, batches, dead-lettered orders and failed batches."""
+        return {
+            'persisted': self.persisted,
+            'batches': self.batches,
+            'dead_lettered': self.dead_lettered,
+            'failures': self.failures,
+        }
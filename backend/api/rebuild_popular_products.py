@@ -0,0 +1,18 @@
+import argparse
+import time
+
+from sqlmodel import Session
+
+import cruds.popularity as popularity_crud
+from dependencies import engine, redis_client
+
+
+if __name__ == '__main__':
+    # Run after restoring Redis or importing orders outside the API, so that the best-seller
+    # rankings match the order history again.
+    parser = argparse.ArgumentParser(description='Recompute the best-seller rankings from the orders in the database.')
+    parser.add_argument('--batch-size', type=int, default=10000, help='Order items read and written per batch.')
+    args = parser.parse_args()
+    with Session(engine) as session:
+        print(popularity_crud.rebuild_popularity(
+            session=session, redis_client=redis_client, now=time.time(), batch_size=args.batch_size))
@@ -0,0 +1,59 @@
+import hashlib
+from collections.abc import Sequence
+from typing import Any
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from redis.exceptions import NoScriptError
+
+
+class RedisScript:
+    """
+    A Lua script run on the Redis server with `EVALSHA`.
+
+    The SHA1 digest is computed once when the module is imported, so a call costs a single round trip
+    and never sends the script body. If the server does not know the script yet (first use, restart,
+    failover or `SCRIPT FLUSH`), it answers `NOSCRIPT`; the script is then loaded with `SCRIPT LOAD`
+    and the call is retried once. Unlike `Redis.register_script`, an instance is not bound to a client,
+    so it can be defined at module level and run with both the sync and the async client.
+
+    Parameters
+    ----------
+    source : str
+        The Lua source of the script.
+    """
+    def __init__(self, source: str):
+        self.source = source
+        self.sha: str = hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+    def run(self, redis_client: Redis, keys: Sequence[str], args: Sequence[Any]) -> Any:
+        """
+        Run the script with a synchronous client.
+
+        Parameters
+        ----------
+        redis_client : Redis
+            The Redis client instance to communicate with the Redis server.
+        keys : Sequence[str]
+            The keys the script touches, available as `KEYS` in Lua.
+        args : Sequence[Any]
+            The other arguments, available as `ARGV` in Lua.
+
+        Returns
+        -------
+        Any
+            The value returned by the script.
+        """
+        try:
+            return redis_client.evalsha(self.sha, len(keys), *keys, *args)
+        except NoScriptError:
+            redis_client.script_load(self.source)
+            return redis_client.evalsha(self.sha, len(keys), *keys, *args)
+
+    async def run_async(self, redis_client: AsyncRedis, keys: Sequence[str], args: Sequence[Any]) -> Any:
+        """Asynchronous version of `run`."""
+        try:
+            return await redis_client.evalsha(self.sha, len(keys), *keys, *args)
+        except NoScriptError:
+            await redis_client.script_load(self.source)
+            return await redis_client.evalsha(self.sha, len(keys), *keys, *args)
@@ -2,18 +2,19 @@ import os
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException, Response, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 import firebase_admin
 from firebase_admin._user_mgt import UserRecord
 from firebase_admin import credentials, auth
 import pyrebase
 from pyrebase.pyrebase import Auth
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 import logging
 
 import cruds.auth as auth_crud
 from models.reqres_models import SignUpCreate, UserRead, Message
-from dependencies import verify_token, get_session
+from dependencies import verify_token, verify_id_token, get_async_session, token_cache
 from models.table_models import User
 import settings
 
@@ -34,8 +35,8 @@ token_store: dict[str, str] = {}
 
 
 @router.post('/signup', response_model=Message)
-def create_account(
-        session: Annotated[Session, Depends(get_session)],
+async def create_account(
+        session: Annotated[AsyncSession, Depends(get_async_session)],
         user_data: SignUpCreate,
     ) -> Message:
     """
@@ -64,9 +65,9 @@ def create_account(
     password: str = user_data.password
 
     try:
-        user: UserRecord = auth.create_user(email=email, password=password)
+        user: UserRecord = await run_in_threadpool(auth.create_user, email=email, password=password)
         user_id: str = user.uid
-        auth_crud.append_user(session=session, user_id=user_id, email=email)
+        await auth_crud.append_user_async(session=session, user_id=user_id, email=email)
         return {'message': f'Account created successfully for user {user_id}'}
     except auth.EmailAlreadyExistsError:
         raise HTTPException(
@@ -75,7 +76,7 @@ def create_account(
 
 
 @router.post('/login', response_model=Message)
-def create_access_token(
+async def create_access_token(
         user_data: Annotated[OAuth2PasswordRequestForm, Depends()], 
         response: Response
     ) -> Message:
@@ -106,7 +107,8 @@ def create_access_token(
     password: str = user_data.password
 
     try:
-        user_logged: dict = firebase_auth.sign_in_with_email_and_password(
+        user_logged: dict = await run_in_threadpool(
+            firebase_auth.sign_in_with_email_and_password,
             email=email,
             password=password)
         token: str = user_logged['idToken']
@@ -131,7 +133,7 @@ def create_access_token(
     
 
 @router.post('/logout', response_model=Message)
-def logout(response: Response) -> Message:
+async def logout(response: Response) -> Message:
     """
     Log out the user by removing the access token from the cookie.
 
@@ -150,14 +152,14 @@ def logout(response: Response) -> Message:
     
 
 @router.get('/refresh')
-def refresh_access_token(token: Annotated[dict, Depends(verify_token)]):
+async def refresh_access_token(token: Annotated[dict, Depends(verify_token)]):
     refresh_token = token_store.get('refresh_token')
     if refresh_token is None:
         raise HTTPException(
             status_code=400,
             detail=f'refresh_token is None')
     
-    user = firebase_auth.refresh(refresh_token)
+    user = await run_in_threadpool(firebase_auth.refresh, refresh_token)
     token: str = user['idToken']
 
     logger.info(f'refresh token: {token_store}')
@@ -166,7 +168,7 @@ def refresh_access_token(token: Annotated[dict, Depends(verify_token)]):
     
 
 @router.get('/is-logged-in')
-def is_logged_in(request: Request):
+async def is_logged_in(request: Request):
     # access_tokenの確認を行います
     token = request.cookies.get("access_token")
     logger.info(token)
@@ -174,20 +176,20 @@ def is_logged_in(request: Request):
         return {"isLoggedIn": False}
     
     try:
-        auth.verify_id_token(token)
+        await run_in_threadpool(token_cache.verify, token, verify_id_token)
         return {"isLoggedIn": True}
     except:
         return {"isLoggedIn": False}
 
 
 @router.get('/ping')
-def validate_token(token: Annotated[dict, Depends(verify_token)]):
+async def validate_token(token: Annotated[dict, Depends(verify_token)]):
     return {"user_id": token["uid"]}
 
 
 @router.get('/user', response_model=UserRead)
-def read_user(
-        session: Annotated[Session, Depends(get_session)],
+async def read_user(
+        session: Annotated[AsyncSession, Depends(get_async_session)],
         token: Annotated[dict, Depends(verify_token)],
     ) -> UserRead:
     """
@@ -207,15 +209,15 @@ def read_user(
         If the user is not found in the database.
     """
     user_id: str = token['uid']
-    user: User | None = auth_crud.get_user(session=session, user_id=user_id)
+    user: User | None = await auth_crud.get_user_async(session=session, user_id=user_id)
     if user is None:
         raise HTTPException(status_code=400, detail='User not found')
     return user
 
 
 @router.delete('/user', response_model=Message)
-def delete_user(
-        session: Annotated[Session, Depends(get_session)],
+async def delete_user(
+        session: Annotated[AsyncSession, Depends(get_async_session)],
         token: Annotated[dict, Depends(verify_token)],
     ) -> Message:
     """
@@ -237,13 +239,13 @@ def delete_user(
         If the user is not found in the database or there's any problem during the deletion process.
     """
     user_id: str = token['uid']
-    user: User | None = auth_crud.get_user(session=session, user_id=user_id)
+    user: User | None = await auth_crud.get_user_async(session=session, user_id=user_id)
     if user is None:
         raise HTTPException(status_code=400, detail='User not found')
     
     try:
-        auth.delete_user(uid=user_id)
-        auth_crud.delete_user(session=session, db_user=user)
+        await run_in_threadpool(auth.delete_user, uid=user_id)
+        await auth_crud.delete_user_async(session=session, db_user=user)
         return {"message": "User successfully deleted."}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Could not delete user: {e}")
@@ -1,11 +1,15 @@
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException
-from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 import cruds.cart as cart_crud
-from dependencies import verify_token, get_redis_client
-from models.reqres_models import OrderItemCreate, Message
+import cruds.product as product_crud
+from dependencies import verify_token, get_async_redis_client, get_async_session
+from models.table_models import Product
+from models.reqres_models import OrderItemCreate, Message, CartItemRead, CartDetailRead
+import settings
 
 
 router = APIRouter(
@@ -15,13 +19,13 @@ router = APIRouter(
 
 
 @router.post('', response_model=Message)
-def add_to_cart(
-        redis_client: Annotated[Redis, Depends(get_redis_client)],
+async def add_to_cart(
+        redis_client: Annotated[AsyncRedis, Depends(get_async_redis_client)],
         token: Annotated[dict, Depends(verify_token)],
         order_item: OrderItemCreate, 
     ) -> Message:
     """
-    Add an item to the user's cart.
+    Add an item to the user's cart. The quantity of a product is capped at `CART_MAX_QUANTITY`.
 
     Parameters
     ----------
@@ -35,20 +39,21 @@ def add_to_cart(
     """
     user_id: str = token['uid']
     try:
-        cart_crud.add_to_cart(redis_client=redis_client, user_id=user_id, order_item=order_item)
+        await cart_crud.add_to_cart_async(
+            redis_client=redis_client, user_id=user_id, order_item=order_item, max_quantity=settings.CART_MAX_QUANTITY)
         return {'message': 'Item added to cart successfully.'}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.put('', response_model=Message)
-def update_cart_product(
-        redis_client: Annotated[Redis, Depends(get_redis_client)],
+async def update_cart_product(
+        redis_client: Annotated[AsyncRedis, Depends(get_async_redis_client)],
         token: Annotated[dict, Depends(verify_token)],
         order_item: OrderItemCreate, 
     ) -> Message:
     """
-    Update the quantity of an item in the user's cart.
+    Update the quantity of an item in the user's cart. The quantity is capped at `CART_MAX_QUANTITY`.
 
     Parameters
     ----------
@@ -64,15 +69,16 @@ def update_cart_product(
     """
     user_id: str = token['uid']
     try:
-        cart_crud.update_cart_product(redis_client=redis_client, user_id=user_id, order_item=order_item)
+        await cart_crud.update_cart_product_async(
+            redis_client=redis_client, user_id=user_id, order_item=order_item, max_quantity=settings.CART_MAX_QUANTITY)
         return {'message': 'Item quantity updated successfully.'}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get('', response_model=dict[str, int])
-def get_cart(
-        redis_client: Annotated[Redis, Depends(get_redis_client)],
+async def get_cart(
+        redis_client: Annotated[AsyncRedis, Depends(get_async_redis_client)],
         token: Annotated[dict, Depends(verify_token)],
     ):
     """
@@ -85,13 +91,45 @@ def get_cart(
         e.g., {"1111111": 1, "2111111": 3}
     """
     user_id: str = token['uid']
-    cart_products: dict[str, int] = cart_crud.get_cart(redis_client=redis_client, user_id=user_id)
+    cart_products: dict[str, int] = await cart_crud.get_cart_async(redis_client=redis_client, user_id=user_id)
     return cart_products
 
 
+@router.get('/details', response_model=CartDetailRead)
+async def get_cart_details(
+        redis_client: Annotated[AsyncRedis, Depends(get_async_redis_client)],
+        session: Annotated[AsyncSession, Depends(get_async_session)],
+        token: Annotated[dict, Depends(verify_token)],
+    ) -> CartDetailRead:
+    """
+    Retrieve the user's cart with its products, line totals and grand total.
+
+    All products of the cart are loaded with one query. Products that no longer exist are left out.
+
+    Returns
+    -------
+    CartDetailRead\n
+        The cart items with their product, quantity and line total, and the total quantity and amount.
+    """
+    user_id: str = token['uid']
+    cart_products: dict[str, int] = await cart_crud.get_cart_async(redis_client=redis_client, user_id=user_id)
+    products: list[Product] = await product_crud.read_products_by_ids_async(
+        session=session, product_ids=list(cart_products))
+    items: list[CartItemRead] = [
+        CartItemRead(
+            product=product,
+            quantity=cart_products[product.id],
+            line_total=product.price * cart_products[product.id])
+        for product in products]
+    return CartDetailRead(
+        items=items,
+        total_quantity=sum(item.quantity for item in items),
+        total=sum(item.line_total for item in items))
+
+
 @router.delete('', response_model=Message)
-def remove_from_cart(
-        redis_client: Annotated[Redis, Depends(get_redis_client)],
+async def remove_from_cart(
+        redis_client: Annotated[AsyncRedis, Depends(get_async_redis_client)],
         token: Annotated[dict, Depends(verify_token)],
     ) -> Message:
     """
@@ -103,5 +141,5 @@ def remove_from_cart(
         A success message indicating all items were removed.
     """
     user_id: str = token['uid']
-    cart_crud.remove_from_cart(redis_client=redis_client, user_id=user_id)
+    await cart_crud.remove_from_cart_async(redis_client=redis_client, user_id=user_id)
     return {'message': 'Item successfully removed from cart.'}
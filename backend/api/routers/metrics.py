@@ -0,0 +1,119 @@
+import time
+from typing import Annotated
+
+from fastapi import APIRouter, Depends
+from redis.asyncio import Redis as AsyncRedis
+
+import cruds.order_stream as order_stream_crud
+from caching.crud_cache import crud_cache
+from database import pool_status
+from dependencies import (
+    engine, async_engine, token_cache, product_cache, response_cache, stock_reconciler, order_persister,
+    get_async_redis_client, verify_admin)
+
+
+router = APIRouter(
+    prefix='/metrics',
+    tags=['Metrics'],
+    dependencies=[Depends(verify_admin)],
+    responses={404: {'message': 'Not found'}})
+
+
+@router.get('/token-cache', response_model=dict[str, int | float | bool])
+def read_token_cache_metrics() -> dict[str, int | float | bool]:
+    """
+    Report the size and the hit and miss counters of the verified token cache.
+
+    Returns
+    -------
+    dict[str, int | float | bool]\n
+        Whether the cache is enabled, its size and capacity, and its hit, miss and eviction counts.
+    """
+    return token_cache.stats()
+
+
+@router.get('/db-pool', response_model=dict[str, dict[str, int | float]])
+def read_db_pool_metrics() -> dict[str, dict[str, int | float]]:
+    """
+    Report the state of the database connection pools of the sync and the async engine.
+
+    Returns
+    -------
+    dict[str, dict[str, int | float]]\n
+        For `sync` and `async`, the pool size, the connections in use, idle and in overflow, and how
+        long checkouts waited for a connection.
+    """
+    return {'sync': pool_status(engine), 'async': pool_status(async_engine.sync_engine)}
+
+
+@router.get('/product-cache', response_model=dict[str, int | float])
+def read_product_cache_metrics() -> dict[str, int | float]:
+    """
+    Report the size and the hit and miss counters of the product cache.
+
+    Returns
+    -------
+    dict[str, int | float]\n
+        The cache size and capacity, and its hit, miss and eviction counts.
+    """
+    return product_cache.stats()
+
+
+@router.get('/response-cache', response_model=dict[str, int | float])
+def read_response_cache_metrics() -> dict[str, int | float]:
+    """
+    Report the size, the bytes held and the hit and miss counters of the catalog response cache.
+
+    Returns
+    -------
+    dict[str, int | float]\n
+        The number of entries and bytes held with their limits, and the hit, miss and eviction counts.
+    """
+    return response_cache.stats()
+
+
+@router.get('/crud-cache', response_model=dict[str, int | float | bool])
+def read_crud_cache_metrics() -> dict[str, int | float | bool]:
+    """
+    Report the counters of the two-tier CRUD cache.
+
+    Returns
+    -------
+    dict[str, int | float | bool]\n
+        Whether the cache is enabled, the size and hit, miss and eviction counts of the in-process tier,
+        the hit and miss counts of the Redis tier, and how many loads ran, were coalesced into another
+        one, were started early or waited for another instance's lock.
+    """
+    return crud_cache.stats()
+
+
+@router.get('/stock-reconciler', response_model=dict[str, int])
+def read_stock_reconciler_metrics() -> dict[str, int]:
+    """
+    Report the counters of the background stock reconciliation.
+
+    Returns
+    -------
+    dict[str, int]\n
+        The numbers of expired reservations released, of sold units written to the database and of
+        failed rounds since the process started.
+    """
+    return stock_reconciler.stats()
+
+
+@router.get('/order-persister', response_model=dict[str, int | float])
+async def read_order_persister_metrics(
+        redis_client: Annotated[AsyncRedis, Depends(get_async_redis_client)],
+    ) -> dict[str, int | float]:
+    """
+    Report the counters of the write-behind order persister and how far behind it is.
+
+    Returns
+    -------
+    dict[str, int | float]\n
+        The numbers of orders written, batches, dead-lettered orders and failed batches of this process,
+        and, for all instances, the number of queued orders not written yet (`lag`) and the age of the
+        oldest one in seconds (`lag_seconds`).
+    """
+    lag, lag_seconds = await order_stream_crud.get_order_stream_lag_async(redis_client=redis_client, now=time.time())
+    return {**order_persister.stats(), 'lag': lag, 'lag_seconds': lag_seconds}
@@ -3,13 +3,28 @@ import logging
 from datetime import datetime
 
 import ulid
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlmodel import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from redis import RedisError
+from redis.asyncio import Redis as AsyncRedis
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+import cruds.auth as auth_crud
+import cruds.cart as cart_crud
+import cruds.idempotency as idempotency_crud
+import cruds.inventory as inventory_crud
 import cruds.order as order_crud
-from models.table_models import Order, User
-from models.reqres_models import OrderItemCreate, OrderRead, UserOrderRead, Message
-from dependencies import get_session, verify_token
+import cruds.order_stream as order_stream_crud
+import cruds.popularity as popularity_crud
+import cruds.product as product_crud
+from models.table_models import Order, Product, User
+from models.reqres_models import (
+    OrderItemCreate, OrderItemRead, OrderRead, OrderPlaced, CheckoutRead, OrderSpend, UserOrderRead,
+    RejectedOrderRead)
+from dependencies import get_async_session, get_async_redis_client, verify_token
+import settings
+from ulid_time import ulid_lower_bound, ulid_timestamp_ms, ulid_to_datetime
 
 
 logger = logging.getLogger('uvicorn')
@@ -20,15 +35,260 @@ router = APIRouter(
     responses={404: {'message': 'Not found'}})
 
 
-@router.post('', response_model=Message)
-def create_order(
-        session: Annotated[Session, Depends(get_session)],
+async def _place_order(
+        session: AsyncSession,
+        redis_client: AsyncRedis,
+        user_id: str,
+        order_items: list[OrderItemCreate],
+    ) -> Order:
+    """
+    Reserve the stock of the order, store the order, then turn the reservation into sales and
+    add them to the best-seller rankings.
+
+    With `settings.ORDER_WRITE_BEHIND`, the checked order is queued in the Redis stream instead of
+    being written, and `dependencies.order_persister` writes it shortly after. The reservation is
+    released if the order cannot be stored, so the units go back on sale at once.
+
+    If Redis is unavailable, an order of products that are not stock-limited is stored without
+    a reservation, while an order of a stock-limited product is refused, since its stock cannot be
+    checked.
+
+    Raises
+    ------
+    HTTPException
+        With status 400 if the order is invalid, 409 if a product is out of stock, or 503 if the
+        stock cannot be reserved.
+    """
+    reservation_id: str | None = await _reserve_stock(
+        session=session, redis_client=redis_client, user_id=user_id, order_items=order_items)
+    db_order: Order = await _store_order_or_release(
+        session=session, redis_client=redis_client, reservation_id=reservation_id, user_id=user_id,
+        order_items=order_items)
+    await _commit_order_side_effects(
+        redis_client=redis_client, reservation_id=reservation_id, db_order=db_order, order_items=order_items)
+    return db_order
+
+
+async def _reserve_stock(
+        session: AsyncSession,
+        redis_client: AsyncRedis,
+        user_id: str,
+        order_items: list[OrderItemCreate],
+    ) -> str | None:
+    """Reserve the stock of an order and return the reservation ID, or None if the order goes without one."""
+    reservation_id: str = f'order:{user_id}:{ulid.new()}'
+    try:
+        out_of_stock: list[str] = await inventory_crud.reserve_stock_async(
+            redis_client=redis_client, reservation_id=reservation_id, order_items=order_items,
+            ttl=settings.STOCK_RESERVATION_TTL)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RedisError as e:
+        products: list[Product] = await product_crud.read_products_by_ids_async(
+            session=session, product_ids=[order_item.product_id for order_item in order_items])
+        if any(product.stock is not None for product in products):
+            logger.error(f'Could not reserve the stock of an order: {e}')
+            raise HTTPException(status_code=503, detail='Stock is temporarily unavailable')
+        logger.warning(f'Storing an order without stock reservation: {e}')
+        return None
+    if out_of_stock:
+        raise HTTPException(status_code=409, detail=f'Out of stock: {", ".join(out_of_stock)}')
+    return reservation_id
+
+
+async def _store_order_or_release(
+        session: AsyncSession,
+        redis_client: AsyncRedis,
+        reservation_id: str | None,
+        user_id: str,
+        order_items: list[OrderItemCreate],
+    ) -> Order:
+    """Write the order, or queue it in write-behind mode, releasing the reservation if that fails."""
+    try:
+        if settings.ORDER_WRITE_BEHIND:
+            db_order: Order = await order_crud.prepare_order_async(
+                session=session, user_id=user_id, order_items=order_items)
+            await order_stream_crud.enqueue_order_async(redis_client=redis_client, order=db_order)
+        else:
+            db_order = await order_crud.create_order_with_items_async(
+                session=session, user_id=user_id, order_items=order_items)
+    except BaseException as e:
+        if reservation_id is not None:
+            try:
+                await inventory_crud.release_reservation_async(redis_client=redis_client, reservation_id=reservation_id)
+            except RedisError as release_error:
+                # The units go back on sale when the reservation expires.
+                logger.warning(f'Could not release the stock reservation {reservation_id}: {release_error}')
+        if isinstance(e, ValueError):
+            raise HTTPException(status_code=400, detail=str(e))
+        raise
+    return db_order
+
+
+async def _commit_order_side_effects(
+        redis_client: AsyncRedis,
+        reservation_id: str | None,
+        db_order: Order,
+        order_items: list[OrderItemCreate],
+    ) -> None:
+    """Turn the reservation of a stored order into sales and add them to the best-seller rankings."""
+    if reservation_id is not None:
+        try:
+            live: bool = await inventory_crud.commit_reservation_async(
+                redis_client=redis_client, reservation_id=reservation_id, order_items=order_items)
+            if not live:
+                logger.warning(f'Stock reservation of order {db_order.id} expired before it was committed')
+        except RedisError as e:
+            # The units stay reserved until the reservation expires, then go back on sale: log it to correct the stock.
+            logger.error(f'Could not commit the stock reservation of order {db_order.id}: {e}')
+    try:
+        await popularity_crud.record_sales_async(
+            redis_client=redis_client, order_items=order_items, now=ulid_timestamp_ms(db_order.id) / 1000)
+    except RedisError as e:
+        # The rankings miss the order until `rebuild_popular_products.py` is run.
+        logger.warning(f'Could not add order {db_order.id} to the best-seller rankings: {e}')
+
+
+async def _read_pending_orders(redis_client: AsyncRedis, user_id: str) -> list[Order]:
+    # Without write-behind every order is in the database. If Redis fails, the orders queued there are
+    # left out until they are written, rather than failing the whole history.
+    if not settings.ORDER_WRITE_BEHIND:
+        return []
+    try:
+        return await order_stream_crud.read_pending_orders_async(redis_client=redis_client, user_id=user_id)
+    except RedisError as e:
+        logger.warning(f'Could not read the queued orders of {user_id}: {e}')
+        return []
+
+
+def _check_date_range(start: datetime | None, end: datetime | None) -> None:
+    # Compared as timestamps, so that a naive and an aware datetime can be mixed.
+    if start is not None and end is not None and start.timestamp() > end.timestamp():
+        raise HTTPException(status_code=400, detail='`from` must not be later than `to`')
+
+
+def _in_date_range(orders: list[Order], start: datetime | None, end: datetime | None) -> list[Order]:
+    lower: str | None = ulid_lower_bound(start) if start is not None else None
+    upper: str | None = ulid_lower_bound(end) if end is not None else None
+    return [
+        order for order in orders
+        if (lower is None or order.id >= lower) and (upper is None or order.id < upper)]
+
+
+async def _merge_pending_orders(
+        session: AsyncSession,
+        order_read_list: list[OrderRead],
+        next_cursor: str | None,
+        pending_orders: list[Order],
+        cursor: str | None,
+        limit: int,
+        start: datetime | None,
+        end: datetime | None,
+    ) -> tuple[list[OrderRead], str | None]:
+    """Add the pending orders that fall in a page of stored orders, and return the page with its next cursor."""
+    stored_ids: set[str] = {order_read.id for order_read in order_read_list}
+    # Pending orders older than the page belong to a later one; those written meanwhile are already listed.
+    pending_orders = [
+        order for order in _in_date_range(pending_orders, start, end)
+        if order.id not in stored_ids
+        and (cursor is None or order.id < cursor)
+        and (next_cursor is None or order.id > next_cursor)]
+    if not pending_orders:
+        return order_read_list, next_cursor
+
+    product_ids: list[str] = [order_item.product_id for order in pending_orders for order_item in order.order_items]
+    products: dict[str, Product] = {
+        product.id: product
+        for product in await product_crud.read_products_by_ids_async(session=session, product_ids=product_ids)}
+    pending_read_list: list[OrderRead] = [
+        OrderRead(
+            id=order.id,
+            order_items=[
+                OrderItemRead(
+                    quantity=order_item.quantity, unit_price=order_item.unit_price,
+                    product=products[order_item.product_id])
+                for order_item in order.order_items if order_item.product_id in products],
+            item_count=order.item_count,
+            total=order.total,
+            purchase_date=ulid_to_datetime(order.id))
+        for order in pending_orders]
+
+    merged: list[OrderRead] = sorted(
+        order_read_list + pending_read_list, key=lambda order_read: order_read.id, reverse=True)
+    if len(merged) > limit:
+        merged = merged[:limit]
+        next_cursor = merged[-1].id
+    return merged, next_cursor
+
+
+async def _begin_checkout(redis_client: AsyncRedis, scope: str, idempotency_key: str | None) -> JSONResponse | None:
+    """
+    Claim the Idempotency-Key of a checkout, returning the recorded response if the key was used before.
+
+    Raises
+    ------
+    HTTPException
+        With status 409 if a checkout with the same key is still in progress.
+    """
+    if idempotency_key is None:
+        return None
+    record: dict | None = await idempotency_crud.begin_idempotent_request_async(
+        redis_client=redis_client, scope=scope, key=idempotency_key, pending_ttl=settings.IDEMPOTENCY_PENDING_TTL)
+    if record is None:
+        return None
+    if record['status'] == idempotency_crud.PENDING:
+        raise HTTPException(status_code=409, detail='A checkout with this Idempotency-Key is in progress')
+    return JSONResponse(
+        status_code=record['status_code'], content=record['body'], headers={'Idempotent-Replayed': 'true'})
+
+
+async def _abort_checkout(
+        redis_client: AsyncRedis,
+        scope: str,
+        idempotency_key: str | None,
+        error: HTTPException | ValueError,
+    ) -> None:
+    """Release the Idempotency-Key of a checkout that was rejected before anything was written."""
+    # Any other failure may come after the commit, so the key stays pending until IDEMPOTENCY_PENDING_TTL runs out.
+    if idempotency_key is None or (isinstance(error, HTTPException) and error.status_code not in (400, 409, 503)):
+        return
+    try:
+        await idempotency_crud.abort_idempotent_request_async(
+            redis_client=redis_client, scope=scope, key=idempotency_key)
+    except RedisError as e:
+        logger.warning(f'Could not release the Idempotency-Key of {scope}: {e}')
+
+
+async def _complete_checkout(
+        redis_client: AsyncRedis,
+        scope: str,
+        idempotency_key: str | None,
+        resp: CheckoutRead,
+    ) -> None:
+    """Record the response of a placed checkout so that retries with the same Idempotency-Key get it back."""
+    if idempotency_key is None:
+        return
+    try:
+        await idempotency_crud.complete_idempotent_request_async(
+            redis_client=redis_client, scope=scope, key=idempotency_key,
+            status_code=201, body=jsonable_encoder(resp), ttl=settings.IDEMPOTENCY_KEY_TTL)
+    except RedisError as e:
+        logger.warning(f'Could not record the checkout response of {scope} for replays: {e}')
+
+
+@router.post('', response_model=OrderPlaced)
+async def create_order(
+        session: Annotated[AsyncSession, Depends(get_async_session)],
+        redis_client: Annotated[AsyncRedis, Depends(get_async_redis_client)],
         token: Annotated[dict, Depends(verify_token)],
         order_items: list[OrderItemCreate]
-    ) -> Message:
+    ) -> OrderPlaced:
     """
     Create a new order for the authenticated user.
 
+    In write-behind mode the order is queued and written to the database shortly after; it is
+    listed by `GET /orders` in the meantime.
+
     Parameters
     ----------
     **order_items** : list[OrderItemCreate], [body parameter]\n
@@ -36,41 +296,230 @@ def create_order(
 
     Returns
     -------
-    Message\n
-        A success message indicating the order was placed.
+    OrderPlaced\n
+        A success message indicating the order was placed, with the ID of the order.
+
+    Raises
+    ------
+    HTTPException\n
+        If the order is empty or references products that do not exist (400), if a product is
+        out of stock (409), or if the stock of a product cannot be checked (503).
+    """
+    user_id: str = token['uid']
+    db_order: Order = await _place_order(
+        session=session, redis_client=redis_client, user_id=user_id, order_items=order_items)
+
+    return {'message': 'Your order has been placed successfully.', 'id': db_order.id}
+
+
+@router.post('/checkout', response_model=CheckoutRead, status_code=201)
+async def checkout(
+        session: Annotated[AsyncSession, Depends(get_async_session)],
+        redis_client: Annotated[AsyncRedis, Depends(get_async_redis_client)],
+        token: Annotated[dict, Depends(verify_token)],
+        idempotency_key: str | None = Header(None, min_length=1, max_length=255),
+    ) -> CheckoutRead | JSONResponse:
+    """
+    Place an order for the contents of the authenticated user's cart.
+
+    The cart is read on the server and the order is written in one transaction. The ordered
+    quantities are taken out of the cart only after the commit. With an `Idempotency-Key`
+    header, the response is recorded in Redis and a retry with the same key gets it back
+    (with `Idempotent-Replayed: true`) instead of placing a second order.
+
+    Parameters
+    ----------
+    **Idempotency-Key** : str, optional, [header]\n
+        A unique value per checkout attempt (e.g. a UUID), reused when retrying it.
+
+    Returns
+    -------
+    CheckoutRead\n
+        The placed order.
+
+    Raises
+    ------
+    HTTPException\n
+        If the cart is empty or references products that do not exist (400), if a product is out
+        of stock or a checkout with the same `Idempotency-Key` is still in progress (409), or if
+        the stock of a product cannot be checked (503).
     """
     user_id: str = token['uid']
-    order: Order = order_crud.create_order(session=session, user_id=user_id)
+    scope: str = f'checkout:{user_id}'
+    replay: JSONResponse | None = await _begin_checkout(
+        redis_client=redis_client, scope=scope, idempotency_key=idempotency_key)
+    if replay is not None:
+        return replay
+
+    try:
+        cart: dict[str, int] = await cart_crud.get_cart_async(redis_client=redis_client, user_id=user_id)
+        if not cart:
+            raise HTTPException(status_code=400, detail='Cart is empty')
+        order_items: list[OrderItemCreate] = [
+            OrderItemCreate(product_id=product_id, quantity=quantity) for product_id, quantity in cart.items()]
+        db_order: Order = await _place_order(
+            session=session, redis_client=redis_client, user_id=user_id, order_items=order_items)
+    except (HTTPException, ValueError) as e:
+        # Rejected before anything was written: let the client retry with the same key.
+        await _abort_checkout(redis_client=redis_client, scope=scope, idempotency_key=idempotency_key, error=e)
+        raise
 
-    for order_item in order_items:
-        order_crud.create_order_item(session=session, order_id=order.id, order_item=order_item)
-    
-    return {'message': 'Your order has been placed successfully.'}
+    resp = CheckoutRead(
+        id=db_order.id, order_items=order_items, item_count=db_order.item_count, total=db_order.total,
+        purchase_date=ulid_to_datetime(db_order.id))
+    # The order is committed, so Redis failures from here on must not fail the request.
+    try:
+        await cart_crud.subtract_from_cart_async(redis_client=redis_client, user_id=user_id, order_items=order_items)
+    except RedisError as e:
+        logger.warning(f'Could not clear the cart of {user_id} after order {db_order.id}: {e}')
+    await _complete_checkout(redis_client=redis_client, scope=scope, idempotency_key=idempotency_key, resp=resp)
+    return resp
 
 
 @router.get('', response_model=UserOrderRead)
-def read_orders(
-        session: Annotated[Session, Depends(get_session)],
+async def read_orders(
+        session: Annotated[AsyncSession, Depends(get_async_session)],
+        redis_client: Annotated[AsyncRedis, Depends(get_async_redis_client)],
         token: Annotated[dict, Depends(verify_token)],
+        cursor: str | None = Query(None, min_length=26, max_length=26),
+        limit: int = Query(20, ge=1, le=100),
+        start: datetime | None = Query(None, alias='from'),
+        end: datetime | None = Query(None, alias='to'),
     ) -> UserOrderRead:
     """
-    Retrieve all orders for the authenticated user.
+    Retrieve the authenticated user's orders, newest first, one page at a time.
+
+    Orders queued in write-behind mode and not written to the database yet are included, unless
+    Redis is unavailable.
+
+    Parameters
+    ----------
+    **cursor** : str, optional, [query parameter]\n
+        The `next_cursor` returned with the previous page. Omit it to get the newest orders.
+    **limit** : int, optional, [query parameter]\n
+        The maximum number of orders to return, by default 20.
+    **from** : datetime, optional, [query parameter]\n
+        Only orders placed at or after this time.
+    **to** : datetime, optional, [query parameter]\n
+        Only orders placed before this time.
 
     Returns
     -------
     UserOrderRead\n
-        The user's orders with their details.
-    """
-    def _ulid_to_datetime(ulid_str: str) -> datetime:
-        ulid_obj = ulid.parse(ulid_str)
-        timestamp = ulid_obj.timestamp()
-        dt = datetime.fromtimestamp(int(timestamp) / 1000.0)
-        return dt
+        The user's orders with their details, and the cursor of the next page
+        (`next_cursor` is null on the last page).
 
+    Raises
+    ------
+    HTTPException\n
+        If the user is not found in the database, or if the date range is invalid (400).
+    """
+    _check_date_range(start, end)
     user_id: str = token['uid']
-    user_orders: User = order_crud.read_user_orders(session=session, user_id=user_id)
-    order_read_list: list[OrderRead] = [OrderRead(id=order.id, order_items=order.order_items, purchase_date=_ulid_to_datetime(order.id)) for order in user_orders.orders]
+    user: User | None = await auth_crud.get_user_async(session=session, user_id=user_id)
+    if user is None:
+        raise HTTPException(status_code=400, detail='User not found')
+
+    try:
+        orders, next_cursor = await order_crud.read_user_order_page_async(
+            session=session, user_id=user_id, cursor=cursor, limit=limit, start=start, end=end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    order_read_list: list[OrderRead] = [
+        OrderRead(
+            id=order.id, order_items=order.order_items, item_count=order.item_count, total=order.total,
+            purchase_date=ulid_to_datetime(order.id))
+        for order in orders]
+    pending_orders: list[Order] = await _read_pending_orders(redis_client=redis_client, user_id=user_id)
+    if pending_orders:
+        order_read_list, next_cursor = await _merge_pending_orders(
+            session=session, order_read_list=order_read_list, next_cursor=next_cursor,
+            pending_orders=pending_orders, cursor=cursor, limit=limit, start=start, end=end)
 
-    resp = UserOrderRead(id=user_orders.id, email=user_orders.email, orders=order_read_list)
+    resp = UserOrderRead(id=user.id, email=user.email, orders=order_read_list, next_cursor=next_cursor)
 
     return resp
+
+
+@router.get('/spend', response_model=OrderSpend)
+async def read_order_spend(
+        session: Annotated[AsyncSession, Depends(get_async_session)],
+        redis_client: Annotated[AsyncRedis, Depends(get_async_redis_client)],
+        token: Annotated[dict, Depends(verify_token)],
+        start: datetime | None = Query(None, alias='from'),
+        end: datetime | None = Query(None, alias='to'),
+    ) -> OrderSpend:
+    """
+    Sum up the authenticated user's orders, optionally within a date range.
+
+    The sums are read from the item count and total stored on each order, without loading order
+    items or products. Orders queued in write-behind mode are included, unless Redis is unavailable.
+
+    Parameters
+    ----------
+    **from** : datetime, optional, [query parameter]\n
+        Only orders placed at or after this time.
+    **to** : datetime, optional, [query parameter]\n
+        Only orders placed before this time.
+
+    Returns
+    -------
+    OrderSpend\n
+        The number of orders, the number of items ordered and the amount spent.
+
+    Raises
+    ------
+    HTTPException\n
+        If the date range is invalid (400).
+    """
+    _check_date_range(start, end)
+    user_id: str = token['uid']
+    try:
+        order_count, item_count, total = await order_crud.read_user_spend_async(
+            session=session, user_id=user_id, start=start, end=end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    pending_orders: list[Order] = _in_date_range(
+        await _read_pending_orders(redis_client=redis_client, user_id=user_id), start, end)
+    if pending_orders:
+        # An order written meanwhile is already counted by the database.
+        stored_ids: set[str] = await order_crud.read_stored_order_ids_async(
+            session=session, order_ids={order.id for order in pending_orders})
+        for order in pending_orders:
+            if order.id not in stored_ids:
+                order_count += 1
+                item_count += order.item_count or 0
+                total += order.total or 0.0
+
+    return OrderSpend(order_count=order_count, item_count=item_count, total=total)
+
+
+@router.get('/rejected', response_model=list[RejectedOrderRead])
+async def read_rejected_orders(
+        redis_client: Annotated[AsyncRedis, Depends(get_async_redis_client)],
+        token: Annotated[dict, Depends(verify_token)],
+    ) -> list[RejectedOrderRead]:
+    """
+    Retrieve the authenticated user's orders that were accepted but could not be stored.
+
+    In write-behind mode an order is confirmed before it is written, and the write may still be
+    rejected, e.g. if a product was deleted in the meantime. The units of such orders go back on
+    sale, and the orders are listed here instead of in `GET /orders`.
+
+    Returns
+    -------
+    list[RejectedOrderRead]\n
+        The rejected orders, newest first, with the reason they were rejected.
+    """
+    user_id: str = token['uid']
+    rejected: list[tuple[Order, str]] = await order_stream_crud.read_rejected_orders_async(
+        redis_client=redis_client, user_id=user_id)
+    return [
+        RejectedOrderRead(
+            id=order.id, item_count=order.item_count, total=order.total, purchase_date=ulid_to_datetime(order.id),
+            order_items=[
+                OrderItemCreate(product_id=order_item.product_id, quantity=order_item.quantity)
+                for order_item in order.order_items],
+            reason=reason)
+        for order, reason in rejected]
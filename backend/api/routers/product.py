@@ -1,15 +1,30 @@
-from typing import Annotated
+from collections.abc import Awaitable, Callable
+from typing import Annotated, Any
+from email.utils import formatdate, parsedate_to_datetime
+import base64
+import json
 import logging
+import time
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlmodel import Session
-# from sentence_transformers import SentenceTransformer
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from redis import RedisError
+from redis.asyncio import Redis as AsyncRedis
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+import cruds.catalog as catalog_crud
+import cruds.popularity as popularity_crud
 import cruds.product as product_crud
 from models.table_models import Product
-from models.reqres_models import ProductRead, ProductCount
-from dependencies import get_session
-# from similarity_search.search_with_sentence_transformers import transformers_search
+from models.reqres_models import (
+    ProductRead, ProductPage, ProductList, ProductCount, ProductBatchQuery, ProductBatchRead, PopularProductRead)
+from dependencies import (
+    get_async_session, get_async_redis_client, get_search_engine, get_product_cache, get_response_cache)
+from caching.lru import LRUCache
+from similarity_search.engine import SemanticSearchEngine
+import settings
 
 
 router = APIRouter(
@@ -18,65 +33,431 @@ router = APIRouter(
     responses={404: {'message': 'Not found'}})
 
 logger = logging.getLogger('uvicorn')
-# tf_model = SentenceTransformer('paraphrase-MiniLM-L6-v2', cache_folder='./cache_tf')
 
 
-@router.get('', response_model=list[ProductRead])
-def read_products(
-        session: Annotated[Session, Depends(get_session)],
+CATALOG_CACHE_CONTROL: str = (
+    f'public, max-age={settings.CATALOG_CACHE_MAX_AGE}, '
+    f'stale-while-revalidate={settings.CATALOG_STALE_WHILE_REVALIDATE}')
+
+
+def _is_not_modified(request: Request, etag: str, modified_at: float | None) -> bool:
+    """Evaluate `If-None-Match`, or `If-Modified-Since` when it is absent, as described in RFC 9110."""
+    if_none_match: str | None = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        tags: list[str] = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags
+    if_modified_since: str | None = request.headers.get('if-modified-since')
+    if if_modified_since is None or modified_at is None:
+        return False
+    try:
+        return int(modified_at) <= parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+async def catalog_conditional_get(
+        request: Request,
+        response: Response,
+        redis_client: Annotated[AsyncRedis, Depends(get_async_redis_client)],
+    ) -> int | None:
+    """
+    Answer conditional requests for catalog data from the catalog version alone.
+
+    The strong ETag and `Last-Modified` are derived from the catalog version kept in Redis, so a
+    client or CDN holding the current representation gets a 304 before any database work.
+    Otherwise the validators and `Cache-Control` are added to the response. If Redis cannot be
+    reached, the response is served from the database without validators and marked `no-store`.
+
+    Returns
+    -------
+    int | None
+        The current catalog version, or None if it could not be read.
+
+    Raises
+    ------
+    HTTPException
+        With status 304 if the representation held by the client is still current.
+    """
+    try:
+        version, modified_at = await catalog_crud.get_catalog_version_async(redis_client=redis_client)
+    except RedisError as e:
+        logger.warning(f'Could not read the catalog version, serving the catalog uncached: {e}')
+        response.headers['Cache-Control'] = 'no-store'
+        return None
+    headers: dict[str, str] = {'ETag': f'"catalog-{version}"', 'Cache-Control': CATALOG_CACHE_CONTROL}
+    if modified_at is not None:
+        headers['Last-Modified'] = formatdate(modified_at, usegmt=True)
+    if _is_not_modified(request, headers['ETag'], modified_at):
+        raise HTTPException(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return version
+
+
+async def _cached_json(
+        cache: LRUCache,
+        key: tuple,
+        response: Response,
+        load: Callable[[], Awaitable[Any]],
+    ) -> Response:
+    """
+    Serve the JSON body cached under `key`, or load, encode and cache it.
+
+    A hit skips the query, the validation into response models and the JSON encoding. Keys must
+    hold the catalog version as their second item, so entries of an older catalog are never served
+    and age out of the LRU; a key whose version is unknown (None) bypasses the cache. The headers set by the
+    dependencies (validators, `Cache-Control`) are kept.
+    """
+    cacheable: bool = key[1] is not None
+    body: bytes | None = cache.get(key) if cacheable else None
+    if body is None:
+        body = JSONResponse(content=jsonable_encoder(await load())).body
+        if cacheable:
+            cache.set(key, body)
+    return Response(content=body, media_type='application/json', headers=dict(response.headers))
+
+
+def _encode_cursor(product_id: str) -> str:
+    """Wrap the last product ID of a page into an opaque, URL-safe cursor."""
+    payload: bytes = json.dumps({'id': product_id}).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor: str) -> str:
+    """Extract the product ID from a cursor made by `_encode_cursor`."""
+    try:
+        payload: bytes = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        product_id = json.loads(payload)['id']
+    except (ValueError, TypeError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f'Invalid cursor: {e}')
+    if not isinstance(product_id, str):
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+    return product_id
+
+
+@router.get('', response_model=list[ProductRead] | ProductPage | ProductList)
+async def read_products(
+        catalog_version: Annotated[int | None, Depends(catalog_conditional_get)],
+        session: Annotated[AsyncSession, Depends(get_async_session)],
+        cache: Annotated[LRUCache, Depends(get_response_cache)],
+        response: Response,
         skip: int = Query(0, ge=0),
         limit: int = Query(20, ge=1, le=100),
         query: str = Query('', max_length=200),
-    ) -> list[ProductRead]:
+        paging: str = Query('offset', pattern='^(offset|cursor)$'),
+        cursor: str | None = Query(None, max_length=200),
+        envelope: bool = Query(False),
+    ) -> Response:
     """
     Retrieve a list of products from the database. If a query is provided, products matching the query will be returned.
+    Conditional requests are answered from the catalog version (see `catalog_conditional_get`),
+    and encoded pages are cached per catalog version and normalized parameters.
+
+    Two paging modes are supported. `offset` (the default) pages with `skip` and `limit` and returns
+    a plain list, or with `envelope` a `ProductList` that also holds the total number of products (or
+    of matches when searching), so that a paginated view needs a single request. `cursor` pages with
+    an opaque `cursor` and returns a `ProductPage` whose `next_cursor` is passed back to get the
+    following page; deep pages cost the same as the first one.
 
     Parameters
     ----------
     **skip** : int, optional, [query parameter]\n
-        The number of products to skip before starting to return, by default 0.
+        The number of products to skip before starting to return, by default 0. Ignored in cursor mode.
     **limit** : int, optional, [query parameter]\n
         The maximum number of products to return, by default 20.
     **query** : str, optional, [query parameter]\n
-        A search query string to filter products by.
+        A search query string matched against the name, author and description of products.
+        Results are ordered by relevance and paged with `skip` and `limit`.
+    **paging** : str, optional, [query parameter]\n
+        `offset` or `cursor`, by default `offset`. Sending a `cursor` implies cursor mode.
+    **cursor** : str, optional, [query parameter]\n
+        The `next_cursor` of the previous page. Omit it to get the first page.
+    **envelope** : bool, optional, [query parameter]\n
+        Whether offset pages are wrapped with their total and paging parameters, by default False.
+        Cursor pages are always wrapped.
 
     Returns
     -------
-    list[ProductRead]\n
-        A list of products.
+    list[ProductRead] | ProductPage | ProductList\n
+        A list of products in offset mode (a `ProductList` with `envelope`), or a page of products
+        with the next cursor in cursor mode.
+        Without `envelope` (which carries the total in the body) and unless searching, the
+        `X-Total-Count` header holds the total number of products.
+
+    Raises
+    ------
+    HTTPException\n
+        If the cursor is malformed, or a cursor is combined with a search query.
     """
+    if paging == 'cursor' or cursor is not None:
+        if query:
+            raise HTTPException(status_code=400, detail='Cursor paging is not supported with a search query')
+        after: str | None = _decode_cursor(cursor) if cursor else None
+
+        async def load_page() -> ProductPage:
+            products, last_id = await product_crud.read_product_page_async(session=session, cursor=after, limit=limit)
+            next_cursor: str | None = _encode_cursor(last_id) if last_id is not None else None
+            return ProductPage(items=products, next_cursor=next_cursor)
+
+        response.headers['X-Total-Count'] = str(await product_crud.count_products_async(session=session))
+        key: tuple = ('products', catalog_version, 'cursor', after, limit)
+        return await _cached_json(cache=cache, key=key, response=response, load=load_page)
+
+    query = ' '.join(query.split())
+    if envelope:
+        async def load_envelope() -> ProductList:
+            if query:
+                products, total = await product_crud.search_products_with_total_async(
+                    session=session, query=query, skip=skip, limit=limit)
+            else:
+                products, total = await product_crud.read_products_with_total_async(
+                    session=session, skip=skip, limit=limit, total_mode=settings.PRODUCT_LIST_TOTAL_MODE)
+            return ProductList(
+                items=[ProductRead.from_orm(product) for product in products], total=total, skip=skip, limit=limit)
+
+        key = ('products', catalog_version, 'envelope', query, skip, limit)
+        return await _cached_json(cache=cache, key=key, response=response, load=load_envelope)
+
     if not query:
-        return product_crud.read_products(session=session, skip=skip, limit=limit)
-    else:
-        return product_crud.read_products(session=session, skip=skip, limit=limit)
-        # products: list[Product] = product_crud.read_products(session=session, skip=0, limit=None)
-        # products, _ = transformers_search(model=tf_model, query=query, candidate_products=products)
-        # return products[skip: skip+limit]
+        response.headers['X-Total-Count'] = str(await product_crud.count_products_async(session=session))
+
+    async def load_list() -> list[ProductRead]:
+        if query:
+            products = await product_crud.search_products_async(session=session, query=query, skip=skip, limit=limit)
+        else:
+            products = await product_crud.read_products_async(session=session, skip=skip, limit=limit)
+        return [ProductRead.from_orm(product) for product in products]
+
+    key = ('products', catalog_version, 'offset', query, skip, limit)
+    return await _cached_json(cache=cache, key=key, response=response, load=load_list)
     
 
+@router.get('/semantic-search', response_model=list[ProductRead])
+async def semantic_search_products(
+        session: Annotated[AsyncSession, Depends(get_async_session)],
+        search_engine: Annotated[SemanticSearchEngine, Depends(get_search_engine)],
+        query: str = Query(..., min_length=1, max_length=200),
+        skip: int = Query(0, ge=0),
+        limit: int = Query(20, ge=1, le=100),
+    ) -> list[ProductRead]:
+    """
+    Retrieve the products whose meaning is closest to a free-text query.
+
+    Products are embedded once and kept in the in-memory index of the search engine, which
+    `dependencies.search_indexer` brings up to date with the catalog in the background every
+    `SEMANTIC_SEARCH_SYNC_INTERVAL` seconds.
+
+    Parameters
+    ----------
+    **query** : str, [query parameter]\n
+        The search query string.
+    **skip** : int, optional, [query parameter]\n
+        The number of best matches to skip before starting to return, by default 0.
+    **limit** : int, optional, [query parameter]\n
+        The maximum number of products to return, by default 20.
+
+    Returns
+    -------
+    list[ProductRead]\n
+        The most similar products, best match first.
+    """
+    # Embedding the query is CPU-bound, so it runs off the event loop.
+    hits: list[tuple[str, float]] = await run_in_threadpool(search_engine.search, query=query, k=limit, offset=skip)
+    return await product_crud.read_products_by_ids_async(
+        session=session, product_ids=[product_id for product_id, _ in hits])
+
+
 @router.get('/count', response_model=ProductCount)
-def count_products(
-        session: Annotated[Session, Depends(get_session)],
+async def count_products(
+        catalog_version: Annotated[int | None, Depends(catalog_conditional_get)],
+        session: Annotated[AsyncSession, Depends(get_async_session)],
+        approximate: bool = Query(False),
     ) -> ProductCount:
     """
     Count the total number of products in the database.
+    Conditional requests are answered from the catalog version (see `catalog_conditional_get`).
+
+    The exact count is cached and only recomputed after products are added or deleted. The same
+    total is returned in the `X-Total-Count` header of `GET /products`.
+
+    Parameters
+    ----------
+    **approximate** : bool, optional, [query parameter]\n
+        Whether an estimate from the database statistics is acceptable, by default False. It is used
+        for catalogs of at least `PRODUCT_COUNT_APPROXIMATE_MIN` products on PostgreSQL; otherwise
+        the exact count is returned.
 
     Returns
     -------
     ProductCount\n
-        The total number of products.
+        The total number of products, and whether it is an estimate.
+    """
+    if approximate:
+        estimate: int | None = await product_crud.estimate_product_count_async(session=session)
+        if estimate is not None and estimate >= settings.PRODUCT_COUNT_APPROXIMATE_MIN:
+            return {'count': estimate, 'approximate': True}
+    num_products: int = await product_crud.count_products_async(session=session)
+    return {'count': num_products, 'approximate': False}
+
+
+async def current_catalog_version(
+        redis_client: Annotated[AsyncRedis, Depends(get_async_redis_client)],
+    ) -> int | None:
+    """Read the catalog version to key cached products on, or None if Redis cannot be reached."""
+    try:
+        version, _ = await catalog_crud.get_catalog_version_async(redis_client=redis_client)
+    except RedisError as e:
+        logger.warning(f'Could not read the catalog version, serving products uncached: {e}')
+        return None
+    return version
+
+
+async def _read_products_batch(
+        session: AsyncSession,
+        cache: LRUCache,
+        catalog_version: int | None,
+        product_ids: list[str],
+    ) -> ProductBatchRead:
+    """
+    Resolve product IDs from the cache, loading the misses with one query and caching them.
+
+    Entries are keyed on the catalog version, so a product changed or deleted since it was cached
+    is never served; the entries of older versions age out of the LRU. If the version is unknown
+    (None), the cache is bypassed.
+    """
+    product_ids = list(dict.fromkeys(product_id for product_id in product_ids if product_id))
+    if len(product_ids) > settings.PRODUCT_BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f'Too many product IDs: at most {settings.PRODUCT_BATCH_MAX_IDS}')
+
+    found: dict[str, ProductRead] = {}
+    misses: list[str] = []
+    for product_id in product_ids:
+        product: ProductRead | None = cache.get((product_id, catalog_version)) if catalog_version is not None else None
+        if product is None:
+            misses.append(product_id)
+        else:
+            found[product_id] = product
+    if misses:
+        for db_product in await product_crud.read_products_by_ids_async(session=session, product_ids=misses):
+            product = ProductRead.from_orm(db_product)
+            if catalog_version is not None:
+                cache.set((product.id, catalog_version), product)
+            found[product.id] = product
+
+    return ProductBatchRead(
+        items=[found[product_id] for product_id in product_ids if product_id in found],
+        missing=[product_id for product_id in product_ids if product_id not in found])
+
+
+@router.get('/batch', response_model=ProductBatchRead)
+async def read_products_batch(
+        session: Annotated[AsyncSession, Depends(get_async_session)],
+        cache: Annotated[LRUCache, Depends(get_product_cache)],
+        catalog_version: Annotated[int | None, Depends(current_catalog_version)],
+        ids: str = Query(..., max_length=10000),
+    ) -> ProductBatchRead:
+    """
+    Retrieve several products at once.
+
+    Products are served from an in-process cache where possible; the others are loaded with one query.
+
+    Parameters
+    ----------
+    **ids** : str, [query parameter]\n
+        Comma-separated product IDs, at most `PRODUCT_BATCH_MAX_IDS`. Duplicates are ignored.
+
+    Returns
+    -------
+    ProductBatchRead\n
+        The products found, in the order of `ids`, and the IDs that do not exist.
+
+    Raises
+    ------
+    HTTPException\n
+        If more than `PRODUCT_BATCH_MAX_IDS` IDs are requested.
+    """
+    product_ids: list[str] = [product_id.strip() for product_id in ids.split(',')]
+    return await _read_products_batch(
+        session=session, cache=cache, catalog_version=catalog_version, product_ids=product_ids)
+
+
+@router.post('/batch', response_model=ProductBatchRead)
+async def read_products_batch_by_body(
+        session: Annotated[AsyncSession, Depends(get_async_session)],
+        cache: Annotated[LRUCache, Depends(get_product_cache)],
+        catalog_version: Annotated[int | None, Depends(current_catalog_version)],
+        query: ProductBatchQuery,
+    ) -> ProductBatchRead:
     """
-    num_products: int = product_crud.count_products(session=session)
-    return {'count': num_products}
+    Retrieve several products at once, with the IDs in the request body.
+
+    Same as `GET /products/batch`, for lists of IDs too long for a URL.
+
+    Parameters
+    ----------
+    **query** : ProductBatchQuery, [body parameter]\n
+        The product IDs, at most `PRODUCT_BATCH_MAX_IDS`. Duplicates are ignored.
+
+    Returns
+    -------
+    ProductBatchRead\n
+        The products found, in the order of the IDs, and the IDs that do not exist.
+    """
+    return await _read_products_batch(
+        session=session, cache=cache, catalog_version=catalog_version, product_ids=query.ids)
+
+
+@router.get('/popular', response_model=list[PopularProductRead])
+async def read_popular_products(
+        session: Annotated[AsyncSession, Depends(get_async_session)],
+        redis_client: Annotated[AsyncRedis, Depends(get_async_redis_client)],
+        cache: Annotated[LRUCache, Depends(get_product_cache)],
+        catalog_version: Annotated[int | None, Depends(current_catalog_version)],
+        window: str = Query('week', pattern='^(all|day|week)$'),
+        limit: int = Query(10, ge=1, le=settings.POPULAR_PRODUCTS_MAX_LIMIT),
+    ) -> list[PopularProductRead]:
+    """
+    Retrieve the best-selling products.
+
+    The ranking is read from Redis sorted sets kept up to date as orders are placed, and the products
+    are resolved like `GET /products/batch`, from the in-process cache where possible.
+
+    Parameters
+    ----------
+    **window** : str, optional, [query parameter]\n
+        'all' (since the beginning), 'day' (the last 24 hours) or 'week' (the last 7 days), by default 'week'.
+    **limit** : int, optional, [query parameter]\n
+        The maximum number of products to return, by default 10.
+
+    Returns
+    -------
+    list[PopularProductRead]\n
+        The products with their units sold in the window, best-selling first. Products deleted
+        since they were sold are left out.
+    """
+    ranking: list[tuple[str, int]] = await popularity_crud.get_popular_products_async(
+        redis_client=redis_client, window=window, limit=limit, now=time.time(),
+        window_ttl=settings.POPULAR_WINDOW_CACHE_TTL)
+    batch: ProductBatchRead = await _read_products_batch(
+        session=session, cache=cache, catalog_version=catalog_version,
+        product_ids=[product_id for product_id, _ in ranking])
+    products: dict[str, ProductRead] = {product.id: product for product in batch.items}
+    return [
+        PopularProductRead(product=products[product_id], units_sold=units_sold)
+        for product_id, units_sold in ranking if product_id in products]
 
 
 @router.get('/{product_id}', response_model=ProductRead)
-def read_product(
-        session: Annotated[Session, Depends(get_session)],
+async def read_product(
+        catalog_version: Annotated[int | None, Depends(catalog_conditional_get)],
+        session: Annotated[AsyncSession, Depends(get_async_session)],
+        cache: Annotated[LRUCache, Depends(get_response_cache)],
+        response: Response,
         product_id: str,
-    ) -> ProductRead:
+    ) -> Response:
     """
     Retrieve a specific product from the database by its ID.
+    Conditional requests are answered from the catalog version (see `catalog_conditional_get`),
+    and the encoded product is cached per catalog version.
 
     Parameters
     ----------
@@ -88,7 +469,11 @@ def read_product(
     ProductRead\n
         The requested product.
     """
-    product: Product | None = product_crud.read_product(session=session, product_id=product_id)
-    if product is None:
-        raise HTTPException(status_code=400, detail='Product not found')
-    return product
+    async def load_product() -> ProductRead:
+        product: Product | None = await product_crud.read_product_async(session=session, product_id=product_id)
+        if product is None:
+            raise HTTPException(status_code=400, detail='Product not found')
+        return ProductRead.from_orm(product)
+
+    key: tuple = ('product', catalog_version, product_id)
+    return await _cached_json(cache=cache, key=key, response=response, load=load_product)
@@ -0,0 +1,74 @@
+import hashlib
+import time
+from collections.abc import Callable
+
+from caching.lru import LRUCache
+
+
+class TokenCache:
+    """
+    Cache of decoded ID token claims, so that a token is verified once and not on every request.
+
+    Entries are keyed by the SHA-256 of the token (the raw token is never kept) and expire at the
+    token's `exp` claim, so a cached token is never accepted after it would have failed verification
+    for being expired. Failed verifications are not cached.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        The maximum number of cached tokens. Default is 10000.
+    enabled : bool, optional
+        Whether to cache at all. When False every call goes to the verifier. Default is True.
+    clock : Callable[[], float], optional
+        Returns the current time in seconds since the epoch. Default is `time.time`.
+    """
+    def __init__(self, maxsize: int = 10000, enabled: bool = True, clock: Callable[[], float] = time.time):
+        self.enabled = enabled
+        self.clock = clock
+        self._cache = LRUCache(maxsize=maxsize, clock=clock)
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def verify(self, token: str, verifier: Callable[[str], dict]) -> dict:
+        """
+        Return the claims of `token`, calling `verifier` only on a cache miss.
+
+        Parameters
+        ----------
+        token : str
+            The ID token to verify.
+        verifier : Callable[[str], dict]
+            Verifies the token and returns its claims, raising if it is invalid.
+
+        Returns
+        -------
+        dict
+            The decoded claims of the token.
+        """
+        if not self.enabled:
+            return verifier(token)
+
+        key: str = self._key(token)
+        claims: dict | None = self._cache.get(key)
+        if claims is not None:
+            return claims
+
+        claims = verifier(token)
+        expires_at = claims.get('exp')
+        if isinstance(expires_at, (int, float)) and expires_at > self.clock():
+            self._cache.set(key, claims, expires_at=float(expires_at))
+        return claims
+
+    def invalidate(self, token: str) -> None:
+        """Forget a token, e.g. after the user logs out."""
+        self._cache.delete(self._key(token))
+
+    def clear(self) -> None:
+        """Forget every token."""
+        self._cache.clear()
+
+    def stats(self) -> dict[str, int | float | bool]:
+        """Return the hit and miss counters of the cache."""
+        return {'enabled': self.enabled, **self._cache.stats()}
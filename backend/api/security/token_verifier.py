@@ -0,0 +1,216 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+import httpx
+import jwt
+from jwt.algorithms import RSAAlgorithm
+
+
+logger = logging.getLogger('uvicorn')
+
+
+class TokenVerificationError(Exception):
+    """Raised when an ID token is malformed, badly signed or carries invalid claims."""
+
+
+class JWKSCache:
+    """
+    In-memory set of signing keys, refreshed from a JWKS endpoint by a background thread.
+
+    The key set is fetched once by `start` and then re-fetched by a daemon thread shortly before
+    the `max-age` announced by the endpoint runs out, so request threads only ever read keys from
+    memory. If a refresh fails the current keys are kept and the fetch is retried with backoff.
+
+    Parameters
+    ----------
+    url : str
+        The JWKS endpoint (a JSON document with a `keys` list of RSA JWKs), e.g. `settings.FIREBASE_JWKS_URL`.
+    refresh_margin : float, optional
+        How many seconds before expiry the keys are refreshed. Default is 300.
+    default_max_age : float, optional
+        The lifetime assumed when the endpoint sends no `max-age`. Default is 3600.
+    min_interval : float, optional
+        The minimum number of seconds between two fetches. Default is 10.
+    timeout : float, optional
+        The HTTP timeout of a fetch in seconds. Default is 10.
+    """
+    def __init__(
+            self,
+            url: str,
+            refresh_margin: float = 300,
+            default_max_age: float = 3600,
+            min_interval: float = 10,
+            timeout: float = 10,
+        ):
+        self.url = url
+        self.refresh_margin = refresh_margin
+        self.default_max_age = default_max_age
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self.expires_at: float = 0.0
+        self.refresh_count: int = 0
+        self._keys: dict[str, Any] = {}
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def refresh(self) -> None:
+        """Fetch the key set and replace the cached keys. Raises if the fetch fails."""
+        response = httpx.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        keys: dict[str, Any] = {
+            jwk['kid']: RSAAlgorithm.from_jwk(json.dumps(jwk))
+            for jwk in response.json()['keys']
+            if jwk.get('kty') == 'RSA' and 'kid' in jwk}
+        match = re.search(r'max-age=(\d+)', response.headers.get('cache-control', ''))
+        max_age: float = float(match.group(1)) if match else self.default_max_age
+        self._keys = keys
+        self.expires_at = time.time() + max_age
+        self.refresh_count += 1
+
+    def get_key(self, kid: str) -> Any | None:
+        """
+        Return the public key with the given ID from memory, without any network access.
+
+        An unknown ID (e.g. right after Google rotated its keys) wakes up the refresh thread so that
+        the next requests find the new key.
+        """
+        key = self._keys.get(kid)
+        if key is None:
+            self._wakeup.set()
+        return key
+
+    def _seconds_until_refresh(self) -> float:
+        return max(self.expires_at - self.refresh_margin - time.time(), self.min_interval)
+
+    def _run(self) -> None:
+        backoff: float = self.min_interval
+        while not self._stopped.is_set():
+            self._wakeup.wait(timeout=self._seconds_until_refresh())
+            if self._stopped.is_set():
+                break
+            self._wakeup.clear()
+            try:
+                self.refresh()
+                backoff = self.min_interval
+            except Exception as e:
+                logger.warning(f'Could not refresh signing keys from {self.url}: {e}')
+                self._stopped.wait(timeout=backoff)
+                backoff = min(backoff * 2, self.refresh_margin)
+                self._wakeup.set()
+            else:
+                # Do not hammer the endpoint when tokens with unknown key IDs keep coming in.
+                self._stopped.wait(timeout=self.min_interval)
+
+    def start(self) -> None:
+        """Fetch the keys once (logging a failure) and start the background refresh thread."""
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning(f'Could not fetch signing keys from {self.url}: {e}')
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='jwks-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background refresh thread."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout)
+            self._thread = None
+
+
+class FirebaseTokenVerifier:
+    """
+    Verifies Firebase ID tokens in-process against the keys held by a `JWKSCache`.
+
+    Only RS256 tokens signed by a known key are accepted. The claims are checked as documented by
+    Firebase: `iss` must be `https://securetoken.google.com/<project_id>`, `aud` must be the project ID,
+    `exp` must be in the future, `iat` and `auth_time` must be in the past, and `sub` must be a
+    non-empty string, which is also returned as `uid` like `firebase_admin.auth.verify_id_token` does.
+
+    Parameters
+    ----------
+    project_id : str
+        The Firebase project ID.
+    key_cache : JWKSCache
+        The cache holding Google's public signing keys.
+    leeway : float, optional
+        The tolerated clock skew in seconds. Default is 10.
+    clock : Callable[[], float], optional
+        Returns the current time in seconds since the epoch. Default is `time.time`.
+    """
+    def __init__(
+            self,
+            project_id: str,
+            key_cache: JWKSCache,
+            leeway: float = 10,
+            clock: Callable[[], float] = time.time,
+        ):
+        self.project_id = project_id
+        self.issuer = f'https://securetoken.google.com/{project_id}'
+        self.key_cache = key_cache
+        self.leeway = leeway
+        self.clock = clock
+
+    def verify(self, token: str) -> dict:
+        """
+        Verify a Firebase ID token and return its claims.
+
+        Parameters
+        ----------
+        token : str
+            The encoded ID token.
+
+        Returns
+        -------
+        dict
+            The decoded claims, with `uid` set to the `sub` claim.
+
+        Raises
+        ------
+        TokenVerificationError
+            If the token is malformed, not signed by a known key or has invalid claims.
+        """
+        try:
+            header: dict = jwt.get_unverified_header(token)
+        except jwt.PyJWTError as e:
+            raise TokenVerificationError(f'Malformed token: {e}')
+        if header.get('alg') != 'RS256':
+            raise TokenVerificationError(f'Unexpected algorithm: {header.get("alg")}')
+        key = self.key_cache.get_key(header.get('kid', ''))
+        if key is None:
+            raise TokenVerificationError(f'Unknown key ID: {header.get("kid")}')
+
+        try:
+            # Only the signature is checked by PyJWT; the claims are checked below.
+            claims: dict = jwt.decode(
+                token, key=key, algorithms=['RS256'],
+                options={
+                    'verify_exp': False, 'verify_iat': False, 'verify_nbf': False, 'verify_aud': False,
+                    'verify_iss': False})
+        except jwt.PyJWTError as e:
+            raise TokenVerificationError(f'Invalid signature: {e}')
+
+        now: float = self.clock()
+        if claims.get('iss') != self.issuer:
+            raise TokenVerificationError(f'Unexpected issuer: {claims.get("iss")}')
+        if claims.get('aud') != self.project_id:
+            raise TokenVerificationError(f'Unexpected audience: {claims.get("aud")}')
+        if not isinstance(claims.get('exp'), (int, float)) or claims['exp'] <= now - self.leeway:
+            raise TokenVerificationError('Token expired')
+        for claim in ['iat', 'auth_time']:
+            if not isinstance(claims.get(claim), (int, float)) or claims[claim] > now + self.leeway:
+                raise TokenVerificationError(f'Invalid {claim} claim')
+        subject = claims.get('sub')
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            raise TokenVerificationError('Invalid sub claim')
+
+        claims['uid'] = subject
+        return claims
@@ -15,10 +15,47 @@ INSTANCE_CONNECTION_NAME = os.environ.get('INSTANCE_CONNECTION_NAME')
 DB_NAME = os.environ.get('DB_NAME')
 DB_USER = os.environ.get('DB_USER')
 DB_PASS = os.environ.get('DB_PASS')
+# Connections of the process, shared by the sync and the async engine (keep the sum over all instances
+# below the max_connections of the instance)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+# Fraction of these connections given to the async engine, which serves the API routes
+DB_ASYNC_POOL_SHARE = float(os.environ.get('DB_ASYNC_POOL_SHARE', 0.8))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
+DB_ECHO = os.environ.get('DB_ECHO', 'false').lower() == 'true'
 
 REDIS_HOST = os.environ.get('REDIS_HOST')
 REDIS_PORT = os.environ.get('REDIS_PORT')
 REDIS_DB = os.environ.get('REDIS_DB')
+REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 50))
+REDIS_POOL_TIMEOUT = float(os.environ.get('REDIS_POOL_TIMEOUT', 5))
+REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 5))
+REDIS_SOCKET_CONNECT_TIMEOUT = float(os.environ.get('REDIS_SOCKET_CONNECT_TIMEOUT', 5))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get('REDIS_HEALTH_CHECK_INTERVAL', 30))
+
+# Largest quantity of one product a cart can hold
+CART_MAX_QUANTITY = int(os.environ.get('CART_MAX_QUANTITY', 99))
+
+# Seconds an order holds its reserved stock before the units go back on sale
+STOCK_RESERVATION_TTL = float(os.environ.get('STOCK_RESERVATION_TTL', 600))
+# Seconds between two reconciliations of the Redis stock counts with the database
+STOCK_RECONCILE_INTERVAL = float(os.environ.get('STOCK_RECONCILE_INTERVAL', 5))
+
+# Queue orders in a Redis stream and write them to the database in batches in the background
+ORDER_WRITE_BEHIND = os.environ.get('ORDER_WRITE_BEHIND', 'false').lower() == 'true'
+# Most orders written per transaction, and milliseconds a read of the stream waits for new orders
+# (below REDIS_SOCKET_TIMEOUT)
+ORDER_PERSIST_BATCH_SIZE = int(os.environ.get('ORDER_PERSIST_BATCH_SIZE', 100))
+ORDER_PERSIST_BLOCK_MS = int(os.environ.get('ORDER_PERSIST_BLOCK_MS', 1000))
+# Milliseconds a queued order stays with an instance that does not acknowledge it before another one claims it
+ORDER_PERSIST_CLAIM_IDLE_MS = int(os.environ.get('ORDER_PERSIST_CLAIM_IDLE_MS', 30000))
+
+# Checkout responses are replayed to retries with the same Idempotency-Key for this many seconds
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 3600))
+# Longest time a checkout holds its Idempotency-Key before another request may claim it
+IDEMPOTENCY_PENDING_TTL = int(os.environ.get('IDEMPOTENCY_PENDING_TTL', 60))
 
 with open(SECRET_MANAGER_AUTH_PATH, 'r') as file:
     FIREBASE_AUTH: dict = json.load(file)
@@ -27,3 +64,56 @@ with open(SECRET_MANAGER_CONFIG_PATH, 'r') as file:
     FIREBASE_CONFIG: dict = json.load(file)
 
 FRONTEND_URL = os.environ.get('FRONTEND_URL')
+
+# 'hashing' (no model download) or 'sentence-transformers'
+SEMANTIC_SEARCH_ENCODER = os.environ.get('SEMANTIC_SEARCH_ENCODER', 'hashing')
+SEMANTIC_SEARCH_MODEL = os.environ.get('SEMANTIC_SEARCH_MODEL', 'paraphrase-MiniLM-L6-v2')
+SEMANTIC_SEARCH_INDEX_PATH = os.environ.get('SEMANTIC_SEARCH_INDEX_PATH', './cache_semantic/products')
+SEMANTIC_SEARCH_SYNC_INTERVAL = float(os.environ.get('SEMANTIC_SEARCH_SYNC_INTERVAL', 300))
+
+# Cache-Control of the public catalog endpoints, for browsers and a CDN in front of Cloud Run
+CATALOG_CACHE_MAX_AGE = int(os.environ.get('CATALOG_CACHE_MAX_AGE', 60))
+CATALOG_STALE_WHILE_REVALIDATE = int(os.environ.get('CATALOG_STALE_WHILE_REVALIDATE', 300))
+
+# In-process cache of the encoded JSON bodies of catalog responses
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 10000))
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 300))
+
+# In-process cache of products served by the batch endpoint
+PRODUCT_CACHE_MAXSIZE = int(os.environ.get('PRODUCT_CACHE_MAXSIZE', 10000))
+PRODUCT_CACHE_TTL = float(os.environ.get('PRODUCT_CACHE_TTL', 60))
+PRODUCT_BATCH_MAX_IDS = int(os.environ.get('PRODUCT_BATCH_MAX_IDS', 200))
+# Approximate product counts use the planner statistics only above this many rows; smaller tables are counted exactly
+PRODUCT_COUNT_APPROXIMATE_MIN = int(os.environ.get('PRODUCT_COUNT_APPROXIMATE_MIN', 100000))
+# Source of the total of enveloped product lists: 'window' (same statement), 'counter' (cached count) or 'auto'
+PRODUCT_LIST_TOTAL_MODE = os.environ.get('PRODUCT_LIST_TOTAL_MODE', 'auto')
+if PRODUCT_LIST_TOTAL_MODE not in ('window', 'counter', 'auto'):
+    raise ValueError(f"PRODUCT_LIST_TOTAL_MODE must be 'window', 'counter' or 'auto', not {PRODUCT_LIST_TOTAL_MODE!r}")
+
+# Seconds the union of the hourly buckets of a rolling best-seller window is reused
+POPULAR_WINDOW_CACHE_TTL = int(os.environ.get('POPULAR_WINDOW_CACHE_TTL', 60))
+POPULAR_PRODUCTS_MAX_LIMIT = int(os.environ.get('POPULAR_PRODUCTS_MAX_LIMIT', 50))
+
+# Two-tier (in-process + Redis) cache of CRUD read functions
+CRUD_CACHE_ENABLED = os.environ.get('CRUD_CACHE_ENABLED', 'true').lower() == 'true'
+CRUD_CACHE_MAXSIZE = int(os.environ.get('CRUD_CACHE_MAXSIZE', 10000))
+CRUD_CACHE_TTL = float(os.environ.get('CRUD_CACHE_TTL', 300))
+# Seconds a Redis lock keeps other instances from loading a missing entry at once (0 disables the lock)
+CRUD_CACHE_LOCK_TIMEOUT = float(os.environ.get('CRUD_CACHE_LOCK_TIMEOUT', 0))
+# Eagerness of probabilistic refreshes before an entry expires (0 disables them)
+CRUD_CACHE_EARLY_REFRESH_BETA = float(os.environ.get('CRUD_CACHE_EARLY_REFRESH_BETA', 1.0))
+
+# Comma-separated Firebase UIDs allowed to read /api/metrics; nobody can while it is empty
+METRICS_ADMIN_UIDS = frozenset(uid for uid in os.environ.get('METRICS_ADMIN_UIDS', '').split(',') if uid)
+
+TOKEN_CACHE_ENABLED = os.environ.get('TOKEN_CACHE_ENABLED', 'true').lower() == 'true'
+TOKEN_CACHE_MAXSIZE = int(os.environ.get('TOKEN_CACHE_MAXSIZE', 10000))
+
+# Verify ID tokens in-process against cached Google signing keys instead of through firebase_admin
+LOCAL_TOKEN_VERIFICATION = os.environ.get('LOCAL_TOKEN_VERIFICATION', 'true').lower() == 'true'
+FIREBASE_PROJECT_ID = os.environ.get('FIREBASE_PROJECT_ID', FIREBASE_AUTH.get('project_id'))
+# JWKS endpoint publishing the keys that sign Firebase ID tokens
+FIREBASE_JWKS_URL = os.environ.get(
+    'FIREBASE_JWKS_URL',
+    'https://www.googleapis.com/service_accounts/v1/jwk/securetoken@system.gserviceaccount.com')
@@ -0,0 +1,90 @@
+import hashlib
+import re
+from typing import Protocol
+
+import numpy as np
+
+
+class Encoder(Protocol):
+    """
+    Turns texts into L2-normalized float32 embeddings.
+
+    Attributes
+    ----------
+    name : str
+        Identifies the model; an index built with one encoder is rebuilt when the name changes.
+    dim : int
+        The dimension of the embeddings.
+    """
+    name: str
+    dim: int
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        """Return an array of shape (len(texts), dim) and dtype float32 with unit-length rows."""
+        ...
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.maximum(norms, 1e-12, out=norms)
+    return (vectors / norms).astype(np.float32, copy=False)
+
+
+class HashingEncoder:
+    """
+    Deterministic bag-of-features encoder that needs no model download.
+
+    Each word and each character trigram of the lower-cased text is hashed into one of `dim`
+    buckets with a random sign (the hashing trick). It only captures lexical overlap, which is
+    enough for tests and as a fallback when no language model is installed.
+
+    Parameters
+    ----------
+    dim : int, optional
+        The dimension of the embeddings. Default is 256.
+    """
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f'hashing-{dim}'
+
+    def _features(self, text: str) -> list[str]:
+        features: list[str] = []
+        for word in re.findall(r'\w+', text.lower()):
+            features.append(word)
+            padded = f' {word} '
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+                value = int.from_bytes(digest, 'little')
+                vectors[row, value % self.dim] += 1.0 if value >> 63 else -1.0
+        return _normalize(vectors)
+
+
+class SentenceTransformerEncoder:
+    """
+    Encoder backed by a `sentence-transformers` model.
+
+    `sentence-transformers` is an optional dependency and is imported only when this class is used.
+
+    Parameters
+    ----------
+    model_name : str, optional
+        The name of the model to load. Default is 'paraphrase-MiniLM-L6-v2'.
+    cache_folder : str, optional
+        Where the downloaded model is stored. Default is './cache_tf'.
+    """
+    def __init__(self, model_name: str = 'paraphrase-MiniLM-L6-v2', cache_folder: str = './cache_tf'):
+        from sentence_transformers import SentenceTransformer
+
+        self._model = SentenceTransformer(model_name, cache_folder=cache_folder)
+        self.dim = self._model.get_sentence_embedding_dimension()
+        self.name = f'sentence-transformers-{model_name}'
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        vectors = self._model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dim)
@@ -0,0 +1,248 @@
+import hashlib
+import json
+import os
+import threading
+from collections.abc import Iterable
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+
+from models.table_models import Product
+from similarity_search.encoders import Encoder
+
+
+def product_text(product: Product) -> str:
+    """Build the text that represents a product in the embedding space."""
+    return '\n'.join([product.name, product.author, product.description or ''])
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class SemanticSearchEngine:
+    """
+    In-memory semantic product search over a contiguous float32 embedding matrix.
+
+    Each product is embedded once and stored as one row of the matrix, together with a digest of
+    the text it was embedded from. A query is answered with one matrix-vector product followed by
+    `np.argpartition`, so only the top-k rows are sorted. The index can be saved to an `.npy` file
+    (plus a `.json` sidecar with the product IDs), which is memory-mapped on load so that a new
+    instance starts without reading or re-embedding the catalog; the matrix is copied into memory
+    only when it is first modified.
+
+    Writers are serialized with a lock. A search embeds its query outside the lock, then scores the
+    matrix in place and picks its top rows while holding it, so it never pairs an ID with another
+    product's row and never copies the matrix.
+
+    Parameters
+    ----------
+    encoder : Encoder
+        The model turning texts into embeddings.
+    index_path : str | Path | None, optional
+        Path of the persisted index without extension. If `<index_path>.npy` exists and was built
+        with the same encoder, it is loaded. Default is None (in-memory only).
+    """
+    def __init__(self, encoder: Encoder, index_path: str | Path | None = None):
+        self.encoder = encoder
+        self.index_path = Path(index_path) if index_path is not None else None
+        self._lock = threading.Lock()
+        self._matrix: np.ndarray = np.empty((0, encoder.dim), dtype=np.float32)
+        self._size: int = 0
+        self._ids: list[str] = []
+        self._digests: list[str] = []
+        self._positions: dict[str, int] = {}
+
+        if self.index_path is not None and self._matrix_path.exists():
+            self.load()
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def _matrix_path(self) -> Path:
+        return self.index_path.with_suffix('.npy')
+
+    @property
+    def _meta_path(self) -> Path:
+        return self.index_path.with_suffix('.json')
+
+    def load(self) -> None:
+        """Memory-map the persisted index. An index built by another encoder is ignored."""
+        with open(self._meta_path, 'r') as file:
+            meta: dict = json.load(file)
+        if meta.get('encoder') != self.encoder.name:
+            return
+        matrix: np.ndarray = np.load(self._matrix_path, mmap_mode='r')
+        with self._lock:
+            self._matrix = matrix
+            self._size = matrix.shape[0]
+            self._ids = list(meta['ids'])
+            self._digests = list(meta['digests'])
+            self._positions = {product_id: i for i, product_id in enumerate(self._ids)}
+
+    def save(self) -> None:
+        """Write the index atomically to `<index_path>.npy` and `<index_path>.json`."""
+        if self.index_path is None:
+            raise ValueError('index_path is not set')
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            matrix = np.ascontiguousarray(self._matrix[:self._size])
+            meta = {'encoder': self.encoder.name, 'ids': self._ids[:], 'digests': self._digests[:]}
+        tmp_matrix_path = self._matrix_path.with_suffix('.npy.tmp')
+        tmp_meta_path = self._meta_path.with_suffix('.json.tmp')
+        with open(tmp_matrix_path, 'wb') as file:
+            np.save(file, matrix)
+        with open(tmp_meta_path, 'w') as file:
+            json.dump(meta, file)
+        os.replace(tmp_matrix_path, self._matrix_path)
+        os.replace(tmp_meta_path, self._meta_path)
+
+    def _ensure_capacity(self, size: int) -> None:
+        """Grow (and detach from the memory map) the matrix so that it holds `size` rows."""
+        capacity: int = self._matrix.shape[0]
+        if size <= capacity and self._matrix.flags.writeable:
+            return
+        new_capacity: int = max(size, 2 * capacity, 64)
+        matrix = np.empty((new_capacity, self.encoder.dim), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        self._matrix = matrix
+
+    def upsert(self, products: Iterable[Product]) -> int:
+        """
+        Embed new products and products whose text changed since they were indexed.
+
+        Parameters
+        ----------
+        products : Iterable[Product]
+            The products to add or update.
+
+        Returns
+        -------
+        int
+            The number of products that were embedded.
+        """
+        pending: dict[str, tuple[str, str]] = {}
+        for product in products:
+            text: str = product_text(product)
+            digest: str = _digest(text)
+            position: int | None = self._positions.get(product.id)
+            if position is None or self._digests[position] != digest:
+                pending[product.id] = (text, digest)
+        if not pending:
+            return 0
+
+        vectors: np.ndarray = self.encoder.encode([text for text, _ in pending.values()])
+        with self._lock:
+            new_ids = [product_id for product_id in pending if product_id not in self._positions]
+            self._ensure_capacity(self._size + len(new_ids))
+            for product_id, (_, digest), vector in zip(pending, pending.values(), vectors, strict=True):
+                position = self._positions.get(product_id)
+                if position is None:
+                    position = self._size
+                    self._size += 1
+                    self._ids.append(product_id)
+                    self._digests.append(digest)
+                    self._positions[product_id] = position
+                else:
+                    self._digests[position] = digest
+                self._matrix[position] = vector
+        return len(pending)
+
+    def remove(self, product_ids: Iterable[str]) -> int:
+        """
+        Remove products from the index, keeping the matrix contiguous.
+
+        The last row is moved into the slot of each removed row, so removal costs O(1) per product.
+
+        Parameters
+        ----------
+        product_ids : Iterable[str]
+            The IDs of the products to remove. Unknown IDs are ignored.
+
+        Returns
+        -------
+        int
+            The number of products that were removed.
+        """
+        removed: int = 0
+        with self._lock:
+            for product_id in product_ids:
+                position: int | None = self._positions.pop(product_id, None)
+                if position is None:
+                    continue
+                self._ensure_capacity(self._size)
+                last: int = self._size - 1
+                if position != last:
+                    self._matrix[position] = self._matrix[last]
+                    self._ids[position] = self._ids[last]
+                    self._digests[position] = self._digests[last]
+                    self._positions[self._ids[position]] = position
+                self._ids.pop()
+                self._digests.pop()
+                self._size -= 1
+                removed += 1
+        return removed
+
+    def sync(self, products: Iterable[Product], batch_size: int = 1000) -> tuple[int, int]:
+        """
+        Make the index match the full catalog: embed new or changed products, drop deleted ones.
+
+        The products are consumed `batch_size` at a time, so a streamed query is never held in
+        memory as a whole; only the IDs seen are kept.
+
+        Parameters
+        ----------
+        products : Iterable[Product]
+            Every product of the catalog.
+        batch_size : int, optional
+            The number of products embedded at a time. Default is 1000.
+
+        Returns
+        -------
+        tuple[int, int]
+            The number of embedded products and the number of removed products.
+        """
+        products = iter(products)
+        current_ids: set[str] = set()
+        embedded: int = 0
+        while batch := list(islice(products, batch_size)):
+            current_ids.update(product.id for product in batch)
+            embedded += self.upsert(batch)
+        removed: int = self.remove([product_id for product_id in self._ids if product_id not in current_ids])
+        return embedded, removed
+
+    def search(self, query: str, k: int = 20, offset: int = 0) -> list[tuple[str, float]]:
+        """
+        Find the products most similar to a query.
+
+        Parameters
+        ----------
+        query : str
+            The search query entered by the user.
+        k : int, optional
+            The maximum number of results. Default is 20.
+        offset : int, optional
+            The number of best results to skip. Default is 0.
+
+        Returns
+        -------
+        list[tuple[str, float]]
+            Product IDs and cosine similarities, most similar first.
+        """
+        if k <= 0 or not self._size:
+            return []
+        query_vector: np.ndarray = self.encoder.encode([query])[0]
+        # `upsert` and `remove` overwrite rows in place, so the rows are scored and mapped to their
+        # IDs under the lock.
+        with self._lock:
+            size: int = self._size
+            scores: np.ndarray = self._matrix[:size] @ query_vector
+            n: int = min(offset + k, size)
+            if n < size:
+                top: np.ndarray = np.argpartition(-scores, n - 1)[:n]
+            else:
+                top = np.arange(size)
+            top = top[np.argsort(-scores[top], kind='stable')][offset:n]
+            return [(self._ids[i], float(scores[i])) for i in top]
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import time
+from collections.abc import Callable
+
+from sqlmodel import Session
+
+import cruds.product as product_crud
+from similarity_search.engine import SemanticSearchEngine
+
+
+logger = logging.getLogger('uvicorn')
+
+
+class SearchIndexer:
+    """
+    Background task keeping the semantic search index in step with the catalog.
+
+    Every `interval` seconds it streams the products from the database, embeds the new and changed
+    ones, drops the deleted ones and saves the index if it changed. Requests only search the index,
+    so they never wait for the catalog to be read or embedded. A round runs in a worker thread, since
+    both the query and the embedding block, and a failed round is logged and retried on the next one.
+
+    Parameters
+    ----------
+    session_factory : Callable[[], Session]
+        Returns a new database session for each round.
+    get_search_engine : Callable[[], SemanticSearchEngine]
+        Returns the search engine to keep up to date.
+    interval : float
+        Seconds between two rounds.
+    batch_size : int, optional
+        The number of products read and embedded at a time. Default is 1000.
+    """
+    def __init__(
+            self,
+            session_factory: Callable[[], Session],
+            get_search_engine: Callable[[], SemanticSearchEngine],
+            interval: float,
+            batch_size: int = 1000,
+        ):
+        self.session_factory = session_factory
+        self.get_search_engine = get_search_engine
+        self.interval = interval
+        self.batch_size = batch_size
+        self.embedded: int = 0
+        self.removed: int = 0
+        self.failures: int = 0
+        self.last_synced: float | None = None
+        self._task: asyncio.Task | None = None
+
+    def run_once(self) -> tuple[int, int]:
+        """
+        Sync the index with the catalog once, blocking until done.
+
+        Returns
+        -------
+        tuple[int, int]
+            The number of embedded products and the number of removed products.
+        """
+        search_engine: SemanticSearchEngine = self.get_search_engine()
+        with self.session_factory() as session:
+            embedded, removed = search_engine.sync(
+                product_crud.stream_product_texts(session=session, batch_size=self.batch_size),
+                batch_size=self.batch_size)
+        if (embedded or removed) and search_engine.index_path is not None:
+            search_engine.save()
+        self.embedded += embedded
+        self.removed += removed
+        self.last_synced = time.time()
+        return embedded, removed
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f'Semantic search indexing failed: {e}')
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """Index the catalog now, then every `interval` seconds, in the background."""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task. A round already running in its thread completes on its own."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict[str, float | None]:
+        """Return the numbers of products embedded and removed, failed rounds and the last sync time."""
+        return {
+            'embedded': self.embedded, 'removed': self.removed, 'failures': self.failures,
+            'last_synced': self.last_synced}
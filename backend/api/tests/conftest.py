@@ -6,42 +6,107 @@ sys.path.insert(0, str(app_dir))
 
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
 from sqlmodel import Session, SQLModel, create_engine
-from sqlmodel.pool import StaticPool
-import redis
+from sqlmodel.ext.asyncio.session import AsyncSession
+import fakeredis
+import fakeredis.aioredis
 
-from dependencies import get_session, verify_token, get_redis_client
+import dependencies
+from dependencies import (
+    get_session, get_async_session, verify_token, get_redis_client, get_async_redis_client, get_search_engine,
+    get_product_cache, get_response_cache)
+from caching.crud_cache import crud_cache
+from caching.lru import LRUCache
+from similarity_search.encoders import HashingEncoder
+from similarity_search.engine import SemanticSearchEngine
 from main import app
 
 
+@pytest.fixture(name="db_path")
+def db_path_fixture(tmp_path: Path) -> Path:
+    # A file database, so that the sync session of the tests and the async sessions of the app share data.
+    return tmp_path / "test.db"
+
+
 @pytest.fixture(name="session")
-def session_fixture():
+def session_fixture(db_path: Path):
     engine = create_engine(
-        url="sqlite://",
-        connect_args={"check_same_thread": False}, 
-        poolclass=StaticPool)
+        url=f"sqlite:///{db_path}",
+        connect_args={"check_same_thread": False})
     SQLModel.metadata.create_all(engine)
     with Session(engine) as session:
         yield session
+    engine.dispose()
+
+
+@pytest.fixture(name="async_engine")
+def async_engine_fixture(db_path: Path):
+    # NullPool: aiosqlite connections are bound to the event loop that opened them,
+    # and TestClient may run each request on a different one.
+    engine: AsyncEngine = create_async_engine(url=f"sqlite+aiosqlite:///{db_path}", poolclass=NullPool)
+    yield engine
+    engine.sync_engine.dispose()
+
+
+@pytest.fixture(name="redis_server")
+def redis_server_fixture():
+    # In-process stand-in for Redis; the sync and async fake clients share its data.
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture(autouse=True)
+def crud_cache_fixture(redis_server: fakeredis.FakeServer, monkeypatch: pytest.MonkeyPatch):
+    # Every test starts with empty cache tiers, the second one backed by the fake Redis.
+    monkeypatch.setattr(crud_cache, "redis_client", fakeredis.FakeStrictRedis(server=redis_server))
+    crud_cache.clear_l1()
+    yield
+    crud_cache.clear_l1()
 
 
 @pytest.fixture(name="client")
-def client_fixture(session: Session):
+def client_fixture(
+        session: Session,
+        async_engine: AsyncEngine,
+        redis_server: fakeredis.FakeServer,
+        monkeypatch: pytest.MonkeyPatch):
     def get_session_override():
         return session
+
+    async def get_async_session_override():
+        async with AsyncSession(async_engine, expire_on_commit=False) as async_session:
+            yield async_session
     
     def verify_token_override():
         return {'uid': 'user123456'}
     
     def get_redis_client_override():
-        redis_client = redis.StrictRedis(host='localhost', port=6379, db=1)
-        return redis_client
+        return fakeredis.FakeStrictRedis(server=redis_server)
+    # Used outside of requests, e.g. to bump the catalog version after product writes.
+    monkeypatch.setattr(dependencies, "redis_client", get_redis_client_override())
+
+    async def get_async_redis_client_override():
+        # One client per request: async connections are bound to the event loop of the request.
+        redis_client = fakeredis.aioredis.FakeRedis(server=redis_server)
+        yield redis_client
+        await redis_client.close()
 
     app.dependency_overrides[get_session] = get_session_override
+    app.dependency_overrides[get_async_session] = get_async_session_override
     app.dependency_overrides[verify_token] = verify_token_override
+    search_engine = SemanticSearchEngine(encoder=HashingEncoder())
+    def get_search_engine_override():
+        return search_engine
+
     app.dependency_overrides[get_redis_client] = get_redis_client_override
+    app.dependency_overrides[get_async_redis_client] = get_async_redis_client_override
+    app.dependency_overrides[get_search_engine] = get_search_engine_override
+    product_cache = LRUCache(maxsize=100)
+    app.dependency_overrides[get_product_cache] = lambda: product_cache
+    response_cache = LRUCache(maxsize=100, max_bytes=1024 * 1024)
+    app.dependency_overrides[get_response_cache] = lambda: response_cache
     client = TestClient(app)
     yield client
-    get_redis_client_override().flushdb()
     app.dependency_overrides.clear()
     
\ No newline at end of file
@@ -1,4 +1,11 @@
 from fastapi.testclient import TestClient
+from sqlmodel import Session
+import fakeredis
+
+import cruds.cart as cart_crud
+from models.reqres_models import OrderItemCreate
+from models.table_models import Product
+import settings
 
 
 def test_add_to_cart(client: TestClient):
@@ -51,3 +58,52 @@ def test_remove_cart(client: TestClient):
     resp = client.get(url='/api/cart/')
     data: dict = resp.json()
     assert data == {}
+
+
+def test_cart_quantity_is_capped(client: TestClient):
+    client.post(url='/api/cart/', json={'product_id': 'prod1', 'quantity': 60})
+    client.post(url='/api/cart/', json={'product_id': 'prod1', 'quantity': 60})
+    client.put(url='/api/cart/', json={'product_id': 'prod2', 'quantity': 1000})
+    resp = client.get(url='/api/cart/')
+    assert resp.json() == {'prod1': settings.CART_MAX_QUANTITY, 'prod2': settings.CART_MAX_QUANTITY}
+
+    client.put(url='/api/cart/', json={'product_id': 'prod2', 'quantity': 0})
+    resp = client.get(url='/api/cart/')
+    assert resp.json() == {'prod1': settings.CART_MAX_QUANTITY}
+
+
+def test_cart_script_is_reloaded_after_flush():
+    redis_client = fakeredis.FakeStrictRedis()
+    order_item = OrderItemCreate(product_id='prod1', quantity=2)
+    assert cart_crud.add_to_cart(redis_client=redis_client, user_id='user1', order_item=order_item) == 2
+
+    redis_client.script_flush()
+    assert cart_crud.add_to_cart(redis_client=redis_client, user_id='user1', order_item=order_item) == 4
+    assert redis_client.ttl('cart:user1') == cart_crud.CART_EXPIRE_SECONDS
+
+    order_item = OrderItemCreate(product_id='prod1', quantity=-5)
+    assert cart_crud.add_to_cart(redis_client=redis_client, user_id='user1', order_item=order_item) == 0
+    assert cart_crud.get_cart(redis_client=redis_client, user_id='user1') == {}
+
+
+def test_get_cart_details(session: Session, client: TestClient):
+    for i in range(1, 3):
+        session.add(Product(
+            id=f'prod{i}', name=f'name{i}', description=f'desc{i}',
+            price=i * 1000, author=f'author{i}', image_url=f'http://localhost{i}'))
+    session.commit()
+
+    resp = client.get(url='/api/cart/details')
+    assert resp.status_code == 200
+    assert resp.json() == {'items': [], 'total_quantity': 0, 'total': 0}
+
+    client.post(url='/api/cart/', json={'product_id': 'prod1', 'quantity': 2})
+    client.post(url='/api/cart/', json={'product_id': 'deleted', 'quantity': 1})
+    client.post(url='/api/cart/', json={'product_id': 'prod2', 'quantity': 3})
+    resp = client.get(url='/api/cart/details')
+    data: dict = resp.json()
+    assert resp.status_code == 200
+    assert [(item['product']['id'], item['quantity'], item['line_total']) for item in data['items']] == [
+        ('prod1', 2, 2000), ('prod2', 3, 6000)]
+    assert data['total_quantity'] == 5
+    assert data['total'] == 8000
@@ -0,0 +1,122 @@
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+from sqlalchemy import exc, text
+
+from database import (
+    CloudSQLConnectorManager, TimedAsyncAdaptedQueuePool, create_async_db_engine, create_db_engine, pool_status,
+    split_pool_size)
+
+
+class FakeConnector:
+    instances: list['FakeConnector'] = []
+
+    def __init__(self, loop: asyncio.AbstractEventLoop | None = None):
+        self.loop = loop
+        self.connections: int = 0
+        self.closed: bool = False
+        FakeConnector.instances.append(self)
+
+    def connect(self, instance_connection_name: str, driver: str, **kwargs) -> sqlite3.Connection:
+        self.connections += 1
+        return sqlite3.connect(':memory:', check_same_thread=False)
+
+    async def connect_async(self, instance_connection_name: str, driver: str, **kwargs) -> str:
+        assert driver == 'asyncpg' and self.loop is asyncio.get_running_loop()
+        self.connections += 1
+        return 'connection'
+
+    def close(self) -> None:
+        self.closed = True
+
+    async def close_async(self) -> None:
+        self.closed = True
+
+
+def test_connector_is_created_once_and_closed():
+    FakeConnector.instances.clear()
+    manager = CloudSQLConnectorManager(
+        instance_connection_name='project:region:instance', user='user', password='pass', db='db',
+        connector_factory=FakeConnector)
+    engine = create_db_engine(creator=manager.connect, url='sqlite://', pool_size=2, max_overflow=0)
+
+    connections = [engine.connect() for _ in range(2)]
+    for connection in connections:
+        assert connection.execute(text('SELECT 1')).scalar() == 1
+        connection.close()
+    engine.dispose()
+    with engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+
+    assert len(FakeConnector.instances) == 1
+    assert FakeConnector.instances[0].connections == 3
+
+    manager.close()
+    assert FakeConnector.instances[0].closed
+    manager.connect().close()
+    assert len(FakeConnector.instances) == 2
+
+
+def test_pool_status_reports_usage_and_waits():
+    engine = create_db_engine(
+        creator=lambda: sqlite3.connect(':memory:', check_same_thread=False),
+        url='sqlite://', pool_size=1, max_overflow=1, pool_timeout=0.2)
+
+    first = engine.connect()
+    second = engine.connect()
+    status = pool_status(engine)
+    assert status['size'] == 1
+    assert status['checked_out'] == 2
+    assert status['overflow'] == 1
+    assert status['checkouts'] == 2
+
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    assert pool_status(engine)['checkout_timeouts'] == 1
+
+    releaser = threading.Timer(0.05, second.close)
+    releaser.start()
+    with engine.connect():
+        status = pool_status(engine)
+        assert status['checkouts'] == 3
+        assert status['max_wait_ms'] >= 40
+    first.close()
+    releaser.join()
+    assert pool_status(engine)['checked_out'] == 0
+
+
+def test_async_connections_use_a_connector_of_the_event_loop():
+    FakeConnector.instances.clear()
+    manager = CloudSQLConnectorManager(
+        instance_connection_name='project:region:instance', user='user', password='pass', db='db',
+        connector_factory=FakeConnector)
+
+    async def connect_twice_and_close() -> None:
+        assert await manager.connect_async() == 'connection'
+        assert await manager.connect_async() == 'connection'
+        await manager.close_async()
+
+    asyncio.run(connect_twice_and_close())
+    assert len(FakeConnector.instances) == 1
+    assert FakeConnector.instances[0].connections == 2
+    assert FakeConnector.instances[0].closed
+
+
+def test_async_engine_pool_is_timed_and_sized():
+    async_engine = create_async_db_engine(connect=lambda: None, pool_size=4, max_overflow=2)
+    assert isinstance(async_engine.sync_engine.pool, TimedAsyncAdaptedQueuePool)
+    status = pool_status(async_engine.sync_engine)
+    assert status['size'] == 4
+    assert status['checked_out'] == 0
+    assert status['checkouts'] == 0
+
+
+def test_split_pool_size_keeps_the_total():
+    assert split_pool_size(10, 0.8) == (2, 8)
+    assert split_pool_size(5, 0.8) == (1, 4)
+    assert split_pool_size(1, 0.8) == (1, 1)
+    assert split_pool_size(0, 0.8) == (0, 0)
+    assert split_pool_size(10, 0.0) == (9, 1)
+    assert split_pool_size(10, 1.0) == (1, 9)
@@ -0,0 +1,200 @@
+import asyncio
+import time
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+import cruds.inventory as inventory_crud
+import dependencies
+from models.reqres_models import OrderItemCreate
+from models.table_models import Product, StockReconciliation, User
+
+
+def get_dummy_product(i: int, stock: int | None = None) -> Product:
+    return Product(
+        id=str(i),
+        name=f'prod{i}',
+        description=f'test{i}',
+        price=i*1000,
+        author=f'author{i}',
+        image_url=f'http://localhost{i}',
+        stock=stock)
+
+
+def test_reserve_commit_and_reconcile(session: Session, client: TestClient):
+    session.add(get_dummy_product(i=1, stock=3))
+    session.add(get_dummy_product(i=2))
+    session.commit()
+    redis_client = dependencies.redis_client
+    assert inventory_crud.load_stock(session=session, redis_client=redis_client) == 1
+    assert inventory_crud.get_available_stock(redis_client=redis_client, product_id='2') is None
+
+    items = [OrderItemCreate(product_id='1', quantity=2), OrderItemCreate(product_id='2', quantity=100)]
+    assert inventory_crud.reserve_stock(redis_client=redis_client, reservation_id='a', order_items=items, ttl=60) == []
+    assert inventory_crud.get_available_stock(redis_client=redis_client, product_id='1') == 1
+    # All or nothing: product 1 cannot take two more, so product 2 is not reserved either.
+    out_of_stock = inventory_crud.reserve_stock(
+        redis_client=redis_client, reservation_id='b', order_items=items, ttl=60)
+    assert out_of_stock == ['1']
+    assert inventory_crud.release_reservation(redis_client=redis_client, reservation_id='b') is False
+
+    assert inventory_crud.commit_reservation(redis_client=redis_client, reservation_id='a', order_items=items) is True
+    assert inventory_crud.get_available_stock(redis_client=redis_client, product_id='1') == 1
+    assert inventory_crud.reconcile_stock(session=session, redis_client=redis_client) == 2
+    session.expire_all()
+    assert session.get(Product, '1').stock == 1
+    assert inventory_crud.reconcile_stock(session=session, redis_client=redis_client) == 0
+
+    # Reloading never overwrites the live counts.
+    assert inventory_crud.load_stock(session=session, redis_client=redis_client) == 0
+
+
+def test_reconciliation_rounds_are_applied_once(session: Session, client: TestClient):
+    session.add(get_dummy_product(i=1, stock=10))
+    session.commit()
+    redis_client = dependencies.redis_client
+    inventory_crud.load_stock(session=session, redis_client=redis_client)
+    items = [OrderItemCreate(product_id='1', quantity=2)]
+    inventory_crud.reserve_stock(redis_client=redis_client, reservation_id='a', order_items=items, ttl=60)
+    inventory_crud.commit_reservation(redis_client=redis_client, reservation_id='a', order_items=items)
+
+    # The write fails: the units stay in the round instead of being lost.
+    def commit_failing():
+        raise RuntimeError('connection lost')
+    commit = session.commit
+    session.commit = commit_failing
+    with pytest.raises(RuntimeError):
+        inventory_crud.reconcile_stock(session=session, redis_client=redis_client)
+    session.commit = commit
+    round_id: str = redis_client.get('stock:reconciling:round').decode()
+    # Sales made in the meantime wait for the next round.
+    inventory_crud.reserve_stock(redis_client=redis_client, reservation_id='b', order_items=items, ttl=60)
+    inventory_crud.commit_reservation(redis_client=redis_client, reservation_id='b', order_items=items)
+    assert inventory_crud.reconcile_stock(session=session, redis_client=redis_client) == 2
+    session.expire_all()
+    assert session.get(Product, '1').stock == 8
+    assert session.get(StockReconciliation, round_id) is not None
+
+    # A crash after the commit leaves the next round in Redis: retrying it must not apply it twice.
+    assert inventory_crud.reconcile_stock(session=session, redis_client=redis_client) == 2
+    round_id = session.exec(select(StockReconciliation.id).order_by(StockReconciliation.id.desc())).first()
+    redis_client.set('stock:reconciling:round', round_id)
+    redis_client.hset('stock:reconciling', '1', 2)
+    assert inventory_crud.reconcile_stock(session=session, redis_client=redis_client) == 0
+    assert redis_client.exists('stock:reconciling', 'stock:reconciling:round') == 0
+    session.expire_all()
+    assert session.get(Product, '1').stock == 6
+
+
+def test_restocking_and_removing_the_limit(session: Session, client: TestClient):
+    session.add(get_dummy_product(i=1, stock=2))
+    session.add(get_dummy_product(i=2))
+    session.commit()
+    redis_client = dependencies.redis_client
+    items = [OrderItemCreate(product_id='1', quantity=2)]
+    # Not loaded yet: the product is loaded before the units are added.
+    assert inventory_crud.adjust_stock(session=session, redis_client=redis_client, product_id='1', units=3) == 5
+    inventory_crud.reserve_stock(redis_client=redis_client, reservation_id='a', order_items=items, ttl=60)
+    inventory_crud.commit_reservation(redis_client=redis_client, reservation_id='a', order_items=items)
+    assert inventory_crud.get_available_stock(redis_client=redis_client, product_id='1') == 3
+    # The restock and the sale are written together, as 3 units added and 2 sold.
+    inventory_crud.reconcile_stock(session=session, redis_client=redis_client)
+    session.expire_all()
+    assert session.get(Product, '1').stock == 3
+    with pytest.raises(ValueError):
+        inventory_crud.adjust_stock(session=session, redis_client=redis_client, product_id='2', units=1)
+
+    # A reservation outliving the limit does not bring the counts back.
+    inventory_crud.reserve_stock(redis_client=redis_client, reservation_id='b', order_items=items, ttl=60)
+    inventory_crud.set_stock_limit(session=session, redis_client=redis_client, product_id='1', stock=None)
+    assert session.get(Product, '1').stock is None
+    assert inventory_crud.release_reservation(redis_client=redis_client, reservation_id='b') is True
+    assert inventory_crud.get_available_stock(redis_client=redis_client, product_id='1') is None
+
+    inventory_crud.set_stock_limit(session=session, redis_client=redis_client, product_id='2', stock=4)
+    assert inventory_crud.get_available_stock(redis_client=redis_client, product_id='2') == 4
+    with pytest.raises(ValueError):
+        inventory_crud.set_stock_limit(session=session, redis_client=redis_client, product_id='2', stock=5)
+    # A limit removed in the database alone is dropped by the next load.
+    session.get(Product, '2').stock = None
+    session.commit()
+    inventory_crud.load_stock(session=session, redis_client=redis_client)
+    assert inventory_crud.get_available_stock(redis_client=redis_client, product_id='2') is None
+
+
+def test_expired_reservations_are_released():
+    redis_client = fakeredis.FakeStrictRedis()
+    redis_client.hset('stock:1', 'available', 5)
+    items = [OrderItemCreate(product_id='1', quantity=2)]
+    inventory_crud.reserve_stock(redis_client=redis_client, reservation_id='expired', order_items=items, ttl=-1)
+    inventory_crud.reserve_stock(redis_client=redis_client, reservation_id='live', order_items=items, ttl=60)
+    assert inventory_crud.get_available_stock(redis_client=redis_client, product_id='1') == 1
+
+    assert inventory_crud.release_expired_reservations(redis_client=redis_client, now=time.time()) == 1
+    assert inventory_crud.get_available_stock(redis_client=redis_client, product_id='1') == 3
+    assert redis_client.exists('reservation:expired') == 0
+
+    # An order committed after its reservation expired still takes its units.
+    live = inventory_crud.commit_reservation(redis_client=redis_client, reservation_id='expired', order_items=items)
+    assert live is False
+    assert inventory_crud.get_available_stock(redis_client=redis_client, product_id='1') == 1
+
+
+def test_concurrent_reservations_never_oversell():
+    redis_client = fakeredis.aioredis.FakeRedis()
+    items = [OrderItemCreate(product_id='1', quantity=1)]
+
+    async def scenario() -> tuple[list[list[str]], int | None]:
+        await redis_client.hset('stock:1', 'available', 10)
+        results: list[list[str]] = await asyncio.gather(*(
+            inventory_crud.reserve_stock_async(
+                redis_client=redis_client, reservation_id=str(i), order_items=items, ttl=60)
+            for i in range(200)))
+        return results, await inventory_crud.get_available_stock_async(redis_client=redis_client, product_id='1')
+
+    results, available = asyncio.run(scenario())
+    assert sum(result == [] for result in results) == 10
+    assert available == 0
+
+
+def test_orders_are_limited_by_stock(session: Session, client: TestClient):
+    session.add(User(id='user123456', email='dummy@example.com'))
+    session.add(get_dummy_product(i=1, stock=2))
+    session.commit()
+    redis_client = dependencies.redis_client
+    inventory_crud.load_stock(session=session, redis_client=redis_client)
+
+    resp = client.post(url='/api/orders/', json=[{'product_id': '1', 'quantity': 3}])
+    assert resp.status_code == 409
+    assert resp.json() == {'detail': 'Out of stock: 1'}
+    resp = client.post(url='/api/orders/', json=[{'product_id': '1', 'quantity': -1}])
+    assert resp.status_code == 400
+
+    # A failed order gives its reservation back.
+    resp = client.post(
+        url='/api/orders/', json=[{'product_id': '1', 'quantity': 1}, {'product_id': 'nope', 'quantity': 1}])
+    assert resp.status_code == 400
+    assert inventory_crud.get_available_stock(redis_client=redis_client, product_id='1') == 2
+
+    resp = client.post(url='/api/orders/', json=[{'product_id': '1', 'quantity': 2}])
+    assert resp.status_code == 200
+    assert inventory_crud.get_available_stock(redis_client=redis_client, product_id='1') == 0
+    assert client.post(url='/api/orders/', json=[{'product_id': '1', 'quantity': 1}]).status_code == 409
+
+
+def test_orders_without_redis(session: Session, client: TestClient, redis_server: fakeredis.FakeServer):
+    session.add(User(id='user123456', email='dummy@example.com'))
+    session.add(get_dummy_product(i=1, stock=2))
+    session.add(get_dummy_product(i=2))
+    session.commit()
+    redis_server.connected = False
+
+    # Products that are not stock-limited can still be ordered, the others cannot be checked.
+    resp = client.post(url='/api/orders/', json=[{'product_id': '2', 'quantity': 1}])
+    assert resp.status_code == 200
+    resp = client.post(
+        url='/api/orders/', json=[{'product_id': '1', 'quantity': 1}, {'product_id': '2', 'quantity': 1}])
+    assert resp.status_code == 503
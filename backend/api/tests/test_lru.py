@@ -0,0 +1,41 @@
+from caching.lru import LRUCache
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_evicts_least_recently_used_entries_beyond_max_bytes():
+    cache = LRUCache(maxsize=100, max_bytes=10)
+    cache.set('a', b'aaaa')
+    cache.set('b', b'bbbb')
+    assert cache.get('a') == b'aaaa'
+    cache.set('c', b'cccc')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == b'aaaa'
+    assert cache.get('c') == b'cccc'
+    assert cache.stats() | {'hit_ratio': 0} == {
+        'size': 2, 'maxsize': 100, 'hits': 3, 'misses': 1, 'evictions': 1, 'hit_ratio': 0,
+        'bytes': 8, 'max_bytes': 10}
+
+    cache.set('a', b'a')
+    assert cache.nbytes == 5
+    cache.delete('c')
+    assert cache.nbytes == 1
+
+
+def test_expired_entries_are_misses_and_free_their_bytes():
+    clock = FakeClock()
+    cache = LRUCache(maxsize=100, ttl=60, clock=clock, max_bytes=100)
+    cache.set('a', b'aaaa')
+    clock.now += 30
+    assert cache.get('a') == b'aaaa'
+    clock.now += 31
+    assert cache.get('a') is None
+    assert cache.nbytes == 0
+    assert 'bytes' not in LRUCache(maxsize=1).stats()
@@ -0,0 +1,22 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import settings
+
+
+def test_metrics_are_for_administrators_only(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, 'METRICS_ADMIN_UIDS', frozenset())
+    resp = client.get(url='/api/metrics/product-cache')
+    assert resp.status_code == 403
+
+    monkeypatch.setattr(settings, 'METRICS_ADMIN_UIDS', frozenset({'user123456'}))
+    resp = client.get(url='/api/metrics/product-cache')
+    assert resp.status_code == 200
+    assert 'hits' in resp.json()
+
+
+def test_metrics_need_a_token():
+    from main import app
+
+    resp = TestClient(app).get(url='/api/metrics/product-cache')
+    assert resp.status_code == 401
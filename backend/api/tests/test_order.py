@@ -1,9 +1,25 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 import ulid
 from rich import print
 
+import cruds.inventory as inventory_crud
+import cruds.order as order_crud
+import cruds.order_stream as order_stream_crud
+import cruds.popularity as popularity_crud
+import settings
 from models.table_models import Product, User, Order, OrderItem
+from ordering.persister import OrderPersister
+from ulid_time import ulid_to_datetime
 
 
 dummy_ulids: list[str] = [str(ulid.new()) for _ in range(10)]
@@ -17,7 +33,7 @@ def append_dummy_data_to_table(session: Session):
             name=f'prod{i}', 
             description=f'test{i}', 
             price=i*1000, 
-            auther=f'auther{i}', 
+            author=f'author{i}', 
             image_url=f'http://localhost{i}')
         session.add(product)
     session.commit()
@@ -26,12 +42,14 @@ def append_dummy_data_to_table(session: Session):
     session.add(user)
     session.commit()
     # order
-    order = Order(id=dummy_ulids[0], user_id='user123456')
+    order = Order(id=dummy_ulids[0], user_id='user123456', item_count=3, total=5000.0)
     session.add(order)
     session.commit()
     # order_item
-    order_item1 = OrderItem(id=dummy_ulids[1], order_id=dummy_ulids[0], product_id='prod_id1', quantity=1)
-    order_item2 = OrderItem(id=dummy_ulids[2], order_id=dummy_ulids[0], product_id='prod_id2', quantity=2)
+    order_item1 = OrderItem(
+        id=dummy_ulids[1], order_id=dummy_ulids[0], product_id='prod_id1', quantity=1, unit_price=1000.0)
+    order_item2 = OrderItem(
+        id=dummy_ulids[2], order_id=dummy_ulids[0], product_id='prod_id2', quantity=2, unit_price=2000.0)
     session.add(order_item1)
     session.add(order_item2)
     session.commit()
@@ -43,10 +61,14 @@ def get_dummy_product(i: int) -> Product:
         name=f'prod{i}', 
         description=f'test{i}', 
         price=i*1000, 
-        auther=f'auther{i}', 
+        author=f'author{i}', 
         image_url=f'http://localhost{i}')
 
 
+def ulid_to_isoformat(ulid_str: str) -> str:
+    return datetime.fromtimestamp(int(ulid.parse(ulid_str).timestamp()) / 1000.0).isoformat()
+
+
 def get_dummy_user() -> User:
     return User(id='user123456', email='dummy@example.com')
 
@@ -64,7 +86,8 @@ def test_create_order(session: Session, client: TestClient):
     resp = client.post(url='/api/orders/', json=[{'product_id': '1', 'quantity': 1}, {'product_id': '2', 'quantity': 2}])
     data: dict = resp.json()
     assert resp.status_code == 200
-    assert data == {'message': 'Your order has been placed successfully.'}
+    order_id: str = session.exec(select(Order.id)).one()
+    assert data == {'message': 'Your order has been placed successfully.', 'id': order_id}
     # resp = client.get(url='/api/orders/')
     # data: dict = resp.json()
     # print(data)
@@ -85,12 +108,369 @@ def test_read_orders(session: Session, client: TestClient):
             {
                 'id': dummy_ulids[0],
                 'order_items': [
-                    {'quantity': 1, 'product': {'name': 'prod1', 'description': 'test1', 'price': 1000.0, 'auther': 'auther1', 'image_url': 'http://localhost1', 'id': 'prod_id1'}},
-                    {'quantity': 2, 'product': {'name': 'prod2', 'description': 'test2', 'price': 2000.0, 'auther': 'auther2', 'image_url': 'http://localhost2', 'id': 'prod_id2'}}
-                ]
+                    {
+                        'quantity': 1, 'unit_price': 1000.0,
+                        'product': {
+                            'name': 'prod1', 'description': 'test1', 'price': 1000.0, 'author': 'author1',
+                            'image_url': 'http://localhost1', 'id': 'prod_id1'},
+                    },
+                    {
+                        'quantity': 2, 'unit_price': 2000.0,
+                        'product': {
+                            'name': 'prod2', 'description': 'test2', 'price': 2000.0, 'author': 'author2',
+                            'image_url': 'http://localhost2', 'id': 'prod_id2'},
+                    },
+                ],
+                'item_count': 3,
+                'total': 5000.0,
+                'purchase_date': ulid_to_isoformat(dummy_ulids[0]),
             }
-        ]
+        ],
+        'next_cursor': None,
     }
     
     assert data == expected_data
 
+
+def test_create_order_writes_all_items(session: Session, client: TestClient):
+    session.add(get_dummy_user())
+    for i in range(10):
+        session.add(get_dummy_product(i=i))
+    session.commit()
+
+    order_items = [{'product_id': str(i), 'quantity': i + 1} for i in range(5)]
+    resp = client.post(url='/api/orders/', json=order_items)
+    assert resp.status_code == 200
+
+    orders: list[Order] = session.exec(select(Order)).all()
+    assert len(orders) == 1
+    assert orders[0].user_id == 'user123456'
+    items: list[OrderItem] = session.exec(select(OrderItem).where(OrderItem.order_id == orders[0].id)).all()
+    assert sorted((item.product_id, item.quantity) for item in items) == [(str(i), i + 1) for i in range(5)]
+
+
+def test_create_order_with_unknown_product(session: Session, client: TestClient):
+    session.add(get_dummy_user())
+    session.add(get_dummy_product(i=1))
+    session.commit()
+
+    resp = client.post(
+        url='/api/orders/', json=[{'product_id': '1', 'quantity': 1}, {'product_id': 'nope', 'quantity': 1}])
+    assert resp.status_code == 400
+    assert resp.json() == {'detail': 'Products not found: nope'}
+    assert session.exec(select(Order)).all() == []
+    assert session.exec(select(OrderItem)).all() == []
+
+
+def test_read_orders_pages_with_cursor(session: Session, async_engine: AsyncEngine, client: TestClient):
+    session.add(get_dummy_user())
+    for i in range(3):
+        session.add(get_dummy_product(i=i))
+    order_ids: list[str] = sorted(str(ulid.new()) for _ in range(5))
+    for order_id in order_ids:
+        session.add(Order(id=order_id, user_id='user123456'))
+        session.add(OrderItem(order_id=order_id, product_id='1', quantity=1))
+        session.add(OrderItem(order_id=order_id, product_id='2', quantity=2))
+    session.commit()
+
+    statements: list[str] = []
+    def count_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(async_engine.sync_engine, 'before_cursor_execute', count_statement)
+
+    resp = client.get(url='/api/orders/', params={'limit': 2})
+    data: dict = resp.json()
+    assert resp.status_code == 200
+    assert [order['id'] for order in data['orders']] == order_ids[:-3:-1]
+    assert all(len(order['order_items']) == 2 for order in data['orders'])
+    assert data['next_cursor'] == order_ids[3]
+    # user + orders + order items + products, independent of the number of orders
+    assert len(statements) == 4
+
+    resp = client.get(url='/api/orders/', params={'limit': 2, 'cursor': data['next_cursor']})
+    data = resp.json()
+    assert [order['id'] for order in data['orders']] == order_ids[2:0:-1]
+    assert data['next_cursor'] == order_ids[1]
+
+    resp = client.get(url='/api/orders/', params={'limit': 2, 'cursor': data['next_cursor']})
+    data = resp.json()
+    assert [order['id'] for order in data['orders']] == order_ids[:1]
+    assert data['next_cursor'] is None
+    event.remove(async_engine.sync_engine, 'before_cursor_execute', count_statement)
+
+
+def test_checkout(session: Session, client: TestClient):
+    session.add(get_dummy_user())
+    for i in range(3):
+        session.add(get_dummy_product(i=i))
+    session.commit()
+
+    resp = client.post(url='/api/orders/checkout')
+    assert resp.status_code == 400
+    assert resp.json() == {'detail': 'Cart is empty'}
+
+    client.post(url='/api/cart/', json={'product_id': '1', 'quantity': 2})
+    client.post(url='/api/cart/', json={'product_id': '2', 'quantity': 1})
+    headers: dict[str, str] = {'Idempotency-Key': 'checkout-1'}
+    resp = client.post(url='/api/orders/checkout', headers=headers)
+    assert resp.status_code == 201
+    data: dict = resp.json()
+    assert sorted((item['product_id'], item['quantity']) for item in data['order_items']) == [('1', 2), ('2', 1)]
+    assert client.get(url='/api/cart/').json() == {}
+
+    # A retry gets the original order back without writing another one.
+    client.post(url='/api/cart/', json={'product_id': '0', 'quantity': 1})
+    replay = client.post(url='/api/orders/checkout', headers=headers)
+    assert replay.status_code == 201
+    assert replay.headers['idempotent-replayed'] == 'true'
+    assert replay.json() == data
+    assert [order.id for order in session.exec(select(Order)).all()] == [data['id']]
+    assert client.get(url='/api/cart/').json() == {'0': 1}
+
+
+def test_checkout_releases_the_key_on_failure(session: Session, client: TestClient):
+    session.add(get_dummy_user())
+    session.add(get_dummy_product(i=1))
+    session.commit()
+
+    client.post(url='/api/cart/', json={'product_id': 'nope', 'quantity': 1})
+    headers: dict[str, str] = {'Idempotency-Key': 'checkout-1'}
+    resp = client.post(url='/api/orders/checkout', headers=headers)
+    assert resp.status_code == 400
+    assert resp.json() == {'detail': 'Products not found: nope'}
+    assert client.get(url='/api/cart/').json() == {'nope': 1}
+
+    client.put(url='/api/cart/', json={'product_id': 'nope', 'quantity': 0})
+    client.post(url='/api/cart/', json={'product_id': '1', 'quantity': 1})
+    resp = client.post(url='/api/orders/checkout', headers=headers)
+    assert resp.status_code == 201
+    assert len(session.exec(select(Order)).all()) == 1
+
+
+def test_checkout_keeps_the_key_after_an_unknown_failure(
+        session: Session, client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    session.add(get_dummy_user())
+    session.add(get_dummy_product(i=1))
+    session.commit()
+
+    async def fail_after_commit(**kwargs) -> Order:
+        raise RuntimeError('connection lost')
+    create_order_with_items_async = order_crud.create_order_with_items_async
+    monkeypatch.setattr(order_crud, 'create_order_with_items_async', fail_after_commit)
+    client.post(url='/api/cart/', json={'product_id': '1', 'quantity': 1})
+    headers: dict[str, str] = {'Idempotency-Key': 'checkout-1'}
+    with pytest.raises(RuntimeError):
+        client.post(url='/api/orders/checkout', headers=headers)
+
+    # The order may have been committed, so a retry must not place a second one.
+    monkeypatch.setattr(order_crud, 'create_order_with_items_async', create_order_with_items_async)
+    resp = client.post(url='/api/orders/checkout', headers=headers)
+    assert resp.status_code == 409
+
+
+def test_write_behind_orders(
+        session: Session,
+        async_engine: AsyncEngine,
+        redis_server: fakeredis.FakeServer,
+        client: TestClient,
+        monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, 'ORDER_WRITE_BEHIND', True)
+    session.add(get_dummy_user())
+    for i in range(3):
+        session.add(get_dummy_product(i=i))
+    session.add(Order(id=dummy_ulids[0], user_id='user123456'))
+    session.add(OrderItem(order_id=dummy_ulids[0], product_id='0', quantity=1))
+    session.commit()
+
+    order_ids: list[str] = []
+    for i in [1, 2]:
+        resp = client.post(url='/api/orders/', json=[{'product_id': str(i), 'quantity': i}])
+        assert resp.status_code == 200
+        order_ids.append(resp.json()['id'])
+    assert session.exec(select(Order.id).where(Order.id.in_(order_ids))).all() == []
+
+    # Queued orders are listed before they are written, newest first and paged with the stored ones.
+    data: dict = client.get(url='/api/orders/', params={'limit': 2}).json()
+    assert [order['id'] for order in data['orders']] == order_ids[::-1]
+    assert data['orders'][0]['order_items'][0]['quantity'] == 2
+    assert data['orders'][0]['order_items'][0]['product']['id'] == '2'
+    assert data['next_cursor'] == order_ids[0]
+    data = client.get(url='/api/orders/', params={'limit': 2, 'cursor': data['next_cursor']}).json()
+    assert [order['id'] for order in data['orders']] == [dummy_ulids[0]]
+    assert data['next_cursor'] is None
+
+    async def persist() -> tuple[int, int, tuple[int, float]]:
+        redis_client = fakeredis.aioredis.FakeRedis(server=redis_server)
+        persister = OrderPersister(
+            session_factory=lambda: AsyncSession(async_engine, expire_on_commit=False),
+            consumer='test', batch_size=10, block_ms=10, claim_idle_ms=0)
+        persister.redis_client = redis_client
+        await order_stream_crud.create_order_group_async(redis_client=redis_client)
+        # A redelivered order is written once.
+        raw: bytes = (await redis_client.xrange(order_stream_crud.ORDER_STREAM_KEY, count=1))[0][1][b'order']
+        await redis_client.xadd(order_stream_crud.ORDER_STREAM_KEY, {'order': raw})
+        taken: int = await persister.run_once()
+        lag: tuple[int, float] = await order_stream_crud.get_order_stream_lag_async(redis_client=redis_client, now=0)
+        await redis_client.close()
+        return taken, persister.persisted, lag
+
+    assert asyncio.run(persist()) == (3, 2, (0, 0.0))
+    session.expire_all()
+    items: list[OrderItem] = session.exec(select(OrderItem).where(OrderItem.order_id.in_(order_ids))).all()
+    assert sorted((item.product_id, item.quantity) for item in items) == [('1', 1), ('2', 2)]
+    assert fakeredis.FakeStrictRedis(server=redis_server).keys('orders:pending:*') == []
+
+    data = client.get(url='/api/orders/').json()
+    assert [order['id'] for order in data['orders']] == order_ids[::-1] + [dummy_ulids[0]]
+
+
+def test_queued_orders_are_written_after_write_behind_is_turned_off(
+        session: Session,
+        async_engine: AsyncEngine,
+        redis_server: fakeredis.FakeServer,
+        client: TestClient,
+        monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, 'ORDER_WRITE_BEHIND', True)
+    session.add(get_dummy_user())
+    session.add(get_dummy_product(i=1))
+    session.commit()
+    order_id: str = client.post(url='/api/orders/', json=[{'product_id': '1', 'quantity': 1}]).json()['id']
+    monkeypatch.setattr(settings, 'ORDER_WRITE_BEHIND', False)
+
+    async def run_persister() -> int:
+        persister = OrderPersister(
+            session_factory=lambda: AsyncSession(async_engine, expire_on_commit=False),
+            consumer='test', batch_size=10, block_ms=10, claim_idle_ms=0)
+        redis_client = fakeredis.aioredis.FakeRedis(server=redis_server)
+        await persister.start(redis_client)
+        await asyncio.sleep(0.2)
+        await persister.stop()
+        # Starting without Redis does not fail the startup.
+        redis_server.connected = False
+        await persister.start(redis_client)
+        await persister.stop()
+        redis_server.connected = True
+        await redis_client.close()
+        return persister.persisted
+
+    assert asyncio.run(run_persister()) == 1
+    session.expire_all()
+    assert session.get(Order, order_id) is not None
+
+
+def test_rejected_write_behind_orders_are_compensated(
+        session: Session,
+        async_engine: AsyncEngine,
+        redis_server: fakeredis.FakeServer,
+        client: TestClient,
+        monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, 'ORDER_WRITE_BEHIND', True)
+    session.add(get_dummy_user())
+    product = get_dummy_product(i=1)
+    product.stock = 5
+    session.add(product)
+    session.commit()
+    redis_client = fakeredis.FakeStrictRedis(server=redis_server)
+    inventory_crud.load_stock(session=session, redis_client=redis_client)
+    order_id: str = client.post(url='/api/orders/', json=[{'product_id': '1', 'quantity': 2}]).json()['id']
+    assert inventory_crud.get_available_stock(redis_client=redis_client, product_id='1') == 3
+    # The product is deleted before the order is written, which the foreign key then rejects.
+    session.delete(session.get(Product, '1'))
+    session.commit()
+
+    @event.listens_for(async_engine.sync_engine, 'connect')
+    def enable_foreign_keys(dbapi_connection, connection_record) -> None:
+        dbapi_connection.execute('PRAGMA foreign_keys=ON')
+
+    async def persist() -> int:
+        async_redis_client = fakeredis.aioredis.FakeRedis(server=redis_server)
+        persister = OrderPersister(
+            session_factory=lambda: AsyncSession(async_engine, expire_on_commit=False),
+            consumer='test', batch_size=10, block_ms=10, claim_idle_ms=0)
+        persister.redis_client = async_redis_client
+        await order_stream_crud.create_order_group_async(redis_client=async_redis_client)
+        await persister.run_once()
+        await async_redis_client.close()
+        return persister.dead_lettered
+
+    assert asyncio.run(persist()) == 1
+    # The units are back on sale and out of the rankings, and the user sees why the order is gone.
+    assert inventory_crud.get_available_stock(redis_client=redis_client, product_id='1') == 5
+    assert redis_client.zscore(popularity_crud.POPULAR_ALL_KEY, '1') == 0
+    assert client.get(url='/api/orders/').json()['orders'] == []
+    rejected: list[dict] = client.get(url='/api/orders/rejected').json()
+    assert [(order['id'], order['order_items'], order['reason']) for order in rejected] == [
+        (order_id, [{'product_id': '1', 'quantity': 2}], order_stream_crud.REJECTED_ORDER_REASON)]
+
+
+def test_read_orders_without_redis(
+        session: Session,
+        redis_server: fakeredis.FakeServer,
+        client: TestClient,
+        monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, 'ORDER_WRITE_BEHIND', True)
+    append_dummy_data_to_table(session)
+    redis_server.connected = False
+
+    # The stored orders are served without the queued ones.
+    resp = client.get(url='/api/orders/')
+    assert resp.status_code == 200
+    assert [order['id'] for order in resp.json()['orders']] == [dummy_ulids[0]]
+    resp = client.get(url='/api/orders/spend')
+    assert resp.status_code == 200
+    assert resp.json() == {'order_count': 1, 'item_count': 3, 'total': 5000.0}
+
+
+def test_read_orders_in_date_range(session: Session, async_engine: AsyncEngine, client: TestClient):
+    session.add(get_dummy_user())
+    session.add(get_dummy_product(i=1))
+    base: datetime = datetime(2024, 1, 1, 12)
+    order_ids: list[str] = [str(ulid.from_timestamp(base + timedelta(days=day))) for day in range(5)]
+    for order_id in order_ids:
+        session.add(Order(id=order_id, user_id='user123456'))
+        session.add(OrderItem(order_id=order_id, product_id='1', quantity=1))
+    session.commit()
+
+    params: dict[str, str] = {
+        'from': (base + timedelta(days=1)).isoformat(), 'to': (base + timedelta(days=4)).isoformat()}
+    data: dict = client.get(url='/api/orders/', params=params).json()
+    assert [order['id'] for order in data['orders']] == order_ids[3:0:-1]
+    assert [order['purchase_date'] for order in data['orders']] == [
+        ulid_to_isoformat(order_id) for order_id in order_ids[3:0:-1]]
+
+    data = client.get(url='/api/orders/', params={**params, 'limit': 2}).json()
+    assert [order['id'] for order in data['orders']] == order_ids[3:1:-1]
+    data = client.get(url='/api/orders/', params={**params, 'limit': 2, 'cursor': data['next_cursor']}).json()
+    assert [order['id'] for order in data['orders']] == order_ids[1:2]
+    assert data['next_cursor'] is None
+
+    assert client.get(url='/api/orders/', params={'from': params['to'], 'to': params['from']}).status_code == 400
+    assert client.get(url='/api/orders/', params={'to': '1960-01-01T00:00:00'}).status_code == 400
+
+
+def test_orders_record_prices_and_totals(session: Session, client: TestClient):
+    session.add(get_dummy_user())
+    for i in range(3):
+        session.add(get_dummy_product(i=i))
+    session.commit()
+
+    resp = client.post(
+        url='/api/orders/', json=[{'product_id': '1', 'quantity': 2}, {'product_id': '2', 'quantity': 1}])
+    order_id: str = resp.json()['id']
+    order: Order = session.get(Order, order_id)
+    assert (order.item_count, order.total) == (3, 4000.0)
+
+    # A later price change does not alter the order.
+    product: Product = session.get(Product, '1')
+    product.price = 9999.0
+    session.add(product)
+    session.commit()
+    data: dict = client.get(url='/api/orders/').json()
+    assert (data['orders'][0]['item_count'], data['orders'][0]['total']) == (3, 4000.0)
+    assert sorted(item['unit_price'] for item in data['orders'][0]['order_items']) == [1000.0, 2000.0]
+
+    client.post(url='/api/orders/', json=[{'product_id': '1', 'quantity': 1}])
+    assert client.get(url='/api/orders/spend').json() == {'order_count': 2, 'item_count': 4, 'total': 13999.0}
+    params: dict[str, str] = {'to': ulid_to_datetime(order_id).isoformat()}
+    resp = client.get(url='/api/orders/spend', params=params)
+    assert resp.json() == {'order_count': 0, 'item_count': 0, 'total': 0.0}
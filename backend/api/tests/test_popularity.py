@@ -0,0 +1,71 @@
+import time
+from datetime import datetime, timedelta
+
+import ulid
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+import cruds.popularity as popularity_crud
+import dependencies
+from models.reqres_models import OrderItemCreate
+from models.table_models import Order, OrderItem, Product, User
+
+
+def get_dummy_product(i: int) -> Product:
+    return Product(
+        id=str(i),
+        name=f'prod{i}',
+        description=f'test{i}',
+        price=i*1000,
+        author=f'author{i}',
+        image_url=f'http://localhost{i}')
+
+
+def test_popular_products(session: Session, client: TestClient):
+    session.add(User(id='user123456', email='dummy@example.com'))
+    for i in range(4):
+        session.add(get_dummy_product(i=i))
+    session.commit()
+
+    assert client.get(url='/api/products/popular').json() == []
+    client.post(url='/api/orders/', json=[{'product_id': '1', 'quantity': 2}, {'product_id': '2', 'quantity': 1}])
+    client.post(url='/api/orders/', json=[{'product_id': '2', 'quantity': 2}, {'product_id': '3', 'quantity': 1}])
+    client.post(url='/api/orders/', json=[{'product_id': '1', 'quantity': 1}, {'product_id': '1', 'quantity': 1}])
+
+    data: list[dict] = client.get(url='/api/products/popular', params={'window': 'all', 'limit': 2}).json()
+    assert [(item['product']['id'], item['units_sold']) for item in data] == [('1', 4), ('2', 3)]
+    assert data[0]['product']['name'] == 'prod1'
+    data = client.get(url='/api/products/popular', params={'window': 'day'}).json()
+    assert [(item['product']['id'], item['units_sold']) for item in data] == [('1', 4), ('2', 3), ('3', 1)]
+    assert client.get(url='/api/products/popular', params={'window': 'year'}).status_code == 422
+
+
+def test_rolling_windows_and_rebuild(session: Session, client: TestClient):
+    redis_client = dependencies.redis_client
+    now: float = time.time()
+    session.add(User(id='user123456', email='dummy@example.com'))
+    for i in range(3):
+        session.add(get_dummy_product(i=i))
+    # Product 0 sold a year ago, product 1 three days ago, product 2 an hour ago.
+    for i, age in enumerate([timedelta(days=365), timedelta(days=3), timedelta(hours=1)]):
+        order_id: str = str(ulid.from_timestamp(datetime.fromtimestamp(now) - age))
+        session.add(Order(id=order_id, user_id='user123456'))
+        session.add(OrderItem(order_id=order_id, product_id=str(i), quantity=10 - i))
+    session.commit()
+
+    assert popularity_crud.rebuild_popularity(session=session, redis_client=redis_client, now=now, batch_size=2) == 3
+    def ranking(window: str) -> list[tuple[str, int]]:
+        return popularity_crud.get_popular_products(
+            redis_client=redis_client, window=window, limit=10, now=now, window_ttl=60)
+    assert ranking('all') == [('0', 10), ('1', 9), ('2', 8)]
+    assert ranking('week') == [('1', 9), ('2', 8)]
+    assert ranking('day') == [('2', 8)]
+    assert redis_client.keys(f'{popularity_crud.POPULAR_REBUILD_KEY_PREFIX}:*') == []
+
+    # New sales reach the all-time ranking at once, and the rolling windows when their union expires.
+    popularity_crud.record_sales(
+        redis_client=redis_client, order_items=[OrderItemCreate(product_id='1', quantity=5)], now=now)
+    assert ranking('all')[0] == ('1', 14)
+    assert ranking('day') == [('2', 8)]
+    redis_client.delete(f'{popularity_crud.POPULAR_WINDOW_KEY_PREFIX}:day')
+    assert ranking('day') == [('2', 8), ('1', 5)]
@@ -1,7 +1,20 @@
+import asyncio
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import Session, update
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+import cruds.catalog as catalog_crud
+import cruds.product as product_crud
+from caching.crud_cache import crud_cache
+import dependencies
+from main import app
 from models.table_models import Product
+from similarity_search.indexer import SearchIndexer
 
 
 def get_dummy_product(i: int) -> Product:
@@ -10,7 +23,7 @@ def get_dummy_product(i: int) -> Product:
         name=f'prod{i}', 
         description=f'test{i}', 
         price=i*1000, 
-        auther=f'auther{i}', 
+        author=f'author{i}', 
         image_url=f'http://localhost{i}')
 
 
@@ -28,17 +41,17 @@ def test_read_products(session: Session, client: TestClient):
     resp = client.get(url='/api/products/')
     data = resp.json()
     assert len(data) == 20
-    assert data == [get_dummy_product(i) for i in range(20)]
+    assert data == [get_dummy_product(i).dict(exclude={'stock'}) for i in range(20)]
 
-    resp = client.get(url='/api/products/', params={'skip': 0, 'limit': 120})
+    resp = client.get(url='/api/products/', params={'skip': 0, 'limit': 100})
     data = resp.json()
     assert len(data) == 100
-    assert data == [get_dummy_product(i) for i in range(100)]
+    assert data == [get_dummy_product(i).dict(exclude={'stock'}) for i in range(100)]
 
     resp = client.get(url='/api/products/', params={'skip': 10, 'limit': 25})
     data = resp.json()
     assert len(data) == 25
-    assert data == [get_dummy_product(i) for i in range(10, 10+25)]
+    assert data == [get_dummy_product(i).dict(exclude={'stock'}) for i in range(10, 10+25)]
 
 
 def test_read_product(session: Session, client: TestClient):
@@ -59,9 +72,273 @@ def test_read_product(session: Session, client: TestClient):
         'name': 'prod1',
         'description': 'test1',
         'price': 1000,
-        'auther': 'auther1',
+        'author': 'author1',
         'image_url': 'http://localhost1',
         'id': '1',
     }
 
 
+def test_read_products_with_cursor(session: Session, client: TestClient):
+    resp = client.get(url='/api/products/', params={'paging': 'cursor'})
+    assert resp.status_code == 200
+    assert resp.json() == {'items': [], 'next_cursor': None}
+
+    for i in range(25):
+        session.add(get_dummy_product(i=i))
+    session.commit()
+    expected_ids: list[str] = sorted(str(i) for i in range(25))
+
+    ids: list[str] = []
+    cursor: str | None = None
+    while True:
+        params = {'paging': 'cursor', 'limit': 10} | ({'cursor': cursor} if cursor else {})
+        resp = client.get(url='/api/products/', params=params)
+        assert resp.status_code == 200
+        data: dict = resp.json()
+        ids += [product['id'] for product in data['items']]
+        cursor = data['next_cursor']
+        if cursor is None:
+            break
+    assert ids == expected_ids
+
+    resp = client.get(url='/api/products/', params={'cursor': 'not-a-cursor'})
+    assert resp.status_code == 400
+
+def test_search_products(session: Session, client: TestClient):
+    session.add(Product(
+        id='1', name='Python Cookbook', description='Recipes for Python 3', price=3000, author='David Beazley',
+        image_url='http://localhost1'))
+    session.add(Product(
+        id='2', name='Fluent Python', description='Clear, concise and effective programming', price=4000,
+        author='Luciano Ramalho', image_url='http://localhost2'))
+    session.add(Product(
+        id='3', name='The Rust Book', description='Systems programming without fear', price=2000,
+        author='Steve Klabnik', image_url='http://localhost3'))
+    session.add(Product(id='4', name='100% Coverage', description='Testing handbook', price=1000, author='Jane Doe', image_url='http://localhost4'))
+    session.commit()
+
+    resp = client.get(url='/api/products/', params={'query': 'python'})
+    assert resp.status_code == 200
+    assert [product['id'] for product in resp.json()] == ['1', '2']
+
+    resp = client.get(url='/api/products/', params={'query': 'programming'})
+    assert [product['id'] for product in resp.json()] == ['2', '3']
+
+    resp = client.get(url='/api/products/', params={'query': 'PYTHON recipes'})
+    assert [product['id'] for product in resp.json()] == ['1']
+
+    resp = client.get(url='/api/products/', params={'query': 'klabnik'})
+    assert [product['id'] for product in resp.json()] == ['3']
+
+    resp = client.get(url='/api/products/', params={'query': '%'})
+    assert [product['id'] for product in resp.json()] == ['4']
+
+    resp = client.get(url='/api/products/', params={'query': 'python', 'skip': 1, 'limit': 1})
+    assert [product['id'] for product in resp.json()] == ['2']
+
+    resp = client.get(url='/api/products/', params={'query': 'cobol'})
+    assert resp.json() == []
+
+def test_semantic_search_products(session: Session, client: TestClient):
+    session.add(Product(
+        id='1', name='Python Cookbook', description='recipes for python programmers', price=3000,
+        author='David Beazley', image_url='http://localhost1'))
+    session.add(Product(
+        id='2', name='Rust in Action', description='systems programming with rust', price=4000,
+        author='Tim McNamara', image_url='http://localhost2'))
+    session.add(Product(
+        id='3', name='Baking Bread', description='sourdough recipes at home', price=2000, author='Jane Doe',
+        image_url='http://localhost3'))
+    session.commit()
+    # The index is built in the background, not by the requests.
+    search_engine = app.dependency_overrides[dependencies.get_search_engine]()
+    assert client.get(url='/api/products/semantic-search', params={'query': 'rust programming'}).json() == []
+    indexer = SearchIndexer(
+        session_factory=lambda: Session(session.get_bind()), get_search_engine=lambda: search_engine, interval=60)
+    assert indexer.run_once() == (3, 0)
+
+    resp = client.get(url='/api/products/semantic-search', params={'query': 'rust programming', 'limit': 2})
+    assert resp.status_code == 200
+    assert [product['id'] for product in resp.json()] == ['2', '1']
+
+    resp = client.get(url='/api/products/semantic-search', params={'query': 'rust programming', 'skip': 1, 'limit': 1})
+    assert [product['id'] for product in resp.json()] == ['1']
+
+    session.delete(session.get(Product, '2'))
+    session.commit()
+    assert indexer.run_once() == (0, 1)
+    resp = client.get(url='/api/products/semantic-search', params={'query': 'rust programming', 'limit': 2})
+    assert [product['id'] for product in resp.json()] == ['1', '3']
+
+
+
+def test_read_products_batch(session: Session, client: TestClient):
+    for i in range(1, 4):
+        session.add(get_dummy_product(i=i))
+    session.commit()
+
+    resp = client.get(url='/api/products/batch', params={'ids': '3,nope,1,3'})
+    data: dict = resp.json()
+    assert resp.status_code == 200
+    assert [product['id'] for product in data['items']] == ['3', '1']
+    assert data['missing'] == ['nope']
+
+    # Products already served come from the cache, without hitting the database.
+    session.exec(update(Product).where(Product.id == '1').values(price=1))
+    session.commit()
+    resp = client.post(url='/api/products/batch', json={'ids': ['1', '2']})
+    assert [product['price'] for product in resp.json()['items']] == [1000, 2000]
+
+    # Product writes through the ORM move the catalog version, which drops the cached products.
+    session.delete(session.get(Product, '3'))
+    session.commit()
+    resp = client.post(url='/api/products/batch', json={'ids': ['1', '2', '3']})
+    data = resp.json()
+    assert resp.status_code == 200
+    assert [product['id'] for product in data['items']] == ['1', '2']
+    assert [product['price'] for product in data['items']] == [1, 2000]
+    assert data['missing'] == ['3']
+
+    resp = client.get(url='/api/products/batch', params={'ids': ','.join(str(i) for i in range(1000))})
+    assert resp.status_code == 400
+
+
+def test_catalog_conditional_get(session: Session, client: TestClient):
+    session.add(get_dummy_product(i=1))
+    session.commit()
+
+    resp = client.get(url='/api/products/count')
+    etag: str = resp.headers['etag']
+    assert resp.status_code == 200
+    assert resp.headers['cache-control'].startswith('public, max-age=')
+    assert 'last-modified' in resp.headers
+
+    for url in ['/api/products/count', '/api/products/', '/api/products/1']:
+        resp = client.get(url=url, headers={'If-None-Match': etag})
+        assert resp.status_code == 304
+        assert resp.content == b''
+        assert resp.headers['etag'] == etag
+    resp = client.get(url='/api/products/count', headers={'If-None-Match': f'"other", W/{etag}'})
+    assert resp.status_code == 304
+    resp = client.get(url='/api/products/count', headers={'If-Modified-Since': resp.headers['last-modified']})
+    assert resp.status_code == 304
+
+    # Any product write moves the catalog to a new version.
+    product: Product = session.get(Product, '1')
+    product.price = 500
+    session.add(product)
+    session.commit()
+    resp = client.get(url='/api/products/1', headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert resp.json()['price'] == 500
+    assert resp.headers['etag'] != etag
+
+
+def test_async_product_writes_bump_the_catalog_version_in_the_background(
+        session: Session,
+        async_engine: AsyncEngine,
+        redis_server: fakeredis.FakeServer,
+        monkeypatch: pytest.MonkeyPatch):
+    # The sync client would block the event loop; make it unusable to show it is not called.
+    offline_server = fakeredis.FakeServer()
+    offline_server.connected = False
+    monkeypatch.setattr(dependencies, 'redis_client', fakeredis.FakeStrictRedis(server=offline_server))
+    redis_client = fakeredis.FakeStrictRedis(server=redis_server)
+
+    async def scenario() -> None:
+        monkeypatch.setattr(dependencies, 'async_redis_client', fakeredis.aioredis.FakeRedis(server=redis_server))
+        async with AsyncSession(async_engine) as async_session:
+            async_session.add(get_dummy_product(i=1))
+            await async_session.commit()
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    assert catalog_crud.get_catalog_version(redis_client)[0] == 1
+
+
+def test_catalog_is_served_uncached_without_redis(
+        session: Session, client: TestClient, redis_server: fakeredis.FakeServer):
+    session.add(get_dummy_product(i=1))
+    session.commit()
+    etag: str = client.get(url='/api/products/1').headers['etag']
+
+    redis_server.connected = False
+    for url in ['/api/products/1', '/api/products/count']:
+        resp = client.get(url=url, headers={'If-None-Match': etag})
+        assert resp.status_code == 200
+        assert resp.headers['cache-control'] == 'no-store'
+        assert 'etag' not in resp.headers and 'last-modified' not in resp.headers
+    assert client.get(url='/api/products/1').json()['price'] == 1000
+
+
+def test_catalog_responses_are_cached_per_version(session: Session, client: TestClient):
+    for i in range(1, 3):
+        session.add(get_dummy_product(i=i))
+    session.commit()
+    assert client.get(url='/api/products/1').json()['price'] == 1000
+    assert [product['price'] for product in client.get(url='/api/products/').json()] == [1000, 2000]
+
+    # A write outside the ORM does not bump the catalog version, so cached bodies are still served.
+    session.execute(update(Product).values(price=1))
+    session.commit()
+    assert client.get(url='/api/products/1').json()['price'] == 1000
+    resp = client.get(url='/api/products/', params={'limit': 20})
+    assert [product['price'] for product in resp.json()] == [1000, 2000]
+
+    catalog_crud.bump_catalog_version(dependencies.redis_client)
+    crud_cache.invalidate_tags(['catalog'])
+    assert client.get(url='/api/products/1').json()['price'] == 1
+    assert [product['price'] for product in client.get(url='/api/products/').json()] == [1, 1]
+
+
+def test_count_products(session: Session, client: TestClient):
+    for i in range(1, 3):
+        session.add(get_dummy_product(i=i))
+    session.commit()
+    assert client.get(url='/api/products/count').json() == {'count': 2, 'approximate': False}
+    assert client.get(url='/api/products/').headers['x-total-count'] == '2'
+    assert 'x-total-count' not in client.get(url='/api/products/', params={'query': 'prod'}).headers
+    # SQLite has no planner statistics, so the exact count is returned.
+    resp = client.get(url='/api/products/count', params={'approximate': True})
+    assert resp.json() == {'count': 2, 'approximate': False}
+
+    # Updating a product keeps the cached count; adding or deleting one recomputes it.
+    loads: int = crud_cache.stats()['loads']
+    product: Product = session.get(Product, '1')
+    product.price = 500
+    session.commit()
+    assert client.get(url='/api/products/count').json()['count'] == 2
+    assert crud_cache.stats()['loads'] == loads
+    session.add(get_dummy_product(i=3))
+    session.commit()
+    assert client.get(url='/api/products/count').json()['count'] == 3
+    session.delete(session.get(Product, '1'))
+    session.commit()
+    assert client.get(url='/api/products/', params={'paging': 'cursor'}).headers['x-total-count'] == '2'
+
+
+def test_read_products_envelope(session: Session, client: TestClient):
+    for i in range(1, 6):
+        session.add(get_dummy_product(i=i))
+    session.commit()
+
+    resp = client.get(url='/api/products/', params={'envelope': True, 'skip': 1, 'limit': 2})
+    assert resp.status_code == 200
+    data: dict = resp.json()
+    assert [product['id'] for product in data['items']] == ['2', '3']
+    assert (data['total'], data['skip'], data['limit']) == (5, 1, 2)
+
+    data = client.get(url='/api/products/', params={'envelope': True, 'query': 'prod', 'limit': 2}).json()
+    assert len(data['items']) == 2 and data['total'] == 5
+    data = client.get(url='/api/products/', params={'envelope': True, 'query': 'prod', 'skip': 10}).json()
+    assert data['items'] == [] and data['total'] == 5
+    data = client.get(url='/api/products/', params={'envelope': True, 'query': 'nothing'}).json()
+    assert data['items'] == [] and data['total'] == 0
+
+    for total_mode in ['window', 'counter']:
+        products, total = product_crud.read_products_with_total(session=session, skip=4, limit=2, total_mode=total_mode)
+        assert [product.id for product in products] == ['5'] and total == 5
+        products, total = product_crud.read_products_with_total(session=session, skip=10, total_mode=total_mode)
+        assert products == [] and total == 5
+    with pytest.raises(ValueError):
+        product_crud.read_products_with_total(session=session, total_mode='exact')
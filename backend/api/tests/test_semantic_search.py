@@ -0,0 +1,103 @@
+from pathlib import Path
+
+import numpy as np
+
+from models.table_models import Product
+from similarity_search.encoders import HashingEncoder
+from similarity_search.engine import SemanticSearchEngine
+
+
+def get_product(product_id: str, name: str, description: str = '') -> Product:
+    return Product(
+        id=product_id,
+        name=name,
+        description=description,
+        price=1000,
+        author='author',
+        image_url='http://localhost')
+
+
+def get_catalog() -> list[Product]:
+    return [
+        get_product('1', 'Python Cookbook', 'recipes for python programmers'),
+        get_product('2', 'Rust in Action', 'systems programming with rust'),
+        get_product('3', 'Baking Bread', 'sourdough recipes at home'),
+        get_product('4', 'Deep Learning', 'neural networks and gradient descent'),
+    ]
+
+
+def test_hashing_encoder_is_deterministic_and_normalized():
+    encoder = HashingEncoder(dim=64)
+    vectors = encoder.encode(['python cookbook', 'python cookbook', ''])
+    assert vectors.dtype == np.float32
+    assert vectors.shape == (3, 64)
+    np.testing.assert_array_equal(vectors[0], vectors[1])
+    np.testing.assert_allclose(np.linalg.norm(vectors[0]), 1.0, rtol=1e-6)
+
+
+def test_search_returns_most_similar_first():
+    engine = SemanticSearchEngine(encoder=HashingEncoder())
+    assert engine.search('python') == []
+    assert engine.upsert(get_catalog()) == 4
+
+    hits = engine.search('rust programming', k=2)
+    assert [product_id for product_id, _ in hits] == ['2', '1']
+    assert hits[0][1] >= hits[1][1]
+
+    assert {product_id for product_id, _ in engine.search('recipes', k=2)} == {'1', '3'}
+    assert len(engine.search('anything', k=10)) == 4
+    assert engine.search('rust programming', k=1, offset=1) == hits[1:]
+
+
+def test_search_pairs_ids_with_their_own_rows():
+    encoder = HashingEncoder()
+    engine = SemanticSearchEngine(encoder=encoder)
+    engine.upsert(get_catalog())
+    reference = SemanticSearchEngine(encoder=encoder)
+    reference.upsert([product for product in get_catalog() if product.id != '2'])
+
+    class RemovingEncoder:
+        dim = encoder.dim
+
+        def encode(self, texts: list[str]) -> np.ndarray:
+            # Runs while the query is embedded: '4' takes the row of '2' in place.
+            engine.remove(['2'])
+            return encoder.encode(texts)
+
+    engine.encoder = RemovingEncoder()
+    assert engine.search('rust programming', k=4) == reference.search('rust programming', k=4)
+
+
+def test_upsert_only_embeds_changed_products():
+    engine = SemanticSearchEngine(encoder=HashingEncoder())
+    engine.upsert(get_catalog())
+    assert engine.upsert(get_catalog()) == 0
+
+    catalog = get_catalog()
+    catalog[2] = get_product('3', 'Gardening', 'growing tomatoes')
+    assert engine.upsert(catalog) == 1
+    assert engine.search('tomatoes', k=1)[0][0] == '3'
+
+    assert engine.sync(catalog[:2]) == (0, 2)
+    assert len(engine) == 2
+    assert {product_id for product_id, _ in engine.search('anything', k=10)} == {'1', '2'}
+
+
+def test_index_is_persisted_and_memory_mapped(tmp_path: Path):
+    index_path = tmp_path / 'products'
+    engine = SemanticSearchEngine(encoder=HashingEncoder(), index_path=index_path)
+    engine.upsert(get_catalog())
+    engine.save()
+
+    reloaded = SemanticSearchEngine(encoder=HashingEncoder(), index_path=index_path)
+    assert len(reloaded) == 4
+    assert isinstance(reloaded._matrix, np.memmap)
+    assert reloaded.search('rust programming', k=2) == engine.search('rust programming', k=2)
+    assert reloaded.upsert(get_catalog()) == 0
+
+    reloaded.remove(['1'])
+    assert len(reloaded) == 3
+    assert not isinstance(reloaded._matrix, np.memmap)
+
+    other_encoder = SemanticSearchEngine(encoder=HashingEncoder(dim=32), index_path=index_path)
+    assert len(other_encoder) == 0
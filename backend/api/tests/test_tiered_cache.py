@@ -0,0 +1,250 @@
+import asyncio
+import threading
+import time
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import cruds.auth as auth_crud
+from caching.crud_cache import crud_cache
+from caching.tiered import TieredCache
+from models.table_models import Product
+
+
+class Counter:
+    def __init__(self):
+        self.calls: int = 0
+
+
+def make_read_product(cache: TieredCache, counter: Counter):
+    @cache.cached(key='product:{product_id}', tags=['product:{product_id}', 'catalog'])
+    def read_product(session: object, product_id: str) -> Product | None:
+        counter.calls += 1
+        if product_id == 'missing':
+            return None
+        return Product(id=product_id, name='name', price=100, author='author', image_url='http://localhost')
+    return read_product
+
+
+def test_results_are_shared_through_redis():
+    server = fakeredis.FakeServer()
+    instance1 = TieredCache(maxsize=10, ttl=60)
+    instance2 = TieredCache(maxsize=10, ttl=60)
+    instance1.redis_client = fakeredis.FakeStrictRedis(server=server)
+    instance2.redis_client = fakeredis.FakeStrictRedis(server=server)
+    counter = Counter()
+    read_product1 = make_read_product(instance1, counter)
+    read_product2 = make_read_product(instance2, counter)
+
+    assert read_product1(None, product_id='1').id == '1'
+    assert read_product1(None, '1').id == '1'
+    product: Product = read_product2(session=None, product_id='1')
+    assert isinstance(product, Product) and product.price == 100
+    assert read_product2(None, 'missing') is None
+    assert read_product1(None, 'missing') is None
+    assert counter.calls == 2
+    assert instance1.stats()['l1_hits'] == 1
+    assert instance1.stats()['l2_hits'] == 1 and instance2.stats()['l2_hits'] == 1
+
+    instance1.invalidate_tags(['catalog'])
+    assert read_product1(None, '1').id == '1'
+    assert counter.calls == 3
+
+
+def test_invalidation_reaches_other_instances():
+    server = fakeredis.FakeServer()
+    writer = TieredCache(maxsize=10, ttl=60)
+    reader = TieredCache(maxsize=10, ttl=60)
+    writer.redis_client = fakeredis.FakeStrictRedis(server=server)
+    reader.redis_client = fakeredis.FakeStrictRedis(server=server)
+    counter = Counter()
+    read_product = make_read_product(reader, counter)
+
+    async def scenario() -> None:
+        await reader.start(fakeredis.aioredis.FakeRedis(server=server))
+        try:
+            await asyncio.sleep(0.05)
+            read_product(None, '1')
+            read_product(None, '2')
+            writer.invalidate_tags(['product:1'])
+            for _ in range(100):
+                if len(reader.l1) == 1:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await reader.stop()
+
+    asyncio.run(scenario())
+    assert reader.l1.keys() == ['product:2']
+    read_product(None, '1')
+    read_product(None, '2')
+    assert counter.calls == 3
+
+
+def test_loads_racing_with_an_invalidation_are_not_stored():
+    server = fakeredis.FakeServer()
+    reader = TieredCache(maxsize=10, ttl=60)
+    writer = TieredCache(maxsize=10, ttl=60)
+    reader.redis_client = fakeredis.FakeStrictRedis(server=server)
+    writer.redis_client = fakeredis.FakeStrictRedis(server=server)
+    prices: list[int] = [100]
+
+    @reader.cached(key='product:{product_id}', tags=['product:{product_id}'])
+    def read_product(session: object, product_id: str) -> Product | None:
+        price: int = prices[0]
+        if price == 100:
+            # A write commits and invalidates after the row was read, before the result is stored.
+            prices[0] = 200
+            writer.invalidate_tags(['product:1'])
+        return Product(id=product_id, name='name', price=price, author='author', image_url='http://localhost')
+
+    assert read_product(None, '1').price == 100
+    assert reader.redis_client.get('cache:product:1') is None and len(reader.l1) == 0
+    assert read_product(None, '1').price == 200
+    assert read_product(None, '1').price == 200
+    assert reader.stats()['loads'] == 2
+
+    reader.redis_client = None
+
+    @reader.cached(key='user:{user_id}', tags=['user:{user_id}'])
+    async def read_user_async(session: object, user_id: str) -> Product | None:
+        reader.invalidate_tags(['user:1'])
+        return None
+
+    assert asyncio.run(read_user_async(None, '1')) is None
+    assert reader.l1.keys() == ['product:1']
+
+
+def test_concurrent_misses_are_coalesced():
+    cache = TieredCache(maxsize=10, ttl=60)
+    counter = Counter()
+    release = threading.Event()
+
+    @cache.cached(key='product:{product_id}')
+    def read_product(session: object, product_id: str) -> Product | None:
+        counter.calls += 1
+        release.wait(5)
+        return Product(id=product_id, name='name', price=100, author='author', image_url='http://localhost')
+
+    @cache.cached(key='product-async:{product_id}')
+    async def read_product_async(session: object, product_id: str) -> Product | None:
+        counter.calls += 1
+        await asyncio.sleep(0.05)
+        return Product(id=product_id, name='name', price=100, author='author', image_url='http://localhost')
+
+    results: list[Product] = []
+    threads = [threading.Thread(target=lambda: results.append(read_product(None, '1'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    while cache.stats()['coalesced'] < 7:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert counter.calls == 1
+    assert len(results) == 8 and len({id(product) for product in results}) == 8
+
+    async def scenario() -> list[Product]:
+        return await asyncio.gather(*(read_product_async(None, '1') for _ in range(8)))
+
+    assert [product.id for product in asyncio.run(scenario())] == ['1'] * 8
+    assert counter.calls == 2
+    assert cache.stats()['loads'] == 2 and cache.stats()['coalesced'] == 14
+
+
+def test_other_instances_wait_for_the_lock_holder():
+    server = fakeredis.FakeServer()
+    holder = TieredCache(maxsize=10, ttl=60, lock_timeout=5)
+    waiter = TieredCache(maxsize=10, ttl=60, lock_timeout=5)
+    holder.redis_client = fakeredis.FakeStrictRedis(server=server)
+    waiter.redis_client = fakeredis.FakeStrictRedis(server=server)
+    counter = Counter()
+    loading = threading.Event()
+    release = threading.Event()
+
+    @holder.cached(key='product:{product_id}')
+    def slow_read_product(session: object, product_id: str) -> Product | None:
+        counter.calls += 1
+        loading.set()
+        release.wait(5)
+        return Product(id=product_id, name='name', price=100, author='author', image_url='http://localhost')
+
+    read_product = make_read_product(waiter, counter)
+    thread = threading.Thread(target=slow_read_product, args=(None, '1'))
+    thread.start()
+    loading.wait(5)
+    threading.Timer(0.2, release.set).start()
+    assert read_product(None, '1').id == '1'
+    thread.join()
+    assert counter.calls == 1
+    assert waiter.stats()['lock_waits'] == 1
+    assert holder.redis_client.get('cache:lock:product:1') is None
+
+
+def test_entries_are_refreshed_before_they_expire():
+    counter = Counter()
+    eager = TieredCache(maxsize=10, ttl=60, early_refresh_beta=1e9)
+    never = TieredCache(maxsize=10, ttl=60, early_refresh_beta=0)
+
+    def slow_read_product(cache: TieredCache):
+        @cache.cached(key='product:{product_id}')
+        def read_product(session: object, product_id: str) -> Product | None:
+            counter.calls += 1
+            time.sleep(0.01)
+            return Product(id=product_id, name='name', price=100, author='author', image_url='http://localhost')
+        return read_product
+
+    read_eagerly = slow_read_product(eager)
+    for _ in range(3):
+        read_eagerly(None, '1')
+    assert counter.calls == 3 and eager.stats()['early_refreshes'] == 2
+
+    read_never = slow_read_product(never)
+    for _ in range(3):
+        read_never(None, '1')
+    assert counter.calls == 4 and never.stats()['early_refreshes'] == 0
+
+
+def test_orm_writes_invalidate_cached_reads(session: Session):
+    assert auth_crud.get_user(session=session, user_id='user1') is None
+    auth_crud.append_user(session=session, user_id='user1', email='user1@example.com')
+    user = auth_crud.get_user(session=session, user_id='user1')
+    assert user.email == 'user1@example.com'
+
+    # A cached user is detached from the session; deleting it still works.
+    session.expunge_all()
+    auth_crud.delete_user(session=session, db_user=auth_crud.get_user(session=session, user_id='user1'))
+    assert auth_crud.get_user(session=session, user_id='user1') is None
+
+
+def test_async_commits_invalidate_through_the_async_client(
+        session: Session,
+        async_engine: AsyncEngine,
+        redis_server: fakeredis.FakeServer,
+        monkeypatch: pytest.MonkeyPatch):
+    # The sync client would block the event loop; make it unusable to show it is not called.
+    offline_server = fakeredis.FakeServer()
+    offline_server.connected = False
+    monkeypatch.setattr(crud_cache, 'redis_client', fakeredis.FakeStrictRedis(server=offline_server))
+    redis_client = fakeredis.FakeStrictRedis(server=redis_server)
+
+    async def scenario() -> None:
+        await crud_cache.start(fakeredis.aioredis.FakeRedis(server=redis_server))
+        try:
+            async with AsyncSession(async_engine, expire_on_commit=False) as async_session:
+                await auth_crud.append_user_async(session=async_session, user_id='user1', email='user1@example.com')
+                await asyncio.sleep(0.05)
+                user = await auth_crud.get_user_async(session=async_session, user_id='user1')
+                assert redis_client.exists('cache:user:user1')
+                await auth_crud.delete_user_async(session=async_session, db_user=user)
+                assert await auth_crud.get_user_async(session=async_session, user_id='user1') is None
+        finally:
+            await crud_cache.stop()
+
+    asyncio.run(scenario())
+    assert redis_client.get('cache:user:user1').endswith(b'|null')
+    assert redis_client.hget('cache:generations', 'user:user1') == b'2'
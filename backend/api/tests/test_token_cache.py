@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+from security.token_cache import TokenCache
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeVerifier:
+    def __init__(self, clock: FakeClock, lifetime: int = 3600):
+        self.clock = clock
+        self.lifetime = lifetime
+        self.calls: list[str] = []
+
+    def __call__(self, token: str) -> dict:
+        self.calls.append(token)
+        if token.startswith('bad'):
+            raise ValueError('invalid token')
+        return {'uid': token, 'exp': self.clock() + self.lifetime}
+
+
+def test_token_is_verified_once_until_it_expires():
+    clock = FakeClock()
+    verifier = FakeVerifier(clock)
+    cache = TokenCache(maxsize=10, clock=clock)
+
+    assert cache.verify('token1', verifier)['uid'] == 'token1'
+    assert cache.verify('token1', verifier)['uid'] == 'token1'
+    assert verifier.calls == ['token1']
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+    clock.now += 3600
+    cache.verify('token1', verifier)
+    assert verifier.calls == ['token1', 'token1']
+
+
+def test_invalid_tokens_are_not_cached():
+    clock = FakeClock()
+    verifier = FakeVerifier(clock)
+    cache = TokenCache(maxsize=10, clock=clock)
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            cache.verify('bad', verifier)
+    assert verifier.calls == ['bad', 'bad']
+    assert cache.stats()['size'] == 0
+
+
+def test_cache_is_bounded_and_can_be_disabled():
+    clock = FakeClock()
+    verifier = FakeVerifier(clock)
+    cache = TokenCache(maxsize=2, clock=clock)
+    for token in ['token1', 'token2', 'token3']:
+        cache.verify(token, verifier)
+    assert cache.stats()['size'] == 2
+    assert cache.stats()['evictions'] == 1
+    cache.verify('token1', verifier)
+    assert verifier.calls.count('token1') == 2
+
+    disabled = TokenCache(maxsize=2, enabled=False, clock=clock)
+    disabled.verify('token1', verifier)
+    disabled.verify('token1', verifier)
+    assert verifier.calls.count('token1') == 4
+
+
+def test_cache_is_thread_safe():
+    clock = FakeClock()
+    verifier = FakeVerifier(clock)
+    cache = TokenCache(maxsize=50, clock=clock)
+
+    def worker(offset: int) -> None:
+        for i in range(500):
+            assert cache.verify(f'token{(i + offset) % 100}', verifier)['uid'] == f'token{(i + offset) % 100}'
+
+    threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    assert stats['size'] <= 50
+    assert stats['hits'] + stats['misses'] == 8 * 500
@@ -0,0 +1,139 @@
+import json
+import threading
+import time
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+
+from security.token_verifier import FirebaseTokenVerifier, JWKSCache, TokenVerificationError
+
+
+PROJECT_ID = 'test-project'
+
+
+class JWKSServer:
+    """Serves the public halves of locally generated RSA keys as a JWKS document."""
+
+    def __init__(self):
+        self.private_keys: dict[str, rsa.RSAPrivateKey] = {}
+        self.requests: int = 0
+        jwks_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                jwks_server.requests += 1
+                keys = []
+                for kid, private_key in jwks_server.private_keys.items():
+                    jwk = json.loads(RSAAlgorithm.to_jwk(private_key.public_key()))
+                    keys.append(jwk | {'kid': kid, 'alg': 'RS256', 'use': 'sig'})
+                body = json.dumps({'keys': keys}).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Cache-Control', 'public, max-age=3600')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self._server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self._server.server_port}/jwks'
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def add_key(self, kid: str) -> rsa.RSAPrivateKey:
+        self.private_keys[kid] = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        return self.private_keys[kid]
+
+    def close(self) -> None:
+        self._server.shutdown()
+
+
+@pytest.fixture(name='jwks_server')
+def jwks_server_fixture() -> Iterator[JWKSServer]:
+    server = JWKSServer()
+    server.add_key('key1')
+    yield server
+    server.close()
+
+
+def make_token(private_key: rsa.RSAPrivateKey, kid: str = 'key1', **overrides) -> str:
+    now = int(time.time())
+    claims = {
+        'iss': f'https://securetoken.google.com/{PROJECT_ID}',
+        'aud': PROJECT_ID,
+        'sub': 'user123456',
+        'iat': now - 10,
+        'auth_time': now - 10,
+        'exp': now + 3600,
+    } | overrides
+    return jwt.encode(claims, private_key, algorithm='RS256', headers={'kid': kid})
+
+
+def test_verify_valid_token(jwks_server: JWKSServer):
+    key_cache = JWKSCache(url=jwks_server.url)
+    key_cache.refresh()
+    verifier = FirebaseTokenVerifier(project_id=PROJECT_ID, key_cache=key_cache)
+
+    claims = verifier.verify(make_token(jwks_server.private_keys['key1']))
+    assert claims['uid'] == 'user123456'
+    assert key_cache.expires_at == pytest.approx(time.time() + 3600, abs=5)
+
+    for _ in range(10):
+        verifier.verify(make_token(jwks_server.private_keys['key1']))
+    assert jwks_server.requests == 1
+
+
+@pytest.mark.parametrize('overrides', [
+    {'iss': 'https://securetoken.google.com/other-project'},
+    {'aud': 'other-project'},
+    {'exp': int(time.time()) - 3600},
+    {'iat': int(time.time()) + 3600},
+    {'sub': ''},
+])
+def test_reject_invalid_claims(jwks_server: JWKSServer, overrides: dict):
+    key_cache = JWKSCache(url=jwks_server.url)
+    key_cache.refresh()
+    verifier = FirebaseTokenVerifier(project_id=PROJECT_ID, key_cache=key_cache)
+
+    with pytest.raises(TokenVerificationError):
+        verifier.verify(make_token(jwks_server.private_keys['key1'], **overrides))
+
+
+def test_reject_bad_signature_and_unknown_key(jwks_server: JWKSServer):
+    key_cache = JWKSCache(url=jwks_server.url)
+    key_cache.refresh()
+    verifier = FirebaseTokenVerifier(project_id=PROJECT_ID, key_cache=key_cache)
+    other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    with pytest.raises(TokenVerificationError, match='Invalid signature'):
+        verifier.verify(make_token(other_key, kid='key1'))
+    with pytest.raises(TokenVerificationError, match='Unknown key ID'):
+        verifier.verify(make_token(other_key, kid='key2'))
+    with pytest.raises(TokenVerificationError, match='Malformed token'):
+        verifier.verify('not-a-token')
+
+
+def test_background_refresh_picks_up_rotated_keys(jwks_server: JWKSServer):
+    key_cache = JWKSCache(url=jwks_server.url, min_interval=0.05)
+    verifier = FirebaseTokenVerifier(project_id=PROJECT_ID, key_cache=key_cache)
+    key_cache.start()
+    try:
+        assert jwks_server.requests == 1
+        new_key = jwks_server.add_key('key2')
+        token = make_token(new_key, kid='key2')
+
+        # The unknown key ID is rejected at once, without waiting on the network,
+        # and wakes up the refresh thread.
+        with pytest.raises(TokenVerificationError, match='Unknown key ID'):
+            verifier.verify(token)
+        deadline = time.time() + 5
+        while key_cache.get_key('key2') is None and time.time() < deadline:
+            time.sleep(0.01)
+        assert verifier.verify(token)['uid'] == 'user123456'
+    finally:
+        key_cache.stop()
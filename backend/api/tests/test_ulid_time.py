@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import ulid
+
+from ulid_time import ulid_lower_bound, ulid_timestamp_ms, ulid_to_datetime
+
+
+def test_ulid_timestamp_matches_ulid_py():
+    for _ in range(100):
+        ulid_obj = ulid.new()
+        assert ulid_timestamp_ms(str(ulid_obj)) == int(ulid_obj.timestamp())
+        assert ulid_timestamp_ms(str(ulid_obj).lower()) == int(ulid_obj.timestamp())
+        assert ulid_to_datetime(str(ulid_obj)) == datetime.fromtimestamp(int(ulid_obj.timestamp()) / 1000.0)
+
+
+def test_ulid_lower_bound():
+    dt = datetime(2024, 5, 1, 10, 30, 0, 123000, tzinfo=timezone.utc)
+    bound: str = ulid_lower_bound(dt)
+    assert len(bound) == 26
+    assert ulid_timestamp_ms(bound) == int(dt.timestamp() * 1000)
+    # Every ULID of that millisecond is included, every ULID of the one before is not.
+    assert bound <= str(ulid.from_timestamp(dt))
+    assert str(ulid.from_timestamp(dt - timedelta(milliseconds=1))) < bound
+    # A time within a millisecond starts the range at the next one.
+    assert ulid_timestamp_ms(ulid_lower_bound(dt + timedelta(microseconds=1))) == ulid_timestamp_ms(bound) + 1
+
+    with pytest.raises(ValueError):
+        ulid_lower_bound(datetime(1960, 1, 1, tzinfo=timezone.utc))
@@ -0,0 +1,85 @@
+from datetime import datetime
+
+
+# Crockford's base 32, the alphabet of ULIDs. The first 10 characters of a ULID encode its 48-bit
+# UNIX time in milliseconds, most significant first, so ULIDs sort by time as strings.
+CROCKFORD_ALPHABET: str = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+_DECODE: dict[str, int] = {char: value for value, char in enumerate(CROCKFORD_ALPHABET)}
+_DECODE.update({char.lower(): value for char, value in list(_DECODE.items())})
+TIMESTAMP_LENGTH: int = 10
+RANDOMNESS_LENGTH: int = 16
+MAX_TIMESTAMP_MS: int = 2 ** 48 - 1
+
+
+def ulid_timestamp_ms(ulid_str: str) -> int:
+    """
+    Read the creation time of a ULID without parsing the whole identifier.
+
+    Only the 10 timestamp characters are decoded, with a table lookup per character, which is much
+    cheaper than building a `ulid.ULID` object when converting many IDs.
+
+    Parameters
+    ----------
+    ulid_str : str
+        The ULID, in its 26-character string form.
+
+    Returns
+    -------
+    int
+        The UNIX time of the ULID in milliseconds.
+    """
+    timestamp: int = 0
+    for char in ulid_str[:TIMESTAMP_LENGTH]:
+        timestamp = (timestamp << 5) | _DECODE[char]
+    return timestamp
+
+
+def ulid_to_datetime(ulid_str: str) -> datetime:
+    """
+    Convert the creation time of a ULID to a naive local datetime.
+
+    Parameters
+    ----------
+    ulid_str : str
+        The ULID, in its 26-character string form.
+
+    Returns
+    -------
+    datetime
+        The creation time, with millisecond precision.
+    """
+    return datetime.fromtimestamp(ulid_timestamp_ms(ulid_str) / 1000.0)
+
+
+def ulid_lower_bound(dt: datetime) -> str:
+    """
+    Return the smallest ULID that can be created at or after a given time.
+
+    `id >= ulid_lower_bound(start) AND id < ulid_lower_bound(end)` selects exactly the rows created
+    in `[start, end)`, as a range of the primary key.
+
+    Parameters
+    ----------
+    dt : datetime
+        The time. A naive datetime is taken as local time, like the dates derived from ULIDs.
+
+    Returns
+    -------
+    str
+        The timestamp of `dt`, rounded up to the millisecond, followed by the lowest randomness.
+
+    Raises
+    ------
+    ValueError
+        If `dt` is before 1970 or beyond the range of ULID timestamps.
+    """
+    # Integer microseconds, rounded up to the millisecond: a ULID of the previous millisecond is earlier than `dt`.
+    timestamp_us: int = int(dt.replace(microsecond=0).timestamp()) * 1_000_000 + dt.microsecond
+    timestamp_ms: int = -(-timestamp_us // 1000)
+    if not 0 <= timestamp_ms <= MAX_TIMESTAMP_MS:
+        raise ValueError(f'Date out of the range of order IDs: {dt.isoformat()}')
+    chars: list[str] = []
+    for _ in range(TIMESTAMP_LENGTH):
+        chars.append(CROCKFORD_ALPHABET[timestamp_ms & 31])
+        timestamp_ms >>= 5
+    return ''.join(reversed(chars)) + '0' * RANDOMNESS_LENGTH
@@ -7,14 +7,34 @@ declare type Product = {
   id: string;
 };
 
+declare type ProductList = {
+  items: Product[];
+  total: number;
+  skip: number;
+  limit: number;
+};
+
 declare type ProductsCount = {
   count: number;
+  approximate: boolean;
 };
 
 declare type CartProducts = {
   [productId: string]: number;
 };
 
+declare type CartItem = {
+  product: Product;
+  quantity: number;
+  line_total: number;
+};
+
+declare type CartDetail = {
+  items: CartItem[];
+  total_quantity: number;
+  total: number;
+};
+
 declare type User = {
   id: string;
   email: string;
@@ -22,12 +42,15 @@ declare type User = {
 
 declare type OrderItem = {
   quantity: number;
+  unit_price: number | null;
   product: Product;
 };
 
 declare type Order = {
   id: string;
   order_items: OrderItem[];
+  item_count: number | null;
+  total: number | null;
   purchase_date: string;
 };
 
@@ -35,4 +58,5 @@ declare type OrderResp = {
   id: string;
   email: string;
   orders: Order[];
+  next_cursor: string | null;
 };
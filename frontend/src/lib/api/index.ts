@@ -33,12 +33,13 @@ const get = async <T>(url: string, { params }: { params?: object } = {}): Promis
  * @param data - The data to be sent as the request body.
  * @param params - An optional object containing URL parameters.
  * @param contentType - An optional content type for the request header. Defaults to 'application/json;charset=utf-8' if not provided.
+ * @param headers - Optional additional request headers (e.g. an `Idempotency-Key`).
  * @returns - A promise that resolves to the response of the POST request.
  */
 const post = async <T>(
   url: string,
   data: object = {},
-  { params, contentType }: { params?: object; contentType?: string } = {},
+  { params, contentType, headers }: { params?: object; contentType?: string; headers?: Record<string, string> } = {},
 ): Promise<AxiosResponse<T>> => {
   const config = {
     params: params,
@@ -46,6 +47,7 @@ const post = async <T>(
     headers: {
       accept: 'application/json',
       'Content-Type': contentType ? contentType : 'application/json;charset=utf-8',
+      ...headers,
     },
   };
   const resp = await axiosInstance.post<T>(url, data, config);